@@ -9,6 +9,8 @@ from .factory import (
     create_flask_app,
     init_flask_app,
     oss,
+    cache,
+    term_index,
     gs_vision,
 )
 
@@ -47,6 +49,8 @@ def create_app():
 
 __all__ = [
     "oss",
+    "cache",
+    "term_index",
     "gs_vision",
     "flask_app",
     "app_config",
@@ -57,7 +57,7 @@ class AvatarAPI(MoeAPIView):
         if owner_type != "user" and owner_id is None:
             raise RequestDataWrongError(lazy_gettext("缺少id"))
         filename = str(ObjectId()) + ".jpg"
-        oss.upload(avatar_prefix, filename, file)
+        oss.multipart_upload(avatar_prefix, filename, file)
         # 删除旧的头像
         if avatar_owner.has_avatar():
             try:
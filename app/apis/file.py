@@ -5,11 +5,13 @@ from flask_babel import gettext
 from app.core.responses import MoePagination
 from app.core.views import MoeAPIView
 from app.decorators.auth import admin_required, token_required
+from app.decorators.etag import etag
 from app.decorators.url import fetch_model
 from app.exceptions import NoPermissionError, UploadFileNotFoundError
-from app.models.file import File, FileTargetCache
+from app.models.file import File, FileTargetCache, default_files_order
 from app.models.project import Project, ProjectPermission
 from app.models.team import TeamPermission
+from app.constants.cache import CountStrategy
 from app.constants.project import ProjectStatus
 from app.constants.file import FileNotExistReason, FileType
 from app.validators.file import (
@@ -24,8 +26,38 @@ from flask_apikit.utils import QueryParser
 
 
 class ProjectFileListAPI(MoeAPIView):
+    def check_access(self, project: Project):
+        """检查项目是否已完成、用户是否有访问权限"""
+        if project.status != ProjectStatus.WORKING:
+            raise ProjectFinishedError
+        # TODO: 当实现原图保护时，为团队用户显示有水印的图片。
+        # 禁止未加入团队的用户直接获得图片 URL 和 COVER_URL（这两个都可以直接访问原图）。
+        if not self.current_user.can(
+            project, ProjectPermission.ACCESS
+        ) and not self.current_user.can(project.team, TeamPermission.ACCESS):
+            raise NoPermissionError(gettext("您没有此项目的访问权限"))
+
+    def files_version(self, project: Project):
+        """
+        文件列表的版本
+
+        文件的增删、移动、计数会更新项目的计数或 edit_time，
+        解析、安全检测、缩略图等状态由后台任务修改，会更新项目的 files_version
+        """
+        self.check_access(project)
+        return (
+            project.edit_time,
+            project.files_version,
+            project.file_count,
+            project.folder_count,
+            project.source_count,
+            project.translated_source_count,
+            project.checked_source_count,
+        )
+
     @token_required
     @fetch_model(Project)
+    @etag(files_version)
     def get(self, project: Project):
         """
         @api {get} /v1/projects/<project_id>/files 获取项目下的文件
@@ -45,16 +77,7 @@ class ProjectFileListAPI(MoeAPIView):
 
         }
         """
-        # 检查项目是否已完成
-        if project.status != ProjectStatus.WORKING:
-            raise ProjectFinishedError
-        # 检查用户权限
-        # TODO: 当实现原图保护时，为团队用户显示有水印的图片。
-        # 禁止未加入团队的用户直接获得图片 URL 和 COVER_URL（这两个都可以直接访问原图）。
-        if not self.current_user.can(
-            project, ProjectPermission.ACCESS
-        ) and not self.current_user.can(project.team, TeamPermission.ACCESS):
-            raise NoPermissionError(gettext("您没有此项目的访问权限"))
+        # 检查项目状态和用户权限（ETag 的版本函数中已检查）
         query = self.get_query(
             {
                 "order_by": [],
@@ -73,15 +96,25 @@ class ProjectFileListAPI(MoeAPIView):
         if query["only_file"]:
             other_query = {**other_query, "type_exclude": FileType.FOLDER}
         # 进行搜索
-        p = MoePagination()
+        p = MoePagination(cursor_keys=default_files_order)
+        if p.cursor_mode and query["order_by"]:
+            raise ValidateError("can not use `cursor` with `order_by`")
         files = project.files(
             skip=p.skip,
-            limit=p.limit,
+            limit=p.query_limit,
             parent=query["parent_id"],
             order_by=query["order_by"],
             word=query["word"],
+            cursor=p.cursor,
             **other_query,
         )
+        # 项目文件数变化或有移动、重命名时重新计数
+        count = p.count_objects(
+            files,
+            CountStrategy.CACHED,
+            version=(project.edit_time, project.file_count, project.folder_count),
+        )
+        files = p.cut(files)
         data = [file.to_api() for file in files]
         if query["target"]:
             target = project.target_by_id(query["target"])
@@ -93,7 +126,7 @@ class ProjectFileListAPI(MoeAPIView):
             }
             for item in data:
                 item["file_target_cache"] = file_target_caches_map[item["id"]]
-        return p.set_data(data=data, count=files.count())
+        return p.set_data(data=data, count=count)
 
     @token_required
     @fetch_model(Project)
@@ -308,6 +341,9 @@ class AdminFileListSafeCheckAPI(MoeAPIView):
         data = self.get_json()
         safe_file_ids = data.get("safe_files", [])
         unsafe_file_ids = data.get("unsafe_files", [])
+        File.bump_projects_files_version(
+            File.objects(id__in=[*safe_file_ids, *unsafe_file_ids])
+        )
         File.objects(id__in=safe_file_ids).update(safe_status=FileSafeStatus.SAFE)
         unsafe_files = File.objects(id__in=unsafe_file_ids)
         unsafe_files.update(safe_status=FileSafeStatus.BLOCK)
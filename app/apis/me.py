@@ -4,6 +4,7 @@
 
 from flask import request
 
+from app.constants.cache import CountStrategy
 from app.core.responses import MoePagination
 from app.core.views import MoeAPIView
 from app.decorators.auth import token_required
@@ -23,7 +24,7 @@ from app.validators.join_process import (
 from flask_apikit.utils import QueryParser
 from flask_babel import gettext
 from app.validators.project import SearchUserProjectSchema
-from app.models.project import Project
+from app.models.project import Project, default_projects_order
 from app.models.application import Application
 
 
@@ -330,7 +331,7 @@ class MeTeamListAPI(MoeAPIView):
             else:
                 team_data["role"] = None
             data.append(team_data)
-        return p.set_data(data, count=teams.count())
+        return p.set_data(data, count=p.count_objects(teams))
 
 
 class MeProjectListAPI(MoeAPIView):
@@ -362,13 +363,15 @@ class MeProjectListAPI(MoeAPIView):
             {"status": [QueryParser.int]},
             SearchUserProjectSchema(),
         )
-        p = MoePagination()
+        p = MoePagination(cursor_keys=default_projects_order)
         projects = self.current_user.projects(
             status=query["status"],
             word=query["word"],
             skip=p.skip,
-            limit=p.limit,
+            limit=p.query_limit,
+            cursor=p.cursor,
         )
-        data = Project.batch_to_api(projects, self.current_user)
-        p.set_data(data, count=projects.count())
+        count = p.count_objects(projects, CountStrategy.CACHED)
+        data = Project.batch_to_api(p.cut(projects), self.current_user)
+        p.set_data(data, count=count)
         return p
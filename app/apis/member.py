@@ -1,6 +1,7 @@
 from typing import Union
 from flask import request
 
+from app.constants.cache import CountStrategy
 from app.core.responses import MoePagination
 from app.core.views import MoeAPIView
 from app.decorators.auth import token_required
@@ -57,7 +58,13 @@ class MemberListAPI(MoeAPIView):
             else:
                 user_data["role"] = None
             data.append(user_data)
-        return p.set_data(data=data, count=users.count())
+        if word:
+            count = p.count_objects(users)
+        else:
+            count = p.count_objects(
+                users, CountStrategy.DENORMALIZED, value=group.user_count
+            )
+        return p.set_data(data=data, count=count)
 
 
 class MemberAPI(MoeAPIView):
@@ -377,6 +377,7 @@ class ProjectOCRAPI(MoeAPIView):
         if project.team.ocr_quota_left < images.count():
             raise NoPermissionError(gettext("团队限额不足"))
         images.update(parse_status=ParseStatus.QUEUING)
+        project.bump_files_version()
         ocr("project", str(project.id))
         return {"message": gettext("已开始自动标记")}
 
@@ -1,7 +1,9 @@
 import datetime
 from flask_babel import gettext
 from app.core.views import MoeAPIView
+from app.core.counter_buffer import buffered_counters
 from app.decorators.auth import token_required
+from app.decorators.etag import etag
 from app.decorators.url import fetch_model
 from app.exceptions import FileTypeNotSupportError, NoPermissionError
 from app.models.file import File, Source
@@ -19,8 +21,15 @@ from flask_apikit.utils import QueryParser
 
 
 class FileSourceListAPI(MoeAPIView):
+    def sources_version(self, file: File):
+        """原文列表的版本，翻译、原文的修改都会更新 edit_time 或 translator_version"""
+        if not self.current_user.can(file.project, ProjectPermission.ACCESS):
+            raise NoPermissionError
+        return file.edit_time, file.translator_version
+
     @token_required
     @fetch_model(File)
+    @etag(sources_version)
     def get(self, file: File):
         """
         @api {get} /v1/files/<file_id>/sources 获取某个文件的原文
@@ -51,6 +60,7 @@ class FileSourceListAPI(MoeAPIView):
 
     @token_required
     @fetch_model(File)
+    @buffered_counters
     def patch(self, file: File):
         """
         @api {patch} /v1/files/<file_id>/sources 批量选中翻译
@@ -144,6 +154,7 @@ class SourceAPI(MoeAPIView):
         data = self.get_json(EditImageSourceSchema())
         source.update(**data)
         source.update_cache("edit_time", datetime.datetime.utcnow())
+        source.file.bump_translator_version()
         source.reload()
         return source.to_api()
 
@@ -14,8 +14,9 @@ from app.core.views import MoeAPIView
 from app.decorators.auth import token_required
 from app.decorators.url import fetch_model
 from app.exceptions import NoPermissionError, RequestDataEmptyError
-from app.models.project import Project
+from app.models.project import Project, default_projects_order
 from app.models.team import Team, TeamPermission
+from app.constants.cache import CountStrategy
 from app.constants.project import ProjectStatus
 from app.tasks.output_team_projects import output_team_projects
 from app.validators.project import (
@@ -258,18 +259,20 @@ class TeamProjectListAPI(MoeAPIView):
             SearchTeamProjectSchema(),
             context={"team": team},
         )
-        p = MoePagination()
+        p = MoePagination(cursor_keys=default_projects_order)
         projects = team.projects(
             project_set=query["project_set"],
             status=query["status"],
             word=query["word"],
             skip=p.skip,
-            limit=p.limit,
+            limit=p.query_limit,
+            cursor=p.cursor,
         )
+        count = p.count_objects(projects, CountStrategy.CACHED)
         data = Project.batch_to_api(
-            projects, self.current_user, inherit_admin_team=team
+            p.cut(projects), self.current_user, inherit_admin_team=team
         )
-        p.set_data(data, count=projects.count())
+        p.set_data(data, count=count)
         return p
 
     @token_required
@@ -486,7 +489,13 @@ class TeamInsightUserListAPI(MoeAPIView):
         for user in users:
             user_projects_data = get_insight_user_projects_data(user, team_projects)
             data.append({**user_projects_data, "user": user.to_api()})
-        return p.set_data(data=data, count=users.count())
+        if query["word"]:
+            count = p.count_objects(users)
+        else:
+            count = p.count_objects(
+                users, CountStrategy.DENORMALIZED, value=team.user_count
+            )
+        return p.set_data(data=data, count=count)
 
 
 class TeamInsightUserProjectListAPI(MoeAPIView):
@@ -544,7 +553,7 @@ class TeamInsightProjectListAPI(MoeAPIView):
                     output.to_api() for output in project.outputs()
                 ]
             data.append(project_data)
-        return p.set_data(data=data, count=projects.count())
+        return p.set_data(data=data, count=p.count_objects(projects))
 
 
 class TeamInsightProjectUserListAPI(MoeAPIView):
@@ -99,6 +99,7 @@ class TranslationAPI(MoeAPIView):
                 translation.proofreader = self.current_user
             translation.update_cache("edit_time", datetime.datetime.utcnow())
         translation.save()
+        translation.source.file.bump_translator_version()
         return translation.to_api()
 
     @token_required
@@ -47,6 +47,10 @@ RESET_PASSWORD_WAIT_SECONDS = 60  # 重置密码邮件发送等待时间
 PLAN_FINISH_DELTA = 7 * 24 * 60 * 60  # 计划完结延时时间
 PLAN_DELETE_DELTA = 7 * 24 * 60 * 60  # 计划删除延时时间
 OUTPUT_WAIT_SECONDS = 60 * 5  # 导出等待时间
+# 导出全部内容时并行下载图片的线程数
+OUTPUT_DOWNLOAD_WORKERS = int(env.get("OUTPUT_DOWNLOAD_WORKERS", 8))
+# 翻译器原文列表的查询方式：query（多次查询，默认）或 pipeline（单个 $lookup 聚合管道）
+TRANSLATOR_QUERY_MODE = env.get("TRANSLATOR_QUERY_MODE", "query")
 BUILD_ID = env.get("MOEFLOW_BUILD_ID", "unset")
 # -----------
 # 默认设置
@@ -56,7 +60,7 @@ DEFAULT_TEAM_AVATAR = None
 # -----------
 # Storage 配置
 # -----------
-# 目前支持 LOCAL_STORAGE 和 OSS
+# 目前支持 LOCAL_STORAGE、OSS 和 S3（S3 兼容的对象储存，如 MinIO，需安装 boto3）
 STORAGE_TYPE = env["STORAGE_TYPE"]
 # 未设置自定义域名则填写阿里云提供的 OSS 域名，格式如：https://<your-bucket-name>.<oss-region>.aliyuncs.com/
 # 如果绑定了 CDN 来加速 OSS，则填写绑定在 CDN 的域名
@@ -75,6 +79,40 @@ OSS_VIA_CDN = True if env.get("OSS_VIA_CDN", "") == "True" else False
 # CDN URL 鉴权主/备 KEY
 CDN_URL_KEY_A = env.get("CDN_URL_KEY_A", "")
 CDN_URL_KEY_B = env.get("CDN_URL_KEY_B", "")  # 备 KEY 暂未用到
+# S3 兼容的对象储存，返回给客户端的是预签名 URL，所以 S3_ENDPOINT_URL 需要客户端也能访问
+S3_ENDPOINT_URL = env.get("S3_ENDPOINT_URL", "")  # 如 https://minio.example.com
+S3_REGION = env.get("S3_REGION", "")
+S3_ACCESS_KEY_ID = env.get("S3_ACCESS_KEY_ID", "")
+S3_SECRET_ACCESS_KEY = env.get("S3_SECRET_ACCESS_KEY", "")
+S3_BUCKET_NAME = env.get("S3_BUCKET_NAME", "")
+# MinIO 等通常需要 path（https://<endpoint>/<bucket>/<key>）
+S3_ADDRESSING_STYLE = env.get("S3_ADDRESSING_STYLE", "path")
+# 分片上传：超过阈值的文件分片上传（OSS 支持断点续传），本地储存按分片大小分块复制
+STORAGE_MULTIPART_THRESHOLD = (
+    int(env.get("STORAGE_MULTIPART_THRESHOLD_MB", 10)) * 1024 * 1024
+)
+STORAGE_PART_SIZE = int(env.get("STORAGE_PART_SIZE_MB", 10)) * 1024 * 1024
+# OSS 断点续传时并行上传分片的线程数
+STORAGE_UPLOAD_THREADS = int(env.get("STORAGE_UPLOAD_THREADS", 4))
+# 对象储存（OSS、S3）的 HTTP 连接池大小，应不小于导出时并行下载和上传的线程数
+STORAGE_POOL_SIZE = int(env.get("STORAGE_POOL_SIZE", 16))
+# 进程内缓存的签发 URL 数量（按过期时间窗口缓存），为 0 时不缓存
+STORAGE_SIGN_URL_CACHE_SIZE = int(env.get("STORAGE_SIGN_URL_CACHE_SIZE", 10000))
+# -----------
+# 缓存
+# -----------
+# 目前支持 none（不缓存）、memory（进程内 LRU）、redis 和 disk（本机多进程共享）
+CACHE_TYPE = env.get("CACHE_TYPE", "none")
+CACHE_REDIS_URL = env.get("CACHE_REDIS_URL", "redis://localhost:6379/0")
+CACHE_DISK_DIR = env.get("CACHE_DISK_DIR", "/tmp/moeflow-cache")
+CACHE_MEMORY_MAX_SIZE = int(env.get("CACHE_MEMORY_MAX_SIZE", 1024))  # 进程内最大条目数
+CACHE_DEFAULT_TTL = int(env.get("CACHE_DEFAULT_TTL", 60 * 60))  # 缓存过期时间（秒）
+# 列表总数使用 cached 策略时，没有版本号的总数缓存时间（秒）
+COUNT_CACHE_TTL = int(env.get("COUNT_CACHE_TTL", 30))
+# 每个进程内最多缓存的术语库匹配器数量，另外会写入上面的缓存，供其他进程复用
+TERM_INDEX_MEMORY_MAX_SIZE = int(env.get("TERM_INDEX_MEMORY_MAX_SIZE", 64))
+# 新增/修改术语时只用此术语增量更新原文的可能术语，关闭则提示项目重新寻找所有术语
+TERM_INCREMENTAL_MATCH = env.get("TERM_INCREMENTAL_MATCH", "True") == "True"
 # -----------
 # 内容安全
 # -----------
@@ -87,6 +125,7 @@ OSS_FILE_PREFIX = "files/"
 OSS_OUTPUT_PREFIX = "outputs/"
 OSS_USER_AVATAR_PREFIX = "user-avatars/"
 OSS_TEAM_AVATAR_PREFIX = "team-avatars/"
+OSS_IMPORT_PREFIX = "imports/"  # 等待导入的 LabelPlus 文本
 # -----------
 # 谷歌接口
 # -----------
@@ -0,0 +1,16 @@
+from app.constants.base import StrType
+
+
+class CacheType(StrType):
+    NONE = "none"  # 不缓存
+    MEMORY = "memory"  # 进程内 LRU
+    REDIS = "redis"
+    DISK = "disk"  # 本机多进程共享
+
+
+class CountStrategy(StrType):
+    """分页列表总数的获取方式"""
+
+    EXACT = "exact"  # 使用 count_documents 精确计数
+    DENORMALIZED = "denormalized"  # 使用已有的计数缓存字段（如 Project.file_count）
+    CACHED = "cached"  # 精确计数后缓存，通过版本号或较短的过期时间失效
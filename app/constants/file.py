@@ -1,5 +1,5 @@
 from flask_babel import lazy_gettext
-from app.constants.base import IntType
+from app.constants.base import IntType, StrType
 
 
 class FileType(IntType):
@@ -124,7 +124,22 @@ class ImageOCRPercent(IntType):
     }
 
 
+class ThumbnailStatus(IntType):
+    """缩略图状态，仅不支持图片处理的储存（本地储存、S3）需要生成缩略图"""
+
+    GENERATING = 0  # 生成中
+    SUCCEEDED = 1  # 已生成
+    FAILED = 2  # 生成失败
+
+
 class FindTermsStatus:
     QUEUING = 0  # 排队中
     FINDING = 1  # 寻找中
     FINISHED = 2  # 解析成功
+
+
+class TranslatorQueryMode(StrType):
+    """File.to_translator 的查询方式"""
+
+    QUERY = "query"  # 分别查询原文、翻译、备注等
+    PIPELINE = "pipeline"  # 使用 $lookup 的单个聚合管道
@@ -27,4 +27,6 @@ class OutputTypes(IntType):
     """项目导出类型"""
 
     ALL = 0  # 所有内容
-    ONLY_TEXT = 1  # 仅文本
+    ONLY_TEXT = 1  # 仅文本（LabelPlus）
+    ONLY_JSON = 2  # 仅 JSON
+    ONLY_CSV = 3  # 仅 CSV
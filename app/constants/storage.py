@@ -4,3 +4,4 @@ from app.constants.base import StrType
 class StorageType(StrType):
     OSS = "OSS"
     LOCAL_STORAGE = "LOCAL_STORAGE"
+    S3 = "S3"  # S3 兼容的对象储存，如 MinIO
@@ -0,0 +1,163 @@
+"""
+计数缓存写缓冲
+
+File/Project 的 inc_cache、update_cache 每次调用都会向所有祖先文件夹、项目、目标语言
+分别发出 update 请求。在批量操作（如解析文本、批量选定翻译）时，可以使用
+counter_buffer 将这些修改按 (集合, 文档) 合并，在结束时通过每个集合一次的 bulk_write
+统一写入：
+
+    with counter_buffer():
+        for line in lines:
+            file.create_source(line)
+
+计数使用 $inc，修改时间使用 $max，均与写入顺序无关，所以并发请求同时写入时结果仍然正确。
+缓冲期间数据库中的计数不会改变，不要在其中读取计数缓存字段。
+"""
+
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Optional
+
+from pymongo import UpdateOne
+
+_current_buffer: ContextVar[Optional["CounterBuffer"]] = ContextVar(
+    "counter_buffer", default=None
+)
+
+
+class CounterBuffer:
+    """按 (文档类, 文档标识) 累积 $inc 和 $max 修改"""
+
+    def __init__(self):
+        # {document: {identity: {"$inc": {field: step}, "$max": {field: value}}}}
+        self._updates = defaultdict(
+            lambda: defaultdict(lambda: {"$inc": defaultdict(int), "$max": {}})
+        )
+
+    def inc(self, document: type, identity: dict, field: str, step):
+        """
+        累积计数
+
+        :param document: 文档类
+        :param identity: 唯一确定一个文档的查询条件（MongoEngine 格式），如 {"id": id}
+        :param field: 字段名
+        :param step: 增加的数量
+        """
+        if step == 0:
+            return
+        self._get(document, identity)["$inc"][field] += step
+
+    def max(self, document: type, identity: dict, field: str, value):
+        """累积最大值（用于修改时间）"""
+        update = self._get(document, identity)["$max"]
+        if field not in update or update[field] < value:
+            update[field] = value
+
+    def _get(self, document, identity):
+        return self._updates[document][tuple(sorted(identity.items()))]
+
+    def __len__(self):
+        return sum(len(updates) for updates in self._updates.values())
+
+    def flush(self):
+        """每个集合使用一次 bulk_write 写入所有修改"""
+        updates, self._updates = self._updates, CounterBuffer()._updates
+        for document, identities in updates.items():
+            operations = []
+            for identity, update in identities.items():
+                raw_update = {}
+                for operator, fields in update.items():
+                    raw_fields = {
+                        document._fields[field].db_field: value
+                        for field, value in fields.items()
+                        if not (operator == "$inc" and value == 0)
+                    }
+                    if raw_fields:
+                        raw_update[operator] = raw_fields
+                if not raw_update:
+                    continue
+                raw_filter = document.objects(**dict(identity))._query
+                operations.append(UpdateOne(raw_filter, raw_update))
+            if operations:
+                document._get_collection().bulk_write(operations, ordered=False)
+
+
+@contextmanager
+def counter_buffer():
+    """
+    开启计数缓存写缓冲，结束（包括异常退出）时写入数据库
+
+    嵌套使用时由最外层统一写入
+    """
+    if _current_buffer.get() is not None:
+        yield _current_buffer.get()
+        return
+    buffer = CounterBuffer()
+    token = _current_buffer.set(buffer)
+    try:
+        yield buffer
+    finally:
+        _current_buffer.reset(token)
+        buffer.flush()
+
+
+def buffered_counters(func):
+    """在 counter_buffer 中执行，用于视图函数和任务"""
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with counter_buffer():
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def inc_counter(document: type, identities: list[dict], field: str, step):
+    """
+    增加多个文档的计数，开启缓冲时合并写入，否则直接 update
+
+    :param identities: 每个文档的查询条件，如 [{"id": id1}, {"id": id2}]
+    """
+    if step == 0 or not identities:
+        return
+    buffer = _current_buffer.get()
+    if buffer is None:
+        _update_now(document, identities, {"inc__" + field: step})
+        return
+    for identity in identities:
+        buffer.inc(document, identity, field, step)
+
+
+def max_field(document: type, identities: list[dict], field: str, value):
+    """将多个文档的字段更新为较大的值（用于修改时间），开启缓冲时合并写入"""
+    if not identities:
+        return
+    buffer = _current_buffer.get()
+    if buffer is None:
+        _update_now(document, identities, {"max__" + field: value})
+        return
+    for identity in identities:
+        buffer.max(document, identity, field, value)
+
+
+def _update_now(document, identities, update):
+    """直接写入，只有一个条件不同时合并为一次 update（如 id__in）"""
+    varying = {
+        key
+        for key in identities[0]
+        if any(identity.get(key) != identities[0][key] for identity in identities)
+    }
+    if len(varying) <= 1 and all(
+        identity.keys() == identities[0].keys() for identity in identities
+    ):
+        query = dict(identities[0])
+        if varying:
+            key = varying.pop()
+            del query[key]
+            query[key + "__in"] = [identity[key] for identity in identities]
+        document.objects(**query).update(**update)
+        return
+    for identity in identities:
+        document.objects(**identity).update(**update)
@@ -1,7 +1,138 @@
+import hashlib
+from typing import Callable, List, Optional
+
+from flask import current_app, request
+from flask_apikit.exceptions import ValidateError
 from flask_apikit.responses import Pagination
+from flask_apikit.utils import QueryParser
+from bson import json_util
+
+from app import cache
+from app.constants.cache import CountStrategy
+from app.utils.mongo import (
+    count_documents,
+    decode_cursor,
+    encode_cursor,
+    keyset_values,
+)
+
+NEXT_CURSOR_HEADER = "X-Pagination-Next-Cursor"
 
 
 class MoePagination(Pagination):
+    """
+    分页响应，支持页码分页和游标分页
+
+    请求中带有 cursor 参数（第一页为空字符串）时使用游标分页：
+    使用上一页返回的 X-Pagination-Next-Cursor 请求下一页，为空则没有下一页；
+    总数默认不计算，需要时传递 count=true。否则与原来的 page/limit 分页相同
+
+    :param cursor_keys: 游标分页使用的排序键，如 ["-edit_time", "id"]，
+        最后一个键需能唯一确定文档。为 None 则不支持游标分页
+    """
+
+    def __init__(self, *args, cursor_keys: Optional[List[str]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursor_keys = cursor_keys
+        self.cursor: Optional[list] = None
+        self.next_cursor: Optional[str] = None
+        cursor = request.args.get("cursor")
+        if cursor_keys is not None and cursor is not None:
+            try:
+                self.cursor = decode_cursor(cursor) if cursor else []
+            except ValueError:
+                raise ValidateError("invalid `cursor`")
+            if self.cursor and len(self.cursor) != len(cursor_keys):
+                raise ValidateError("invalid `cursor`")
+            self.skip = 0
+            self.headers["Access-Control-Expose-Headers"] += (
+                ", " + NEXT_CURSOR_HEADER.upper()
+            )
+
+    @property
+    def cursor_mode(self) -> bool:
+        """是否是游标分页"""
+        return self.cursor is not None
+
+    @property
+    def query_limit(self) -> int:
+        """查询数量，游标分页时多查一条用于判断是否有下一页"""
+        return self.limit + 1 if self.cursor_mode else self.limit
+
+    @property
+    def need_count(self) -> bool:
+        """是否需要计算总数，游标分页时由 count 参数决定"""
+        if not self.cursor_mode:
+            return True
+        return QueryParser.bool(request.args.get("count", "false"))
+
+    def cut(self, objects, values: Callable = None) -> list:
+        """
+        游标分页时截掉多查询的一条，并以最后一条生成下一页的游标
+
+        :param objects: 按 cursor_keys 排序，查询了 query_limit 条的结果
+        :param values: 从对象中取出排序键值的函数，默认使用同名属性
+        """
+        objects = list(objects)
+        if not self.cursor_mode or len(objects) <= self.limit:
+            return objects
+        objects = objects[: self.limit]
+        if values is None:
+            cursor_values = keyset_values(objects[-1], self.cursor_keys)
+        else:
+            cursor_values = values(objects[-1])
+        self.next_cursor = encode_cursor(cursor_values)
+        return objects
+
+    def count_objects(
+        self,
+        objects,
+        strategy: str = CountStrategy.EXACT,
+        /,
+        *,
+        value: Optional[int] = None,
+        version=None,
+    ) -> Optional[int]:
+        """
+        按策略获取列表总数，游标分页且不需要总数时返回 None
+
+        :param objects: MongoEngine 的 Query
+        :param strategy: 计数策略，见 CountStrategy
+        :param value: DENORMALIZED 策略使用的计数缓存字段值
+        :param version: CACHED 策略的版本，会加入缓存 key，版本变化则重新计数；
+            为 None 则在 COUNT_CACHE_TTL 秒后过期
+        """
+        if not self.need_count:
+            return None
+        if strategy == CountStrategy.DENORMALIZED:
+            return value
+        if strategy == CountStrategy.CACHED:
+            query = json_util.dumps(objects._query, sort_keys=True)
+            key = "count:{}:{}:{}".format(
+                objects._document._get_collection_name(),
+                hashlib.md5(query.encode("utf-8")).hexdigest(),
+                repr(version),
+            )
+            count = cache.get(key)
+            if count is None:
+                count = count_documents(objects)
+                ttl = current_app.config["COUNT_CACHE_TTL"] if version is None else None
+                cache.set(key, count, ttl=ttl)
+            return count
+        return count_documents(objects)
+
+    def set_data(self, data, count: Optional[int] = None):
+        if not self.cursor_mode:
+            return super().set_data(data, count)
+        self.data = data
+        self.count = count
+        self.headers[NEXT_CURSOR_HEADER] = self.next_cursor or ""
+        config = current_app.config
+        self.headers[config["APIKIT_PAGINATION_HEADER_LIMIT_KEY"]] = self.limit
+        if count is not None:
+            self.headers[config["APIKIT_PAGINATION_HEADER_COUNT_KEY"]] = count
+        return self
+
     def set_objects(
         self, objects, /, *, func: str = "to_api", func_kwargs: dict = None
     ) -> "MoePagination":
@@ -9,4 +140,4 @@ class MoePagination(Pagination):
         if func_kwargs is None:
             func_kwargs = {}
         data = [getattr(o, func)(**func_kwargs) for o in objects]
-        return self.set_data(data=data, count=objects.count())
+        return self.set_data(data=data, count=self.count_objects(objects))
@@ -0,0 +1,71 @@
+import hashlib
+import time
+from functools import wraps
+from typing import Callable, Optional
+
+from flask import g, request
+from flask_apikit.responses import APIResponse
+
+from app.translations import get_locale
+
+# 签名 URL 的有效期窗口（秒），窗口变化时 ETag 随之变化，避免客户端缓存过期的 URL
+ETAG_URL_WINDOW = 7 * 24 * 60 * 60
+
+
+def make_etag(version) -> str:
+    """
+    根据资源版本和请求信息生成 ETag
+
+    :param version: 资源版本，通常是 edit_time 和计数等组成的元组
+    :return: 不含引号的 ETag
+    """
+    current_user = g.get("current_user")
+    parts = [
+        repr(version),
+        request.full_path,
+        str(current_user.id) if current_user else "",
+        str(get_locale()),
+        str(int(time.time()) // ETAG_URL_WINDOW),
+    ]
+    return hashlib.md5("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def etag(get_version: Callable[..., Optional[object]]):
+    """
+    条件 GET，资源未变化时直接返回 304，不执行视图函数
+
+    需放在 token_required、fetch_model 之后（下方），用法：
+
+        @token_required
+        @fetch_model(File)
+        @etag(sources_version)
+        def get(self, file): ...
+
+    :param get_version: 接收与视图函数相同的参数，返回资源版本；
+        返回 None 表示此次请求不使用 ETag。需要在其中检查权限，防止无权限用户通过 304 获取信息
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            version = get_version(*args, **kwargs)
+            if version is None:
+                return func(*args, **kwargs)
+            tag = make_etag(version)
+            headers = {"ETag": f'"{tag}"'}
+            if request.if_none_match.contains(tag):
+                return "", 304, headers
+            result = func(*args, **kwargs)
+            if isinstance(result, APIResponse):
+                result.headers = {**(result.headers or {}), **headers}
+                # 分页响应已设置 Expose-Headers，需加入 ETag 供跨域读取
+                expose = result.headers.get("Access-Control-Expose-Headers")
+                if expose:
+                    result.headers["Access-Control-Expose-Headers"] = expose + ", ETAG"
+            elif isinstance(result, (dict, list)):
+                result = APIResponse(result, headers=headers)
+            return result
+
+        return wrapper
+
+    return decorator
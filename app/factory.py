@@ -7,6 +7,8 @@ from app.core.rbac import AllowApplyType, ApplicationCheckType
 from app.services.google_storage import GoogleStorage
 import app.config as _app_config
 from app.services.oss import OSS
+from app.services.cache import Cache
+from app.services.term_index import TermIndex
 from .apis import register_apis
 import app.translations as app_translations
 
@@ -18,6 +20,8 @@ logger = logging.getLogger(__name__)
 babel = Babel()
 apikit = APIKit()
 oss = OSS()
+cache = Cache()
+term_index = TermIndex()
 gs_vision = GoogleStorage()
 
 app_config = {
@@ -56,6 +60,8 @@ def init_flask_app(app: Flask):
             + str([str(i) for i in babel.list_translations()])
         )
     oss.init(app.config)  # 文件储存
+    cache.init(app.config)  # 缓存
+    term_index.init(app.config, shared=cache)  # 术语库匹配器缓存
 
 
 def create_celery(app: Flask) -> celery.Celery:
@@ -1,3 +1,5 @@
+import io
+from collections import defaultdict
 from io import BufferedReader
 from typing import TYPE_CHECKING, List, NoReturn, Optional, Union, BinaryIO
 import datetime
@@ -23,8 +25,7 @@ from mongoengine import (
     StringField,
 )
 
-from app import oss
-from app.constants.storage import StorageType
+from app import cache, oss
 from app.core.responses import MoePagination
 from app.decorators.file import need_activated, only, only_file
 from app.exceptions import (
@@ -63,18 +64,32 @@ from app.constants.file import (
     ImageParseStatus,
     ParseErrorType,
     ParseStatus,
+    ThumbnailStatus,
+    TranslatorQueryMode,
 )
 from app.tasks.thumbnail import create_thumbnail
 from app.utils import default
 from app.utils.file import get_file_size
 from app.utils.hash import get_file_md5
-from app.utils.mongo import mongo_order, mongo_slice
+from app.core.counter_buffer import buffered_counters, inc_counter, max_field
+from app.utils.labelplus import dump_labelplus_file
+from app.utils.mongo import (
+    keyset_values,
+    mongo_keyset,
+    mongo_order,
+    mongo_slice,
+    mongo_sort,
+)
+from app.utils.term_matcher import TermMatcher, TermMatcherChain
 from app.utils.type import is_number
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
 default_translations_order = ["-selected", "-proofread_content", "-edit_time"]
+# 以下排序同时用作游标分页的键，最后一个键需能唯一确定文档
+default_sources_order = ["rank", "id"]
+default_files_order = ["dir_sort_name", "type", "sort_name", "id"]
 
 
 class Filename:
@@ -225,6 +240,12 @@ class File(Document):
     parse_start_time = DateTimeField(db_field="pst")  # ocr/解析开始时间
     parse_error_type = IntField(db_field="pe")  # 错误详情
     image_ocr_percent = IntField(db_field="op", default=0)  # OCR 进度
+    parse_percent = IntField(db_field="pp", default=0)  # 文本解析进度（0-100）
+
+    # == 缩略图 ==
+    # 由 create_thumbnail_task 记录，列表中不用逐个检查缩略图文件；
+    # 为 None 时是记录状态之前上传的图片，需检查文件是否存在
+    thumbnail_status = IntField(db_field="th")
 
     # == 寻找术语 ==
     find_terms_status = IntField(
@@ -238,6 +259,22 @@ class File(Document):
     # == 锁 ==
     source_moving = BooleanField(db_field="sm", default=False)  # 原文的rank是否正在修改
 
+    # == 翻译器缓存 ==
+    # 原文、翻译、备注修改后自增，使 to_translator 的缓存失效
+    translator_version = IntField(db_field="tv", default=0)
+
+    # 文件列表中显示的状态字段，通过 update 修改时增加项目的 files_version
+    list_status_fields = {
+        "save_name",
+        "file_not_exist_reason",
+        "safe_status",
+        "parse_status",
+        "parse_error_type",
+        "parse_percent",
+        "image_ocr_percent",
+        "thumbnail_status",
+    }
+
     meta = {
         "indexes": [
             ("activated", "name", "parent", "project"),
@@ -268,6 +305,43 @@ class File(Document):
             raise FileNotExistError
         return file
 
+    @classmethod
+    def term_files(cls, projects):
+        """
+        需要寻找可能术语的文件：激活的文本文件，不含图片的标签和未激活的修订版
+
+        全量寻找（find_project_terms_task）和增量更新（Term.rematch）共用此范围
+
+        :param projects: Project 或 Project 的 id 列表
+        """
+        if not isinstance(projects, (list, tuple)):
+            projects = [projects]
+        return cls.objects(project__in=projects, type=FileType.TEXT, activated=True)
+
+    def update(self, **kwargs):
+        """修改文件列表中显示的状态时，同时使文件列表的 ETag 失效"""
+        result = super().update(**kwargs)
+        # 参数可能带有 set__/unset__ 等操作符前缀
+        if any(key.split("__")[-1] in self.list_status_fields for key in kwargs):
+            from app.models.project import Project
+
+            # 直接使用引用的 id，避免在解析、OCR 进度等频繁更新时读取项目
+            Project.objects(id=self._data["project"].id).update_one(
+                inc__files_version=1
+            )
+        return result
+
+    @staticmethod
+    def bump_projects_files_version(files):
+        """
+        批量修改文件列表中显示的状态前调用，增加这些文件所属项目的 files_version
+
+        :param files: File 的 QuerySet，需在修改前调用，否则筛选条件可能已不再匹配
+        """
+        from app.models.project import Project
+
+        Project.objects(id__in=files.distinct("project")).update(inc__files_version=1)
+
     @property
     def revisions(self) -> List["File"]:
         """获得同名的所有修订版，包括本修订版"""
@@ -409,6 +483,8 @@ class File(Document):
                     dir_sort_name + file.dir_sort_name[len(old_dir_sort_name) :]
                 )
                 file.save()
+        # 文件列表有变化，更新项目修改时间（用于文件列表的 ETag）
+        self.project.update_cache("edit_time", datetime.datetime.utcnow())
 
     @need_activated
     def move_to(self, parent: Union[str, ObjectId, "File", None]):
@@ -516,6 +592,7 @@ class File(Document):
                     update_project=False,
                     target=target,
                 )
+        self.project.update_cache("edit_time", datetime.datetime.utcnow())
 
     def create_target_cache(self, target):
         # 已有缓存则不创建
@@ -533,29 +610,32 @@ class File(Document):
         update_project: bool = True,
         target: Target = None,
     ):
-        """增加某个字段的计数缓存，并且向上级文件夹映射"""
+        """
+        增加某个字段的计数缓存，并且向上级文件夹映射
+
+        在 counter_buffer 中调用时，修改会合并后统一写入
+        """
         # 0则不请求数据库
         if step == 0:
             return
+        # 更新自身/父级缓存
+        if update_self:
+            file_ids = [*self.ancestor_ids, self.id]
+        else:
+            file_ids = list(self.ancestor_ids)
         # 翻译缓存
         if cache_name in ["translated_source_count", "checked_source_count"]:
             if target is None:
                 raise ValueError("更新翻译缓存数据必须指定target")
-            # 更新自身/父级缓存
-            if update_self:
-                FileTargetCache.objects(
-                    file__in=[*self.ancestor_ids, self.id], target=target
-                ).update(**{"inc__" + cache_name: step})
-                File.objects(id__in=[*self.ancestor_ids, self.id]).update(
-                    **{"inc__" + cache_name: step}
-                )
-            else:
-                FileTargetCache.objects(
-                    file__in=self.ancestor_ids, target=target
-                ).update(**{"inc__" + cache_name: step})
-                File.objects(id__in=self.ancestor_ids).update(
-                    **{"inc__" + cache_name: step}
-                )
+            inc_counter(
+                FileTargetCache,
+                [{"file": file_id, "target": target.id} for file_id in file_ids],
+                cache_name,
+                step,
+            )
+            inc_counter(
+                File, [{"id": file_id} for file_id in file_ids], cache_name, step
+            )
             if update_project:
                 self.project.inc_cache(cache_name, step, target=target)
         # 其他缓存
@@ -563,32 +643,30 @@ class File(Document):
             # 没有此属性跳过
             if not hasattr(self, cache_name):
                 return
-            # 更新自身/父级缓存
-            if update_self:
-                File.objects(id__in=[*self.ancestor_ids, self.id]).update(
-                    **{"inc__" + cache_name: step}
-                )
-            else:
-                File.objects(id__in=self.ancestor_ids).update(
-                    **{"inc__" + cache_name: step}
-                )
+            inc_counter(
+                File, [{"id": file_id} for file_id in file_ids], cache_name, step
+            )
             # 更新项目缓存
             if update_project:
                 self.project.inc_cache(cache_name, step)
 
     @need_activated
     def update_cache(self, cache_name, value, update_self=True, update_project=True):
-        """更新某个缓存字段"""
+        """更新某个缓存字段，edit_time 只会向后更新"""
         # 没有此属性跳过
         if not hasattr(self, cache_name):
             return
         # 更新自身/父级缓存
         if update_self:
-            File.objects(id__in=[*self.ancestor_ids, self.id]).update(
-                **{cache_name: value}
-            )
+            file_ids = [*self.ancestor_ids, self.id]
         else:
-            File.objects(id__in=self.ancestor_ids).update(**{cache_name: value})
+            file_ids = list(self.ancestor_ids)
+        if cache_name == "edit_time":
+            max_field(
+                File, [{"id": file_id} for file_id in file_ids], cache_name, value
+            )
+        elif file_ids:
+            File.objects(id__in=file_ids).update(**{cache_name: value})
         # 更新项目缓存
         if update_project:
             self.project.update_cache(cache_name, value)
@@ -599,41 +677,60 @@ class File(Document):
             return ""
         return oss.sign_url(current_app.config["OSS_FILE_PREFIX"], self.save_name)
 
-    @property
-    def cover_url(self):
+    def _thumbnail_ready(self, process_name: str) -> bool:
+        """处理后的图片（如缩略图）是否可以访问，不支持图片处理的储存需要先生成"""
+        if oss.supports_image_process:
+            return True
+        if self.thumbnail_status is None:
+            return oss.is_exist(
+                current_app.config["OSS_FILE_PREFIX"],
+                self.save_name,
+                process_name=process_name,
+            )
+        return self.thumbnail_status == ThumbnailStatus.SUCCEEDED
+
+    def _processed_url(self, process_name: str) -> str:
         if not self.save_name:
             return ""
-        if current_app.config[
-            "STORAGE_TYPE"
-        ] == StorageType.LOCAL_STORAGE and not oss.is_exist(
-            current_app.config["OSS_FILE_PREFIX"],
-            self.save_name,
-            process_name=current_app.config["OSS_PROCESS_COVER_NAME"],
-        ):
+        if not self._thumbnail_ready(process_name):
             return "generating"
         return oss.sign_url(
             current_app.config["OSS_FILE_PREFIX"],
             self.save_name,
-            process_name=current_app.config["OSS_PROCESS_COVER_NAME"],
+            process_name=process_name,
         )
 
+    @property
+    def cover_url(self):
+        return self._processed_url(current_app.config["OSS_PROCESS_COVER_NAME"])
+
     @property
     def safe_check_url(self):
+        return self._processed_url(current_app.config["OSS_PROCESS_SAFE_CHECK_NAME"])
+
+    def image_urls(self) -> dict:
+        """
+        url、cover_url 和 safe_check_url，一次批量签发（见 oss.sign_urls）
+        """
         if not self.save_name:
-            return ""
-        if current_app.config[
-            "STORAGE_TYPE"
-        ] == StorageType.LOCAL_STORAGE and not oss.is_exist(
-            current_app.config["OSS_FILE_PREFIX"],
-            self.save_name,
-            process_name=current_app.config["OSS_PROCESS_SAFE_CHECK_NAME"],
-        ):
-            return "generating"
-        return oss.sign_url(
-            current_app.config["OSS_FILE_PREFIX"],
-            self.save_name,
-            process_name=current_app.config["OSS_PROCESS_SAFE_CHECK_NAME"],
+            return {"url": "", "cover_url": "", "safe_check_url": ""}
+        process_names = {
+            "url": None,
+            "cover_url": current_app.config["OSS_PROCESS_COVER_NAME"],
+            "safe_check_url": current_app.config["OSS_PROCESS_SAFE_CHECK_NAME"],
+        }
+        urls = dict.fromkeys(process_names, "generating")
+        for key, process_name in list(process_names.items()):
+            if process_name is not None and not self._thumbnail_ready(process_name):
+                del process_names[key]
+        signed_urls = oss.sign_urls(
+            [
+                (current_app.config["OSS_FILE_PREFIX"], self.save_name, process_name)
+                for process_name in process_names.values()
+            ]
         )
+        urls.update(zip(process_names, signed_urls))
+        return urls
 
     @only_file
     def has_real_file(self):
@@ -673,7 +770,7 @@ class File(Document):
         # 文件大小
         file_size = math.ceil(get_file_size(real_file))  # 获取文件大小，去掉小数
         # 将文件上传到OSS
-        oss_result = oss.upload(
+        oss_result = oss.multipart_upload(
             current_app.config["OSS_FILE_PREFIX"], save_name, real_file
         )
         # 替换原存储名和md5
@@ -691,10 +788,8 @@ class File(Document):
         # 文本自动解析生成 Source
         if self.type == FileType.TEXT:
             self.parse()
-        if (
-            self.type == FileType.IMAGE
-            and current_app.config["STORAGE_TYPE"] == StorageType.LOCAL_STORAGE
-        ):
+        if self.type == FileType.IMAGE and not oss.supports_image_process:
+            self.update(thumbnail_status=ThumbnailStatus.GENERATING)
             create_thumbnail(str(self.id))
         self.reload()
         return oss_result
@@ -733,6 +828,7 @@ class File(Document):
                     save_name="",
                     md5="",
                     file_not_exist_reason=file_not_exist_reason,
+                    unset__thumbnail_status=1,
                 )
                 # 更新缓存数据
                 if update_cache:
@@ -897,7 +993,7 @@ class File(Document):
             # 如果不是测试则异步执行
             run_sync = current_app.config.get("TESTING", False)
             # 将解析设置成排队中
-            self.update(parse_status=ParseStatus.QUEUING)
+            self.update(parse_status=ParseStatus.QUEUING, parse_percent=0)
             # 获取旧版本 id
             if self.old_revision:
                 old_revision_id = str(self.old_revision.id)
@@ -951,6 +1047,41 @@ class File(Document):
         source = Source(file=self, content=content, rank=rank, blank=blank).save()
         return source
 
+    @only(FileType.TEXT)
+    @need_activated
+    def create_sources_bulk(self, lines: list[str], start_rank=None) -> list["Source"]:
+        """
+        批量为文本增加原文，使用一次 insert_many 写入，并只更新一次原文数量
+
+        :param lines: 每行原文
+        :param start_rank: 第一行的 rank，默认接在已有原文之后
+        :return: 已写入的原文（可以继续 save/update）
+        """
+        if not lines:
+            return []
+        if start_rank is None:
+            start_rank = self.next_source_rank()
+        sources = [
+            Source(
+                file=self, content=line, rank=start_rank + i, blank=line.strip() == ""
+            )
+            for i, line in enumerate(lines)
+        ]
+        Source.objects.insert(sources, load_bulk=False)
+        for source in sources:
+            # 之后 save 时使用 update 而不是再次插入
+            source._created = False
+            source._clear_changed_fields()
+        self.inc_cache("source_count", sum(1 for source in sources if not source.blank))
+        return sources
+
+    def sources_by_content(self) -> dict[str, "Source"]:
+        """非空原文的内容到原文的字典，内容相同时取 rank 最小的，用于导入旧修订版翻译"""
+        sources = {}
+        for source in self.sources().filter(blank=False):
+            sources.setdefault(source.content, source)
+        return sources
+
     @only(FileType.IMAGE)
     @need_activated
     def _create_image_source(
@@ -981,6 +1112,8 @@ class File(Document):
             position_type=position_type,
         ).save()
         self.inc_cache("source_count", 1)  # 更新原文数量
+        # OCR、导入等也通过此方法新增原文，在此使翻译器缓存失效
+        self.bump_translator_version()
         return source
 
     @only_file
@@ -1000,11 +1133,21 @@ class File(Document):
                 target=target,
             )
         self.inc_cache("source_count", -self.source_count)
+        self.bump_translator_version()
 
-    def sources(self, skip=None, limit=None, order_by: list = None) -> list["Source"]:
+    def sources(
+        self, skip=None, limit=None, order_by: list = None, cursor: list = None
+    ) -> list["Source"]:
+        """
+        :param cursor: 游标分页时上一页最后一条的排序键值，需使用默认排序
+        """
         sources = Source.objects(file=self)
+        if cursor:
+            sources = sources.filter(
+                __raw__=mongo_keyset(Source, default_sources_order, cursor)
+            )
         # 排序处理
-        sources = mongo_order(sources, order_by, ["rank"])
+        sources = mongo_order(sources, order_by, default_sources_order)
         # 分页处理
         sources = mongo_slice(sources, skip, limit)
         return sources
@@ -1014,21 +1157,79 @@ class File(Document):
         """
         返回图片翻译器所用的 json
 
+        查询方式由 TRANSLATOR_QUERY_MODE 配置决定，默认为多次查询
+
         :param target: 翻译目标
-        :param paging: 是否分页
+        :param paging: 是否分页，支持页码分页和以 rank、id 为键的游标分页
         :param show_blank: 是否显示空行
         :return:
         """
         # 是否分页
         p = None
+        skip, limit, cursor, need_count = None, None, None, False
         if paging:
-            p = MoePagination()
-            sources = self.sources(skip=p.skip, limit=p.limit)
+            p = MoePagination(cursor_keys=default_sources_order)
+            skip, limit, cursor = p.skip, p.query_limit, p.cursor
+            need_count = p.need_count
+        # 缓存 key 中带有 translator_version，修改后自动失效
+        cache_key = (
+            f"translator:{self.id}:{self.translator_version}:{target.id}:"
+            f"{getattr(user, 'id', None)}:{skip}:{limit}:{show_blank}:"
+            f"{cursor}:{need_count}"
+        )
+        cached = cache.get(cache_key)
+        if cached is None:
+            if (
+                current_app.config.get("TRANSLATOR_QUERY_MODE")
+                == TranslatorQueryMode.PIPELINE
+            ):
+                data_func = self._translator_data_by_pipeline
+            else:
+                data_func = self._translator_data_by_query
+            data, count, cursor_values = data_func(
+                target,
+                skip=skip,
+                limit=limit,
+                show_blank=show_blank,
+                user=user,
+                cursor=cursor,
+            )
+            count = count() if need_count else None
+            # 用户资料的修改不会使缓存失效，所以缓存中只保存用户 id
+            cache.set(
+                cache_key,
+                (_map_translator_users(data, _user_id), count, cursor_values),
+            )
+        else:
+            data, count, cursor_values = cached
+            data = _resolve_translator_users(data)
+        # 是否分页
+        if p:
+            if p.cursor_mode:
+                items = p.cut(zip(data, cursor_values), values=lambda item: item[1])
+                data = [source_data for source_data, _ in items]
+            return p.set_data(data, count)
         else:
-            sources = self.sources()
+            return data
+
+    def bump_translator_version(self):
+        """原文、翻译、备注修改后调用，使翻译器缓存失效"""
+        self.update(inc__translator_version=1)
+
+    def _translator_data_by_query(
+        self, target, skip, limit, show_blank, user, cursor=None
+    ):
+        """
+        分别查询原文、翻译、备注，组成翻译器数据
+
+        :return: (数据, 原文总数的获取函数, 各原文的游标键值)
+        """
+        sources = self.sources(skip=skip, limit=limit, cursor=cursor)
         # 仅显示不是空白的
         if not show_blank:
             sources = sources.filter(blank=False)
+        sources = list(sources)
+        source_ids = [source.id for source in sources]
         data = [
             {
                 **source.to_api(),
@@ -1042,91 +1243,229 @@ class File(Document):
         source_id_dict = {source["id"]: source for source in data}
         # ！插入翻译数据
         # 获取所有原文的自己的翻译
-        my_translation_data = [
-            t.to_api()
-            for t in Translation.objects(user=user, source__in=sources, target=target)
-        ]
+        my_translation_data = Translation.batch_to_api(
+            Translation.objects(user=user, source__in=source_ids, target=target)
+        )
         for td in my_translation_data:
             source = source_id_dict.get(td["source_id"])
             if source:
                 source["my_translation"] = td
         # 取出所有原文的翻译数据（不包括自己的）
-        translation_data = [
-            t.to_api()
-            for t in Translation.objects(
-                user__ne=user, source__in=sources, target=target
+        translation_data = Translation.batch_to_api(
+            Translation.objects(
+                user__ne=user, source__in=source_ids, target=target
             ).order_by(*default_translations_order)
-        ]
+        )
         for td in translation_data:
             source = source_id_dict.get(td["source_id"])
             if source:
                 source["translations"].append(td)
         # 检测其他语言是否有翻译
-        other_language_translation_data = [
-            t.to_api()
-            for t in Translation.objects(source__in=sources, target__ne=target)
-        ]
-        for td in other_language_translation_data:
-            source = source_id_dict.get(td["source_id"])
+        for source_id in Translation.sources_with_translations(
+            source_ids, exclude_target=target
+        ):
+            source = source_id_dict.get(str(source_id))
             if source:
                 source["has_other_language_translation"] = True
         # ！插入tip数据
         # 一次取出所有tip数据
-        tip_data = [
-            t.to_api()
-            for t in Tip.objects(source__in=sources, target=target).order_by(
-                "-create_time"
-            )
-        ]
+        tip_data = Tip.batch_to_api(
+            Tip.objects(source__in=source_ids, target=target).order_by("-create_time")
+        )
         for td in tip_data:
             source = source_id_dict.get(td["source_id"])
             if source:
                 source["tips"].append(td)
-        # 是否分页
-        if p:
-            return p.set_data(data, self.sources().count())
-        else:
-            return data
+        return (
+            data,
+            lambda: self.sources().count(),
+            [keyset_values(source, default_sources_order) for source in sources],
+        )
 
-    def to_labelplus(self, /, *, target):
-        """将翻译导出成labelplus格式"""
-        data = ""
-        if len(self.ancestors) > 0:
-            path = "/".join([ancestors.name for ancestors in self.ancestors]) + "/"
-        else:
-            path = ""
-        # 文件路径行
-        data += ">>>>>>>>[" + path + self.name + "]<<<<<<<<\r\n"
-        # 遍历所有原文
-        for id, source in enumerate(self.sources(), start=1):
-            group_id = source.position_type
-            # 标签信息 ---[id]---[x,y,group_id]
-            data += (
-                "----------------["
-                + str(id)
-                + "]----------------["
-                + str(source.x)
-                + ","
-                + str(source.y)
-                + ","
-                + str(group_id)
-                + "]\r\n"
+    def _translator_data_by_pipeline(
+        self, target, skip, limit, show_blank, user, cursor=None
+    ):
+        """
+        使用一个聚合管道取出一页原文，并通过 $lookup 连接当前目标语言的翻译、备注和用户，
+        原文总数在需要时另外查询
+
+        :return: (数据, 原文总数的获取函数, 各原文的游标键值)
+        """
+        pipeline = [
+            {"$match": {Source.file.db_field: self.id}},
+            mongo_sort(Source, default_sources_order),
+        ]
+        if cursor:
+            pipeline.append(
+                {"$match": mongo_keyset(Source, default_sources_order, cursor)}
             )
-            translation = source.best_translation(target=target)
-            # 有翻译
-            if translation:
-                # 优先使用校对的内容
-                if translation.proofread_content:
-                    content = translation.proofread_content
+        if not show_blank:
+            pipeline.append({"$match": {Source.blank.db_field: False}})
+        if skip:
+            pipeline.append({"$skip": skip})
+        if limit:
+            pipeline.append({"$limit": limit})
+        # 只连接当前目标语言的翻译和备注，且只取出需要的字段
+        for document, fields, name in (
+            (
+                Translation,
+                [
+                    Translation.mt,
+                    Translation.content,
+                    Translation.user,
+                    Translation.proofread_content,
+                    Translation.proofreader,
+                    Translation.selected,
+                    Translation.selector,
+                    Translation.create_time,
+                    Translation.edit_time,
+                ],
+                "translations",
+            ),
+            (
+                Tip,
+                [Tip.content, Tip.user, Tip.create_time, Tip.edit_time],
+                "tips",
+            ),
+        ):
+            source_field = "$" + document.source.db_field
+            target_field = "$" + document.target.db_field
+            pipeline.append(
+                {
+                    "$lookup": {
+                        "from": document._get_collection_name(),
+                        "let": {"source_id": "$_id"},
+                        "pipeline": [
+                            {
+                                "$match": {
+                                    "$expr": {
+                                        "$and": [
+                                            {"$eq": [source_field, "$$source_id"]},
+                                            {"$eq": [target_field, target.id]},
+                                        ]
+                                    }
+                                }
+                            },
+                            {
+                                "$project": {
+                                    document.source.db_field: 1,
+                                    document.target.db_field: 1,
+                                    **{field.db_field: 1 for field in fields},
+                                }
+                            },
+                        ],
+                        "as": name,
+                    }
+                }
+            )
+        # 翻译者、校对者、选定者、备注作者
+        user_fields = {
+            "translation_users": "translations." + Translation.user.db_field,
+            "proofreaders": "translations." + Translation.proofreader.db_field,
+            "selectors": "translations." + Translation.selector.db_field,
+            "tip_users": "tips." + Tip.user.db_field,
+        }
+        user_collection = Translation.user.document_type._get_collection_name()
+        for name, local_field in user_fields.items():
+            pipeline.append(
+                {
+                    "$lookup": {
+                        "from": user_collection,
+                        "localField": local_field,
+                        "foreignField": "_id",
+                        "as": name,
+                    }
+                }
+            )
+        # 逐个返回原文，不合并为一个文档，不分页时也不会超过文档大小限制
+        raw_sources = list(Source._get_collection().aggregate(pipeline))
+        # 用户数据，未能连接到的（如 $lookup 不支持数组路径时）统一补查一次
+        from app.models.user import User
+
+        users_data = {}
+        for raw in raw_sources:
+            for name in user_fields:
+                for raw_user in raw[name]:
+                    if raw_user["_id"] not in users_data:
+                        users_data[raw_user["_id"]] = User._from_son(raw_user).to_api()
+        user_ids = set()
+        for raw in raw_sources:
+            user_ids |= Translation._raw_user_ids(raw["translations"])
+            user_ids |= Tip._raw_user_ids(raw["tips"])
+        users_data.update(_batch_users_to_api(user_ids - users_data.keys()))
+        targets_data = Target.batch_to_api([target.id])
+        # 其他语言的翻译只需要知道是否存在，在数据库中分组
+        other_language_source_ids = Translation.sources_with_translations(
+            [raw["_id"] for raw in raw_sources], exclude_target=target
+        )
+        # 组成翻译器数据
+        joined_fields = {"translations", "tips", *user_fields}
+        data = []
+        for raw in raw_sources:
+            raw_source = {k: v for k, v in raw.items() if k not in joined_fields}
+            source_data = {
+                **Source._from_son(raw_source).to_api(),
+                "translations": [],
+                "tips": [],
+                "has_other_language_translation": (
+                    raw["_id"] in other_language_source_ids
+                ),
+            }
+            translations = []
+            for raw_translation in raw["translations"]:
+                if raw_translation[Translation.user.db_field] == getattr(
+                    user, "id", user
+                ):
+                    source_data["my_translation"] = Translation.raw_to_api(
+                        raw_translation, users_data, targets_data
+                    )
                 else:
-                    content = translation.content
-            else:
-                content = ""
-            # 统一使用 Windows 换行符
-            content = content.replace("\n", "\r\n")
-            # 再换行
-            data += content + "\r\n"
-        return data
+                    translations.append(raw_translation)
+            # 与 default_translations_order 相同的排序
+            translations.sort(
+                key=lambda t: (
+                    t.get(Translation.selected.db_field, False),
+                    t.get(Translation.proofread_content.db_field, ""),
+                    t[Translation.edit_time.db_field],
+                ),
+                reverse=True,
+            )
+            source_data["translations"] = [
+                Translation.raw_to_api(raw_translation, users_data, targets_data)
+                for raw_translation in translations
+            ]
+            tips = list(raw["tips"])
+            tips.sort(key=lambda t: t[Tip.create_time.db_field], reverse=True)
+            source_data["tips"] = [
+                Tip.raw_to_api(raw_tip, users_data) for raw_tip in tips
+            ]
+            data.append(source_data)
+        return (
+            data,
+            lambda: Source._get_collection().count_documents(
+                {Source.file.db_field: self.id}
+            ),
+            [[raw[Source.rank.db_field], raw["_id"]] for raw in raw_sources],
+        )
+
+    def to_labelplus(self, /, *, target):
+        """将翻译导出成labelplus格式"""
+        folder_names = dict(File.objects(id__in=self.ancestor_ids).scalar("id", "name"))
+        path = "".join(folder_names[id] + "/" for id in self.ancestor_ids)
+        data = io.StringIO()
+        dump_labelplus_file(
+            {
+                "file_name": path + self.name,
+                "labels": Source.raw_to_output(
+                    self.sources()
+                    .only("content", "x", "y", "position_type")
+                    .as_pymongo(),
+                    target=target,
+                ),
+            },
+            data,
+        )
+        return data.getvalue()
 
     @need_activated
     def to_api(self):
@@ -1151,9 +1490,7 @@ class File(Document):
             data["parse_status_detail_name"] = ImageParseStatus.get_detail_by_value(
                 self.parse_status, "name"
             )
-            data["url"] = self.url
-            data["cover_url"] = self.cover_url
-            data["safe_check_url"] = self.safe_check_url
+            data.update(self.image_urls())
             data["image_ocr_percent"] = self.image_ocr_percent
             data["image_ocr_percent_detail_name"] = ImageOCRPercent.get_detail_by_value(
                 self.image_ocr_percent, "name"
@@ -1162,6 +1499,7 @@ class File(Document):
             data["parse_status_detail_name"] = ParseStatus.get_detail_by_value(
                 self.parse_status, "name"
             )
+            data["parse_percent"] = self.parse_percent
         return data
 
 
@@ -1227,14 +1565,18 @@ class Source(Document):
             raise SourceNotExistError
         return source
 
-    def find_terms(self):
-        """寻找术语"""
-        terms = Term.objects(term_bank__in=self.file.project.term_banks)
-        self.possible_terms = []  # 清空可能的术语
-        for term in terms:
-            # 如果术语原文在翻译原文中，且可能的术语还没有，则增加
-            if term.source in self.content and term not in self.possible_terms:
-                self.possible_terms.append(term)
+    def find_terms(
+        self, matcher: Optional[Union[TermMatcher, TermMatcherChain]] = None
+    ):
+        """
+        寻找术语
+
+        :param matcher: 项目术语库的匹配器（Term.matcher），为 None 则临时构建。
+            处理多个原文时应构建一次后复用
+        """
+        if matcher is None:
+            matcher = Term.matcher(self.file.project.term_banks)
+        self.possible_terms = matcher.match(self.content)
         self.save()
 
     def copy(self, source: "Source"):
@@ -1351,8 +1693,53 @@ class Source(Document):
                 ).update(dec__rank=1)
                 self.update(rank=next_source.rank - 1)
             self.file.update(source_moving=False)  # 解锁
+        self.file.bump_translator_version()
         return True
 
+    @staticmethod
+    def raw_to_output(raw_sources, /, *, target, with_tips=False) -> list[dict]:
+        """
+        将原文的原始数据转换为导出数据（见 app.utils.output_formats），
+        最佳翻译和备注各使用一次查询取出
+
+        :param raw_sources: 原文的原始数据，需包含 _id、content、x、y、position_type
+        :param target: 目标语言
+        :param with_tips: 是否包含此目标语言的备注
+        """
+        raw_sources = list(raw_sources)
+        source_ids = [raw["_id"] for raw in raw_sources]
+        translations = Translation.best_translations(source_ids, target)
+        tips = defaultdict(list)
+        if with_tips and source_ids:
+            for raw_tip in (
+                Tip.objects(source__in=source_ids, target=target)
+                .order_by("create_time")
+                .only("source", "content")
+                .as_pymongo()
+            ):
+                tips[raw_tip[Tip.source.db_field]].append(
+                    raw_tip.get(Tip.content.db_field, "")
+                )
+        data = []
+        for raw in raw_sources:
+            translation = translations.get(raw["_id"])
+            content = ""
+            # 有翻译，优先使用校对的内容
+            if translation:
+                content = translation["proofread_content"] or translation["content"]
+            source_data = {
+                "id": str(raw["_id"]),
+                "content": raw.get(Source.content.db_field, ""),
+                "x": float(raw[Source.x.db_field]),
+                "y": float(raw[Source.y.db_field]),
+                "position_type": raw[Source.position_type.db_field],
+                "translation": content,
+            }
+            if with_tips:
+                source_data["tips"] = tips[raw["_id"]]
+            data.append(source_data)
+        return data
+
     def best_translation(self, target):
         """返回最佳翻译
 
@@ -1420,6 +1807,7 @@ class Source(Document):
             translation.clear()
         self.delete()
         self.file.inc_cache("source_count", -1)
+        self.file.bump_translator_version()
 
     def to_api(self):
         return {
@@ -1458,6 +1846,7 @@ class Translation(Document):
     }
 
     @classmethod
+    @buffered_counters
     def create(cls, content, source, target, user, mt=False):
         """新增翻译"""
         # 如果以前有自己的翻译则覆盖，没有则新增
@@ -1489,9 +1878,11 @@ class Translation(Document):
             and not source.blank
         ):
             source.file.inc_cache("translated_source_count", 1, target=target)
+        source.file.bump_translator_version()
         translation.reload()
         return translation
 
+    @buffered_counters
     def unselect(self):
         """取消选中此翻译"""
         self.reload()  # 刷新缓存、状态，以免之前使用过unselect发生计数错误
@@ -1502,7 +1893,9 @@ class Translation(Document):
         self.other_translations().update(selected=False, unset__selector=1)
         self.source.file.inc_cache("checked_source_count", -1, target=self.target)
         self.update_cache("edit_time", datetime.datetime.utcnow())
+        self.source.file.bump_translator_version()
 
+    @buffered_counters
     def select(self, user):
         """选中此翻译"""
         self.reload()  # 刷新缓存、状态，以免之前使用过unselect发生计数错误
@@ -1519,7 +1912,9 @@ class Translation(Document):
         if inc_checked_source_count and not self.source.blank:  # 如果原文为空则
             self.source.file.inc_cache("checked_source_count", 1, target=self.target)
         self.update_cache("edit_time", datetime.datetime.utcnow())
+        self.source.file.bump_translator_version()
 
+    @buffered_counters
     def clear(self):
         """删除翻译，并更新缓存"""
         self.reload()  # 刷新缓存、状态，以免之前使用过unselect发生计数错误
@@ -1531,6 +1926,7 @@ class Translation(Document):
                 "translated_source_count", -1, target=self.target
             )
         self.delete()
+        self.source.file.bump_translator_version()
 
     def update_cache(self, cache_name, value):
         """更新某个缓存字段"""
@@ -1540,6 +1936,67 @@ class Translation(Document):
         self.update(**{cache_name: value})
         self.source.file.update_cache(cache_name, value)
 
+    @classmethod
+    def sources_with_translations(
+        cls, sources, exclude_target: Optional["Target"] = None
+    ) -> set[ObjectId]:
+        """
+        返回有翻译的原文 id 集合
+
+        在数据库中按原文 $group，只返回 id，不取出翻译内容
+
+        :param sources: 原文或原文 id 列表
+        :param exclude_target: 不统计此目标语言的翻译
+        :return:
+        """
+        source_ids = [getattr(source, "id", source) for source in sources]
+        if not source_ids:
+            return set()
+        translations = cls.objects(source__in=source_ids)
+        if exclude_target:
+            translations = translations.filter(target__ne=exclude_target)
+        return {
+            item["_id"]
+            for item in translations.aggregate(
+                [{"$group": {"_id": "$" + cls.source.db_field}}]
+            )
+        }
+
+    @classmethod
+    def best_translations(cls, sources, target: "Target") -> dict[ObjectId, dict]:
+        """
+        批量返回原文的最佳翻译，顺序与 Source.best_translation 相同
+
+        在数据库中按 default_translations_order 排序后按原文 $group 取第一条，
+        一批原文只需一次聚合
+
+        :param sources: 原文或原文 id 列表
+        :param target: 目标语言
+        :return: {原文 id: {"content": 翻译内容, "proofread_content": 校对内容}}，
+            没有翻译的原文不在其中
+        """
+        source_ids = [getattr(source, "id", source) for source in sources]
+        if not source_ids:
+            return {}
+        translations = cls.objects(source__in=source_ids, target=target)
+        return {
+            item.pop("_id"): item
+            for item in translations.aggregate(
+                [
+                    mongo_sort(cls, default_translations_order),
+                    {
+                        "$group": {
+                            "_id": "$" + cls.source.db_field,
+                            "content": {"$first": "$" + cls.content.db_field},
+                            "proofread_content": {
+                                "$first": "$" + cls.proofread_content.db_field
+                            },
+                        }
+                    },
+                ]
+            )
+        }
+
     def selected_translation(self):
         """获取被选中的翻译，同目标语言"""
         return Translation.objects(
@@ -1552,6 +2009,63 @@ class Translation(Document):
             source=self.source, target=self.target, id__ne=self.id
         )
 
+    @staticmethod
+    def batch_to_api(translations: list["Translation"]) -> list[dict]:
+        """
+        批量转换 translations 到 api 格式，结果与 to_api 相同
+
+        不逐个解引用 source/user/target，而是读取原始数据后，
+        每个关联集合只用一次 $in 查询取出
+
+        :param translations: Translation 的 QuerySet
+        """
+        raw_translations = list(translations.as_pymongo())
+        users_data = _batch_users_to_api(Translation._raw_user_ids(raw_translations))
+        target_ids = {raw[Translation.target.db_field] for raw in raw_translations}
+        targets_data = Target.batch_to_api(target_ids) if target_ids else {}
+        return [
+            Translation.raw_to_api(raw, users_data, targets_data)
+            for raw in raw_translations
+        ]
+
+    @staticmethod
+    def _raw_user_ids(raw_translations: list[dict]) -> set[ObjectId]:
+        """原始数据中所有翻译者、校对者、选定者的 id"""
+        user_ids = set()
+        for raw in raw_translations:
+            for field in (
+                Translation.user,
+                Translation.proofreader,
+                Translation.selector,
+            ):
+                if raw.get(field.db_field):
+                    user_ids.add(raw[field.db_field])
+        return user_ids
+
+    @staticmethod
+    def raw_to_api(raw: dict, users_data: dict, targets_data: dict) -> dict:
+        """
+        将原始数据转换为 api 格式
+
+        :param raw: as_pymongo 或聚合管道返回的原始数据
+        :param users_data: user_id 到 api 数据的字典
+        :param targets_data: target_id 到 api 数据的字典
+        """
+        return {
+            "source_id": str(raw[Translation.source.db_field]),
+            "id": str(raw["_id"]),
+            "mt": raw.get(Translation.mt.db_field, False),
+            "content": raw.get(Translation.content.db_field, ""),
+            "user": users_data.get(raw.get(Translation.user.db_field)),
+            "proofread_content": raw.get(Translation.proofread_content.db_field, ""),
+            "proofreader": users_data.get(raw.get(Translation.proofreader.db_field)),
+            "selected": raw.get(Translation.selected.db_field, False),
+            "selector": users_data.get(raw.get(Translation.selector.db_field)),
+            "create_time": raw[Translation.create_time.db_field].isoformat(),
+            "edit_time": raw[Translation.edit_time.db_field].isoformat(),
+            "target": targets_data[raw[Translation.target.db_field]],
+        }
+
     def to_api(self):
         return {
             "source_id": str(self.source.id),
@@ -1592,8 +2106,44 @@ class Tip(Document):
         tip = cls(source=source, user=user, target=target)
         tip.content = content
         tip.save()
+        source.file.bump_translator_version()
         return tip
 
+    @staticmethod
+    def batch_to_api(tips: list["Tip"]) -> list[dict]:
+        """
+        批量转换 tips 到 api 格式，结果与 to_api 相同
+
+        :param tips: Tip 的 QuerySet
+        """
+        raw_tips = list(tips.as_pymongo())
+        users_data = _batch_users_to_api(Tip._raw_user_ids(raw_tips))
+        return [Tip.raw_to_api(raw, users_data) for raw in raw_tips]
+
+    @staticmethod
+    def _raw_user_ids(raw_tips: list[dict]) -> set[ObjectId]:
+        """原始数据中所有备注作者的 id"""
+        return {
+            raw[Tip.user.db_field] for raw in raw_tips if raw.get(Tip.user.db_field)
+        }
+
+    @staticmethod
+    def raw_to_api(raw: dict, users_data: dict) -> dict:
+        """
+        将原始数据转换为 api 格式
+
+        :param raw: as_pymongo 或聚合管道返回的原始数据
+        :param users_data: user_id 到 api 数据的字典
+        """
+        return {
+            "source_id": str(raw[Tip.source.db_field]),
+            "id": str(raw["_id"]),
+            "content": raw.get(Tip.content.db_field, ""),
+            "user": users_data.get(raw.get(Tip.user.db_field)),
+            "create_time": raw[Tip.create_time.db_field].isoformat(),
+            "edit_time": raw[Tip.edit_time.db_field].isoformat(),
+        }
+
     def to_api(self):
         return {
             "source_id": str(self.source.id),
@@ -1603,3 +2153,63 @@ class Tip(Document):
             "create_time": self.create_time.isoformat(),
             "edit_time": self.edit_time.isoformat(),
         }
+
+
+def _batch_users_to_api(user_ids) -> dict:
+    """一次查询出所有用户，返回 user_id 到 api 数据的字典"""
+    from app.models.user import User
+
+    user_ids = list(set(user_ids))
+    if not user_ids:
+        return {}
+    return {user.id: user.to_api() for user in User.objects(id__in=user_ids)}
+
+
+translator_translation_user_fields = ("user", "proofreader", "selector")
+
+
+def _map_translator_users(data: list[dict], func) -> list[dict]:
+    """
+    复制翻译器数据，并用 func 转换其中的翻译者、校对者、选定者和备注作者
+
+    不修改原数据（进程内缓存中保存的是同一个对象）
+    """
+
+    def map_users(item, fields):
+        return {
+            **item,
+            **{field: func(item[field]) for field in fields if item.get(field)},
+        }
+
+    result = []
+    for source_data in data:
+        source_data = {
+            **source_data,
+            "translations": [
+                map_users(translation, translator_translation_user_fields)
+                for translation in source_data["translations"]
+            ],
+            "tips": [map_users(tip, ("user",)) for tip in source_data["tips"]],
+        }
+        if "my_translation" in source_data:
+            source_data["my_translation"] = map_users(
+                source_data["my_translation"], translator_translation_user_fields
+            )
+        result.append(source_data)
+    return result
+
+
+def _user_id(user_data: dict) -> str:
+    return user_data["id"]
+
+
+def _resolve_translator_users(data: list[dict]) -> list[dict]:
+    """将缓存的翻译器数据中的用户 id 替换为当前的用户数据，所有用户一次查询取出"""
+    user_ids = set()
+    # 只用于收集用户 id，复制出的数据不使用
+    _map_translator_users(data, user_ids.add)
+    users_data = {
+        str(user_id): user_data
+        for user_id, user_data in _batch_users_to_api(map(ObjectId, user_ids)).items()
+    }
+    return _map_translator_users(data, users_data.get)
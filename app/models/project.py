@@ -1,12 +1,27 @@
 from app.exceptions.project import LabelplusParseFailedError
 import datetime
 import logging
-from typing import List, Union, BinaryIO, TYPE_CHECKING
+import io
+import itertools
+import re
+from collections import defaultdict
+from typing import (
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    TextIO,
+    Union,
+    BinaryIO,
+    TYPE_CHECKING,
+)
 
 from bson import ObjectId
 from io import BufferedReader
 from flask import current_app
 from flask_babel import gettext, lazy_gettext
+from app import oss
 from app.tasks.import_from_labelplus import import_from_labelplus
 from mongoengine import (
     CASCADE,
@@ -21,7 +36,8 @@ from mongoengine import (
     ReferenceField,
     StringField,
 )
-from app.utils.labelplus import load_from_labelplus
+from app.utils.labelplus import LPFile, validate_labelplus
+from app.utils.output_formats import LabelplusFormat, OutputFormat
 from app.core.rbac import (
     AllowApplyType,
     GroupMixin,
@@ -47,7 +63,15 @@ from app.exceptions import (
     TargetAndSourceLanguageSameError,
 )
 from app.models.application import Application
-from app.models.file import File, Filename
+from app.models.file import (
+    File,
+    FileTargetCache,
+    Filename,
+    Source,
+    Translation,
+    default_files_order,
+    default_sources_order,
+)
 from app.models.invitation import Invitation
 from app.models.language import Language
 from app.models.target import Target
@@ -57,7 +81,7 @@ if TYPE_CHECKING:
     from app.models.user import User
     from app.models.team import Team
 from app.models.output import Output
-from app.tasks.file_parse import find_terms
+from app.tasks.file_parse import find_project_terms
 from app.constants.file import (
     FileNotExistReason,
     FileType,
@@ -68,11 +92,18 @@ from app.constants.project import (
     ImportFromLabelplusStatus,
     ProjectStatus,
 )
-from app.utils.mongo import mongo_order, mongo_slice
+from app.core.counter_buffer import counter_buffer, inc_counter, max_field
+from app.constants.source import SourcePositionType
+from app.utils.mongo import mongo_keyset, mongo_order, mongo_slice
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+# 项目列表默认排序，同时用作游标分页的键
+default_projects_order = ["-edit_time", "id"]
+# 列表查询不加载的字段（很大且只在个别地方使用）
+projects_list_exclude_fields = ["import_from_labelplus_txt"]
+
 
 class ProjectAllowApplyType(AllowApplyType):
     """
@@ -364,6 +395,10 @@ class Project(GroupMixin, Document):
         default=list,
     )
     need_find_terms = BooleanField(db_field="nft", default=False)
+    find_terms_status = IntField(
+        db_field="fts", default=FindTermsStatus.FINISHED
+    )  # 项目寻找术语的状态
+    find_terms_percent = IntField(db_field="ftp", default=0)  # 项目寻找术语的进度
 
     # == 解析原文 ==
     ocring = BooleanField(db_field="oc", default=False)  # 是否正在进行项目级解析
@@ -377,6 +412,8 @@ class Project(GroupMixin, Document):
     # targets汇总的缓存
     translated_source_count = IntField(db_field="tsc", default=0)  # 已翻译的原文数量
     checked_source_count = IntField(db_field="csc", default=0)  # 已校对的原文数量
+    # 文件的解析、安全检测、缩略图等状态修改后自增，作为文件列表 ETag 的版本
+    files_version = IntField(db_field="fv", default=0)
 
     # == 从 LP 导入 ==
     import_from_labelplus_status = IntField(
@@ -386,7 +423,10 @@ class Project(GroupMixin, Document):
     import_from_labelplus_error_type = IntField(
         db_field="ie", default=ImportFromLabelplusErrorType.UNKNOWN
     )
+    # 旧版本直接保存的 LabelPlus 文本，仅用于导入尚未完成的旧项目
     import_from_labelplus_txt = StringField(db_field="it", default="")
+    # 等待导入的 LabelPlus 文本在储存服务中的文件名（OSS_IMPORT_PREFIX 下）
+    import_from_labelplus_save_name = StringField(db_field="ib", default="")
 
     # == GroupMixin ==
     default_role_system_code = "translator"
@@ -413,7 +453,7 @@ class Project(GroupMixin, Document):
         # 尝试解析 labelplus 文本
         if labelplus_txt:
             try:
-                load_from_labelplus(labelplus_txt)
+                validate_labelplus(labelplus_txt)
             except Exception:
                 raise LabelplusParseFailedError
         # 语言默认值
@@ -472,8 +512,13 @@ class Project(GroupMixin, Document):
             creator.join(project, role=cls.role_cls.by_system_code("creator"))
         # 通过 Labelplus 数据创建文件及翻译
         if labelplus_txt and creator and len(targets) == 1:
+            # 文本保存到储存服务中，项目上只记录文件名
+            save_name = f"{project.id}.txt"
+            oss.upload(
+                current_app.config["OSS_IMPORT_PREFIX"], save_name, labelplus_txt
+            )
             project.update(
-                import_from_labelplus_txt=labelplus_txt,
+                import_from_labelplus_save_name=save_name,
                 import_from_labelplus_status=ImportFromLabelplusStatus.PENDING,
                 import_from_labelplus_percent=0,
             )
@@ -511,23 +556,20 @@ class Project(GroupMixin, Document):
         self.need_find_terms = True
 
     def find_terms(self):
-        """异步刷新所有文件的可能术语"""
-        # 如果有设置术语库，进行寻找术语任务
-        if len(self._term_banks) > 0:
-            for file in self.files(type_exclude=FileType.FOLDER):
-                # celery任务
-                run_sync = current_app.config.get(
-                    "TESTING", False
-                )  # 如果测试则同步执行
-                result = find_terms(str(file.id), run_sync=run_sync)
-                # 设置文件状态
-                file.update(
-                    find_terms_task_id=result.task_id,
-                    find_terms_status=FindTermsStatus.QUEUING,
-                )
-        # 关闭提示
+        """异步刷新所有文件的可能术语（整个项目一个任务）"""
+        # 关闭提示，并保存术语库的修改供任务读取
         self.need_find_terms = False
         self.save()
+        # 如果有设置术语库，进行寻找术语任务
+        if len(self._term_banks) > 0:
+            self.update(find_terms_status=FindTermsStatus.QUEUING, find_terms_percent=0)
+            File.term_files(self).update(
+                find_terms_status=FindTermsStatus.QUEUING,
+                unset__find_terms_task_id=1,
+            )
+            # celery任务
+            run_sync = current_app.config.get("TESTING", False)  # 如果测试则同步执行
+            find_project_terms(str(self.id), run_sync=run_sync)
 
     def inc_cache(self, cache_name, step, target=None):
         # 0则不请求数据库
@@ -537,27 +579,35 @@ class Project(GroupMixin, Document):
         if cache_name in ["translated_source_count", "checked_source_count"]:
             if target is None:
                 raise ValueError("更新翻译缓存数据必须指定target")
-            target.update(**{"inc__" + cache_name: step})
-            self.update(**{"inc__" + cache_name: step})
+            inc_counter(Target, [{"id": target.id}], cache_name, step)
+            inc_counter(Project, [{"id": self.id}], cache_name, step)
         # 其他缓存
         else:
             # 没有此属性跳过
             if not hasattr(self, cache_name):
                 return
             # 更新项目缓存
-            self.update(**{"inc__" + cache_name: step})
+            inc_counter(Project, [{"id": self.id}], cache_name, step)
 
     def update_cache(self, cache_name, value):
-        """更新某个缓存字段"""
+        """更新某个缓存字段，edit_time 只会向后更新"""
         # 没有此属性跳过
         if not hasattr(self, cache_name):
             return
-        # 更新自身缓存
-        self.update(**{cache_name: value})
         # edit_time 需要同步修改 ProjectSet 和 Team 的
         if cache_name == "edit_time":
-            self.project_set.update(**{cache_name: value})
-            self.team.update(**{cache_name: value})
+            from app.models.team import Team
+
+            max_field(Project, [{"id": self.id}], cache_name, value)
+            max_field(ProjectSet, [{"id": self.project_set.id}], cache_name, value)
+            max_field(Team, [{"id": self.team.id}], cache_name, value)
+        else:
+            # 更新自身缓存
+            self.update(**{cache_name: value})
+
+    def bump_files_version(self):
+        """文件列表中显示的状态修改后调用，使文件列表的 ETag 失效"""
+        self.update(inc__files_version=1)
 
     def is_allow_apply(self, user) -> bool:
         """是否允许此用户申请加入"""
@@ -669,6 +719,173 @@ class Project(GroupMixin, Document):
             file.inc_cache("file_count", 1, update_self=False)
         return file
 
+    def import_labelplus(
+        self,
+        labelplus_files: Iterable[LPFile],
+        /,
+        *,
+        target: Target,
+        user: "User",
+        batch_size: int = 50,
+        on_progress: Optional[Callable[[int], None]] = None,
+    ) -> int:
+        """
+        批量导入 LabelPlus 的文件、标签和翻译
+
+        每批文件中的新图片文件、FileTargetCache、原文、翻译各使用一次 insert 写入，
+        新文件的计数直接写入插入的文档，项目和目标语言的计数在内存中累加后每批写入一次。
+        与已有文件同名或不是图片的文件，使用 create_file/create_source 逐个导入
+
+        :param labelplus_files: 解析出的文件，如 iter_labelplus 的结果
+        :param target: 翻译导入到的目标语言
+        :param user: 翻译者
+        :param batch_size: 每批的文件数量
+        :param on_progress: 每批导入后调用，参数为已导入的文件数量
+        :return: 导入的文件数量
+        """
+        labelplus_files = iter(labelplus_files)
+        count = 0
+        while batch := list(itertools.islice(labelplus_files, batch_size)):
+            with counter_buffer():
+                self._import_labelplus_batch(batch, target=target, user=user)
+            count += len(batch)
+            if on_progress:
+                on_progress(count)
+        return count
+
+    def _import_labelplus_batch(
+        self, labelplus_files: List[LPFile], /, *, target: Target, user: "User"
+    ):
+        filenames = [
+            (Filename(labelplus_file["file_name"]), labelplus_file)
+            for labelplus_file in labelplus_files
+        ]
+        # 与 get_files 相同，文件名大小写不敏感，只匹配激活的修订版
+        name_patterns = [
+            re.compile("^" + re.escape(filename.name) + "$", re.IGNORECASE)
+            for filename, _ in filenames
+        ]
+        existing_names = {
+            name.lower()
+            for name in File.objects(
+                project=self, parent=None, activated=True, name__in=name_patterns
+            ).scalar("name")
+        }
+        # 以小写的文件名为键，同一批中大小写不同的同名文件也只插入第一个
+        new_files: dict[str, tuple[Filename, LPFile]] = {}
+        other_files: List[LPFile] = []
+        for filename, labelplus_file in filenames:
+            lower_name = filename.name.lower()
+            if (
+                filename.file_type == FileType.IMAGE
+                and lower_name not in existing_names
+                and lower_name not in new_files
+            ):
+                new_files[lower_name] = (filename, labelplus_file)
+            else:
+                other_files.append(labelplus_file)
+        if new_files:
+            self._insert_labelplus_files(
+                list(new_files.values()), target=target, user=user
+            )
+        # 同一批中的同名文件，需在新文件写入后再逐个导入
+        for labelplus_file in other_files:
+            self._create_labelplus_file(labelplus_file, target=target, user=user)
+
+    def _insert_labelplus_files(
+        self,
+        new_files: List[tuple[Filename, LPFile]],
+        /,
+        *,
+        target: Target,
+        user: "User",
+    ):
+        """使用 insert 写入新文件及其原文、翻译，计数直接写入文件文档"""
+        files = []
+        for filename, labelplus_file in new_files:
+            labels = labelplus_file["labels"]
+            files.append(
+                File(
+                    name=filename.name,
+                    project=self,
+                    type=FileType.IMAGE,
+                    sort_name=filename.sort_name,
+                    file_not_exist_reason=FileNotExistReason.NOT_UPLOAD,
+                    source_count=len(labels),
+                    translated_source_count=sum(
+                        1 for label in labels if label["translation"] != ""
+                    ),
+                )
+            )
+        File.objects.insert(files, load_bulk=False)
+        targets = list(self.targets())
+        FileTargetCache.objects.insert(
+            [
+                FileTargetCache(
+                    file=file,
+                    target=file_target,
+                    translated_source_count=(
+                        file.translated_source_count if file_target == target else 0
+                    ),
+                )
+                for file in files
+                for file_target in targets
+            ],
+            load_bulk=False,
+        )
+        sources = []
+        translations = []
+        for file, (_, labelplus_file) in zip(files, new_files):
+            for rank, label in enumerate(labelplus_file["labels"]):
+                source = Source(
+                    file=file,
+                    content="",
+                    x=label["x"],
+                    y=label["y"],
+                    rank=rank,
+                    machine=False,
+                    position_type=SourcePositionType.IN
+                    if label["position_type"] == SourcePositionType.IN
+                    else SourcePositionType.OUT,
+                )
+                sources.append(source)
+                if label["translation"] != "":
+                    translations.append(
+                        Translation(
+                            source=source,
+                            target=target,
+                            user=user,
+                            content=label["translation"],
+                        )
+                    )
+        if sources:
+            Source.objects.insert(sources, load_bulk=False)
+        if translations:
+            # 原文已写入，此时才有 id
+            Translation.objects.insert(translations, load_bulk=False)
+        # 项目和目标语言的计数
+        self.inc_cache("file_count", len(files))
+        self.inc_cache("source_count", len(sources))
+        self.inc_cache("translated_source_count", len(translations), target=target)
+        if translations:
+            self.update_cache("edit_time", datetime.datetime.utcnow())
+
+    def _create_labelplus_file(self, labelplus_file: LPFile, /, *, target, user):
+        """逐个创建文件、原文和翻译（用于已有同名文件等情况）"""
+        file = self.create_file(labelplus_file["file_name"])
+        for label in labelplus_file["labels"]:
+            source = file.create_source(
+                content="",
+                x=label["x"],
+                y=label["y"],
+                position_type=SourcePositionType.IN
+                if label["position_type"] == SourcePositionType.IN
+                else SourcePositionType.OUT,
+            )
+            source.create_translation(
+                content=label["translation"], target=target, user=user
+            )
+
     def upload(
         self, filename: str, real_file: Union[BufferedReader, BinaryIO], parent=None
     ) -> File:
@@ -745,6 +962,7 @@ class Project(GroupMixin, Document):
         word: str = None,
         file_ids_include: List[str] = None,
         file_ids_exclude: List[str] = None,
+        cursor: list = None,
     ) -> List[File]:
         """
         获取所有文件
@@ -755,9 +973,14 @@ class Project(GroupMixin, Document):
         :param parent: 父文件夹，默认'all'查询所有files
         :param type_only: 只显示某些类型
         :param type_exclude: 排除某些类型
+        :param cursor: 游标分页时上一页最后一条的排序键值，需使用默认排序
         :return:
         """
         files = File.objects(project=self, activated=True)
+        if cursor:
+            files = files.filter(
+                __raw__=mongo_keyset(File, default_files_order, cursor)
+            )
         if word is not None:
             files = files.filter(name__icontains=word)
         # 父文件夹
@@ -784,7 +1007,7 @@ class Project(GroupMixin, Document):
         if file_ids_exclude:
             files = files.filter(id__nin=file_ids_exclude)
         # 排序处理
-        files = mongo_order(files, order_by, ["dir_sort_name", "type", "sort_name"])
+        files = mongo_order(files, order_by, default_files_order)
         # 分页处理
         files = mongo_slice(files, skip, limit)
         return files
@@ -951,26 +1174,119 @@ class Project(GroupMixin, Document):
         file_ids_exclude: List[str] = None,
     ):
         """将图片文件的翻译导出成Labelplus格式"""
-        # Labelplus翻译文件头格式
-        data = (
-            "1,0\r\n"  # 版本
-            + "-\r\n"
-            + gettext("框内")
-            + "\r\n"  # 标签分组
-            + gettext("框外")
-            + "\r\n"
-            + "-\r\n"
-            + gettext("可使用 LabelPlus Photoshop 脚本导入 psd 中")
-            + "\r\n"  # 注释
+        data = io.StringIO()
+        self.write_labelplus(
+            data,
+            target=target,
+            file_ids_include=file_ids_include,
+            file_ids_exclude=file_ids_exclude,
         )
-        # 遍历所有图片
-        for file in self.files(
-            type_only=FileType.IMAGE,
+        return data.getvalue()
+
+    def write_labelplus(
+        self,
+        stream: TextIO,
+        /,
+        *,
+        target,
+        file_ids_include: List[str] = None,
+        file_ids_exclude: List[str] = None,
+    ):
+        """将图片文件的翻译以Labelplus格式逐个文件写入文本流"""
+        self.write_outputs(
+            [LabelplusFormat(stream)],
+            target=target,
             file_ids_include=file_ids_include,
             file_ids_exclude=file_ids_exclude,
+        )
+
+    def write_outputs(
+        self,
+        output_formats: List[OutputFormat],
+        /,
+        *,
+        target,
+        file_ids_include: List[str] = None,
+        file_ids_exclude: List[str] = None,
+    ):
+        """
+        只遍历一次图片文件，同时写入多个导出格式
+
+        :param output_formats: 导出格式，见 app.utils.output_formats
+        """
+        with_tips = any(output_format.with_tips for output_format in output_formats)
+        info = {
+            "project_id": str(self.id),
+            "project_name": self.name,
+            "target_language": target.language.code,
+        }
+        for output_format in output_formats:
+            output_format.begin(info)
+        for output_file in self.iter_output_files(
+            target=target,
+            file_ids_include=file_ids_include,
+            file_ids_exclude=file_ids_exclude,
+            with_tips=with_tips,
         ):
-            data += file.to_labelplus(target=target)
-        return data
+            for output_format in output_formats:
+                output_format.write_file(output_file)
+        for output_format in output_formats:
+            output_format.end()
+
+    def iter_output_files(
+        self,
+        /,
+        *,
+        target,
+        file_ids_include: List[str] = None,
+        file_ids_exclude: List[str] = None,
+        with_tips: bool = False,
+        batch_size: int = 100,
+    ) -> Iterator[dict]:
+        """
+        逐个图片文件生成导出数据（见 app.utils.output_formats），文件名包含文件夹路径
+
+        文件夹路径使用预先取出的文件夹名称拼接，每批文件的原文、最佳翻译、备注各只查询一次
+
+        :param with_tips: 是否包含备注
+        :param batch_size: 每批的文件数量
+        """
+        folder_names = dict(
+            File.objects(project=self, type=FileType.FOLDER).scalar("id", "name")
+        )
+        raw_files = iter(
+            self.files(
+                type_only=FileType.IMAGE,
+                file_ids_include=file_ids_include,
+                file_ids_exclude=file_ids_exclude,
+            )
+            .only("name", "ancestors")
+            .as_pymongo()
+        )
+        while raw_files_batch := list(itertools.islice(raw_files, batch_size)):
+            raw_sources = (
+                Source.objects(file__in=[raw["_id"] for raw in raw_files_batch])
+                .order_by(*default_sources_order)
+                .only("file", "content", "x", "y", "position_type")
+                .as_pymongo()
+            )
+            raw_sources = list(raw_sources)
+            sources_data = Source.raw_to_output(
+                raw_sources, target=target, with_tips=with_tips
+            )
+            file_sources = defaultdict(list)
+            for raw_source, source_data in zip(raw_sources, sources_data):
+                file_sources[raw_source[Source.file.db_field]].append(source_data)
+            for raw_file in raw_files_batch:
+                path = "".join(
+                    folder_names[id] + "/"
+                    for id in raw_file.get(File.ancestors.db_field, [])
+                )
+                yield {
+                    "id": str(raw_file["_id"]),
+                    "file_name": path + raw_file[File.name.db_field],
+                    "sources": file_sources[raw_file["_id"]],
+                }
 
     def to_output_json(self):
         data = {
@@ -1041,6 +1357,8 @@ class Project(GroupMixin, Document):
             "source_count": self.source_count,
             "translated_source_count": self.translated_source_count,
             "checked_source_count": self.checked_source_count,
+            "find_terms_status": self.find_terms_status,
+            "find_terms_percent": self.find_terms_percent,
             "import_from_labelplus_status": self.import_from_labelplus_status,
             "import_from_labelplus_percent": self.import_from_labelplus_percent,
             "import_from_labelplus_error_type": self.import_from_labelplus_error_type,
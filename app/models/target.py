@@ -80,6 +80,28 @@ class Target(Document):
             raise TargetNotExistError
         return file
 
+    @staticmethod
+    def batch_to_api(target_ids) -> dict:
+        """
+        批量转换 targets 到 api 格式，语言只查询一次
+
+        :param target_ids: 目标语言 id 列表
+        :return: target_id 到 api 数据的字典
+        """
+        targets = list(Target.objects(id__in=list(target_ids)).no_dereference())
+        languages = {
+            language.id: language
+            for language in Language.objects(
+                id__in=[target.language.id for target in targets]
+            )
+        }
+        data = {}
+        for target in targets:
+            # 替换成已查询的语言，避免 to_api 时逐个解引用
+            target.language = languages[target.language.id]
+            data[target.id] = target.to_api()
+        return data
+
     def to_api(self):
         return {
             "id": str(self.id),
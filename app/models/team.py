@@ -30,10 +30,16 @@ from app.exceptions import (
 )
 from app.models.application import Application
 from app.models.invitation import Invitation
-from app.models.project import Project, ProjectRole, ProjectSet
+from app.models.project import (
+    Project,
+    ProjectRole,
+    ProjectSet,
+    default_projects_order,
+    projects_list_exclude_fields,
+)
 from app.models.term import TermBank
 from app.regexs import TEAM_NAME_REGEX
-from app.utils.mongo import mongo_order, mongo_slice
+from app.utils.mongo import mongo_keyset, mongo_order, mongo_slice
 
 
 class TeamPermission(PermissionMixin):
@@ -396,6 +402,7 @@ class Team(GroupMixin, Document):
         status=None,
         order_by: list = None,
         word=None,
+        cursor: list = None,
     ):
         """
         获取团队项目
@@ -406,9 +413,14 @@ class Team(GroupMixin, Document):
         :param status: 查询何种进度的项目
         :param order_by: 排序
         :param word: 名称模糊查询
+        :param cursor: 游标分页时上一页最后一条的排序键值，需使用默认排序
         :return:
         """
-        projects = Project.objects(team=self)
+        projects = Project.objects(team=self).exclude(*projects_list_exclude_fields)
+        if cursor:
+            projects = projects.filter(
+                __raw__=mongo_keyset(Project, default_projects_order, cursor)
+            )
         # 限制在某个项目集中
         if project_set:
             projects = projects.filter(project_set=project_set)
@@ -421,7 +433,7 @@ class Team(GroupMixin, Document):
         elif isinstance(status, int):
             projects = projects.filter(status=status)
         # 排序处理
-        projects = mongo_order(projects, order_by, ["-edit_time"])
+        projects = mongo_order(projects, order_by, default_projects_order)
         # 分页处理
         projects = mongo_slice(projects, skip, limit)
         return projects
@@ -1,4 +1,7 @@
 import datetime
+import re
+
+from flask import current_app
 from mongoengine import (
     Document,
     StringField,
@@ -6,11 +9,17 @@ from mongoengine import (
     DENY,
     CASCADE,
     DateTimeField,
+    IntField,
 )
 
+from pymongo import UpdateMany
+
+from app import term_index
 from app.exceptions.language import TargetAndSourceLanguageSameError
 from app.models.language import Language
+from app.tasks.file_parse import match_term
 from app.utils.mongo import mongo_order, mongo_slice
+from app.utils.term_matcher import TermMatcher, TermMatcherChain
 
 
 # TODO: 改名成 Termbase
@@ -33,6 +42,8 @@ class TermBank(Document):
     edit_time = DateTimeField(
         db_field="e", default=datetime.datetime.utcnow
     )  # 修改时间
+    # 术语库及其中术语的版本，修改时增加，用于使术语匹配器缓存失效
+    version = IntField(db_field="v", default=0)
 
     @classmethod
     def create(cls, name, team, source_language, target_language, user, tip=""):
@@ -61,8 +72,15 @@ class TermBank(Document):
         self.edit_time = datetime.datetime.utcnow()
         self.tip = tip
         self.save()
+        # 原子地增加版本，避免并发修改术语时版本被旧值覆盖
+        self.bump_version()
+        self.reload("version")
         return self
 
+    def bump_version(self):
+        """术语增删改后增加版本"""
+        TermBank.objects(id=self.id).update(inc__version=1)
+
     def terms(self, skip=None, limit=None, order_by=None):
         """返回团队所有项目集"""
         terms = Term.objects(term_bank=self)
@@ -128,29 +146,106 @@ class Term(Document):
         )
         term.edit_time = datetime.datetime.utcnow()
         term.save()
-        # 提示使用此术语库的项目，需要刷新术语
-        from app.models.project import Project
-
-        Project.objects(_term_banks=term_bank).update(need_find_terms=True)
+        term_bank.bump_version()
+        term.refresh_project_terms()
         return term
 
+    @classmethod
+    def matcher(cls, term_banks: list) -> TermMatcherChain:
+        """
+        获取术语库中所有术语的匹配器，匹配结果为术语 id
+
+        每个术语库的匹配器按版本缓存在 term_index 中，术语未修改时不重新编译
+
+        :param term_banks: 术语库列表
+        """
+        ids = [term_bank.id for term_bank in term_banks]
+        # 从数据库读取最新版本，传入的术语库对象可能是之前加载的
+        versions = dict(TermBank.objects(id__in=ids).scalar("id", "version"))
+        return TermMatcherChain(
+            term_index.get(id_, versions[id_], lambda id_=id_: cls._build_matcher(id_))
+            for id_ in ids
+            if id_ in versions
+        )
+
+    @classmethod
+    def _build_matcher(cls, term_bank_id) -> TermMatcher:
+        terms = cls.objects(term_bank=term_bank_id).only("source")
+        return TermMatcher((term.source, term.id) for term in terms)
+
     def clear(self):
         self.delete()
+        self.term_bank.bump_version()
 
     def edit(self, source, target, tip=""):
-        # 如果修改了原文，则需要重新寻找术语
-        if self.source != source:
-            # 提示使用此术语库的项目，需要刷新术语
-            from app.models.project import Project
-
-            Project.objects(_term_banks=self.term_bank).update(need_find_terms=True)
+        source_changed = self.source != source
         self.source = source
         self.target = target
         self.tip = tip
         self.edit_time = datetime.datetime.utcnow()
         self.save()
+        self.term_bank.bump_version()
+        # 如果修改了原文，则需要重新寻找术语
+        if source_changed:
+            self.refresh_project_terms()
         return self
 
+    def refresh_project_terms(self):
+        """
+        新增术语或修改原文后，更新使用此术语库的项目中原文的可能术语
+
+        开启 TERM_INCREMENTAL_MATCH 时只使用此术语增量更新（match_term），
+        否则提示项目需要重新寻找所有术语（Project.find_terms）
+        """
+        if current_app.config.get("TERM_INCREMENTAL_MATCH", True):
+            run_sync = current_app.config.get("TESTING", False)  # 如果测试则同步执行
+            match_term(str(self.id), run_sync=run_sync)
+        else:
+            from app.models.project import Project
+
+            Project.objects(_term_banks=self.term_bank).update(need_find_terms=True)
+
+    def rematch(self) -> int:
+        """
+        只使用此术语更新相关原文的可能术语，不重新扫描其他术语：
+        在使用此术语库的项目中，含有此术语原文的原文加入（$addToSet）此术语，
+        之前有此术语但已不含有的原文移除（$pull）此术语
+
+        删除术语时由 possible_terms 的 reverse_delete_rule=PULL 移除，无需调用
+
+        :return: 修改的原文数量
+        """
+        from app.models.file import File, Source
+        from app.models.project import Project
+
+        project_ids = list(Project.objects(_term_banks=self.term_bank).scalar("id"))
+        if not project_ids:
+            return 0
+        file_ids = list(File.term_files(project_ids).scalar("id"))
+        if not file_ids:
+            return 0
+        pattern = re.compile(re.escape(self.source))
+        file_field = Source.file.db_field
+        content_field = Source.content.db_field
+        terms_field = Source.possible_terms.db_field
+        result = Source._get_collection().bulk_write(
+            [
+                UpdateMany(
+                    {
+                        file_field: {"$in": file_ids},
+                        terms_field: self.id,
+                        content_field: {"$not": pattern},
+                    },
+                    {"$pull": {terms_field: self.id}},
+                ),
+                UpdateMany(
+                    {file_field: {"$in": file_ids}, content_field: pattern},
+                    {"$addToSet": {terms_field: self.id}},
+                ),
+            ]
+        )
+        return result.modified_count
+
     def to_api(self):
         """
         @apiDefine TermBankInfoModel
@@ -34,13 +34,19 @@ from app.exceptions import (
 from app.models.application import Application, ApplicationStatus
 from app.models.invitation import Invitation, InvitationStatus
 from app.models.message import Message
-from app.models.project import Project, ProjectRole, ProjectUserRelation
+from app.models.project import (
+    Project,
+    ProjectRole,
+    ProjectUserRelation,
+    default_projects_order,
+    projects_list_exclude_fields,
+)
 from app.models.site_setting import SiteSetting
 from app.models.team import Team, TeamPermission, TeamUserRelation
 from app.regexs import EMAIL_REGEX, USER_NAME_REGEX
 from app.constants.locale import Locale
 from app.utils.hash import md5
-from app.utils.mongo import mongo_order, mongo_slice
+from app.utils.mongo import mongo_keyset, mongo_order, mongo_slice
 
 
 class User(Document):
@@ -298,6 +304,7 @@ class User(Document):
         status=None,
         order_by=None,
         word: str = None,
+        cursor: list = None,
     ):
         """
         查询自己的项目
@@ -308,6 +315,7 @@ class User(Document):
         :param project_set: 所属项目集
         :param status: 项目进度
         :param word: 模糊搜索词
+        :param cursor: 游标分页时上一页最后一条的排序键值，需使用默认排序
         """
         relational_projects = (
             ProjectUserRelation.objects(user=self).scalar("group").no_dereference()
@@ -321,7 +329,7 @@ class User(Document):
         # 进一步筛选
         projects = Project.objects(
             id__in=[project.id for project in relational_projects]
-        )
+        ).exclude(*projects_list_exclude_fields)
         # 限制在某个项目集中
         if project_set:
             projects = projects.filter(project_set=project_set)
@@ -334,8 +342,12 @@ class User(Document):
         # 模糊搜索词
         if word:
             projects = projects.filter(name__icontains=word)
+        if cursor:
+            projects = projects.filter(
+                __raw__=mongo_keyset(Project, default_projects_order, cursor)
+            )
         # 排序处理
-        projects = mongo_order(projects, order_by, ["-edit_time"])
+        projects = mongo_order(projects, order_by, default_projects_order)
         projects = mongo_slice(projects, skip, limit)
         return projects
 
@@ -0,0 +1,196 @@
+"""
+缓存服务，支持进程内 LRU、Redis 和磁盘三种后端
+
+缓存的数据均通过带版本号的 key 失效（版本号记录在数据库中），
+所以每个进程各自的 LRU 缓存也不会返回过期数据
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from app.constants.cache import CacheType
+
+logger = logging.getLogger(__name__)
+
+
+class NullCacheBackend:
+    """不缓存"""
+
+    def get(self, key: str) -> Optional[Any]:
+        return None
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        pass
+
+    def delete(self, key: str):
+        pass
+
+
+class LRUCacheBackend:
+    """进程内 LRU 缓存，超出 max_size 时淘汰最久未使用的条目"""
+
+    def __init__(self, max_size: int = 1024, default_ttl: Optional[int] = None):
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self._data: OrderedDict[str, tuple[Optional[float], Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expire_at, value = item
+            if expire_at is not None and expire_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        if ttl is None:
+            ttl = self.default_ttl
+        expire_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expire_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisCacheBackend:
+    """
+    Redis 缓存，值使用 pickle 序列化
+
+    :param client: redis.Redis 或实现了 get/set/delete 的兼容对象
+    """
+
+    def __init__(self, client, prefix: str = "moeflow:", default_ttl: int = None):
+        self.client = client
+        self.prefix = prefix
+        self.default_ttl = default_ttl
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            return None
+        return pickle.loads(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        if ttl is None:
+            ttl = self.default_ttl
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=ttl or None)
+
+    def delete(self, key: str):
+        self.client.delete(self.prefix + key)
+
+
+class DiskCacheBackend:
+    """
+    磁盘缓存，每个 key 一个 pickle 文件，同一台机器上的多个进程（如 celery worker）可共享
+
+    :param directory: 缓存目录，不存在时自动创建
+    """
+
+    def __init__(self, directory: str, default_ttl: Optional[int] = None):
+        self.directory = directory
+        self.default_ttl = default_ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(
+            self.directory, hashlib.md5(key.encode("utf-8")).hexdigest()
+        )
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                expire_at, value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        if expire_at is not None and expire_at <= time.time():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        if ttl is None:
+            ttl = self.default_ttl
+        expire_at = time.time() + ttl if ttl else None
+        # 先写入临时文件再替换，避免其他进程读到不完整的文件
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((expire_at, value), f)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class Cache:
+    def __init__(self, config=None):
+        if config:
+            self.init(config)
+        else:
+            self.backend = NullCacheBackend()
+
+    def init(self, config):
+        """配置初始化"""
+        cache_type = config.get("CACHE_TYPE", CacheType.NONE)
+        ttl = config.get("CACHE_DEFAULT_TTL")
+        if cache_type == CacheType.MEMORY:
+            self.backend = LRUCacheBackend(
+                max_size=config.get("CACHE_MEMORY_MAX_SIZE", 1024), default_ttl=ttl
+            )
+        elif cache_type == CacheType.REDIS:
+            import redis
+
+            self.backend = RedisCacheBackend(
+                redis.Redis.from_url(config["CACHE_REDIS_URL"]), default_ttl=ttl
+            )
+        elif cache_type == CacheType.DISK:
+            self.backend = DiskCacheBackend(config["CACHE_DISK_DIR"], default_ttl=ttl)
+        else:
+            self.backend = NullCacheBackend()
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            return self.backend.get(key)
+        except Exception:
+            # 缓存不可用时不影响正常请求
+            logger.exception(f"cache get failed: {key}")
+            return None
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        try:
+            self.backend.set(key, value, ttl=ttl)
+        except Exception:
+            logger.exception(f"cache set failed: {key}")
+
+    def delete(self, key: str):
+        try:
+            self.backend.delete(key)
+        except Exception:
+            logger.exception(f"cache delete failed: {key}")
@@ -1,25 +1,45 @@
 """
-对接阿里云OSS储存服务
+文件储存服务
+
+支持本地储存、阿里云 OSS 和 S3 兼容的对象储存（如 MinIO），
+每种储存实现 StorageBackend 的接口，OSS 类根据配置 STORAGE_TYPE 选择后端
 """
 
-from io import BufferedReader, BytesIO, FileIO
+from abc import ABC, abstractmethod
+from io import BufferedReader, FileIO
 import os
 import re
 import shutil
 import time
 import hashlib
 import logging
-from typing import Union
+from typing import Iterable, Optional, Tuple, Union
 from urllib import parse
 
 import oss2
+import requests
 from oss2 import to_string
 from oss2.exceptions import NoSuchKey
 
 from app.constants.storage import StorageType
+from app.services.cache import LRUCacheBackend
 
 logger = logging.getLogger(__name__)
 
+# 分片上传时每个分片的默认大小（OSS 要求除最后一个分片外不小于 100KB，S3 要求不小于 5MB）
+MULTIPART_PART_SIZE = 10 * 1024 * 1024
+# S3 预签名 URL 的最长有效期
+S3_MAX_EXPIRES = 604800
+# S3 单次批量删除的最大数量
+S3_MAX_DELETE_OBJECTS = 1000
+# OSS 的 HTTP 头对应的 S3 上传参数
+S3_HEADER_ARGS = {
+    "Cache-Control": "CacheControl",
+    "Content-Disposition": "ContentDisposition",
+    "Content-Encoding": "ContentEncoding",
+    "Content-Type": "ContentType",
+}
+
 
 def md5sum(src):
     m = hashlib.md5()
@@ -46,178 +66,576 @@ def aliyun_cdn_url_auth_c(uri, key, exp):
     return "%s%s/%s/%s%s%s" % (scheme, host, hashvalue, hexexp, path, args)
 
 
-class OSS:
-    def __init__(self, config=None):
-        if config:
-            self.init(config)
-        else:
-            self.storage_type = None
-            self.auth = None
-            self.bucket = None
-            self.oss_domain = None
-            self.oss_via_cdn = None
-            self.cdn_url_key = None
+def processed_filename(filename: str, process_name: Optional[str] = None) -> str:
+    """不支持图片处理的储存中，处理后的图片（如缩略图）保存为 <处理名>-<文件名>"""
+    return (process_name + "-" if process_name is not None else "") + filename
 
-    def init(self, config):
-        """配置初始化"""
-        self.storage_type = config["STORAGE_TYPE"]
-        if self.storage_type == StorageType.OSS:
-            self.auth = oss2.Auth(
-                config["OSS_ACCESS_KEY_ID"],
-                config["OSS_ACCESS_KEY_SECRET"],
-            )
-            self.bucket = oss2.Bucket(
-                self.auth,
-                config["OSS_ENDPOINT"],
-                config["OSS_BUCKET_NAME"],
-            )
 
-            self.oss_domain = config["STORAGE_DOMAIN"]
-            self.oss_via_cdn = config["OSS_VIA_CDN"]
-            self.cdn_url_key = config["CDN_URL_KEY_A"]
+class MultipartUploadWriter:
+    """
+    分片上传的写入流，每写满一个分片即上传，关闭时完成上传
+
+    只支持顺序写入（没有 seek/tell），可以直接作为 ZipFile 的输出，
+    边生成边上传，不需要在本地保存完整文件
+
+        with OSSMultipartUploadWriter(bucket, key) as writer:
+            writer.write(data)
+
+    子类实现 _upload_part、_complete 和 _abort
+
+    :param part_size: 分片大小
+    """
+
+    def __init__(self, *, part_size=MULTIPART_PART_SIZE):
+        self.part_size = part_size
+        self.parts = []
+        self.closed = False
+        self._buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self.part_size:
+            self._write_part(bytes(self._buffer[: self.part_size]))
+            del self._buffer[: self.part_size]
+        return len(data)
+
+    def flush(self):
+        """分片需达到一定大小，只在写满或关闭时上传"""
+
+    def _write_part(self, data: bytes):
+        self.parts.append(self._upload_part(len(self.parts) + 1, data))
+
+    def _upload_part(self, part_number: int, data: bytes):
+        """上传一个分片，返回完成上传时需要的分片信息"""
+        raise NotImplementedError
+
+    def _complete(self):
+        raise NotImplementedError
+
+    def _abort(self):
+        raise NotImplementedError
+
+    def close(self):
+        """上传剩余内容并完成上传"""
+        if self.closed:
+            return
+        self.closed = True
+        # 空文件也需要一个分片
+        if self._buffer or not self.parts:
+            self._write_part(bytes(self._buffer))
+        self._complete()
+
+    def abort(self):
+        """取消上传，已上传的分片会被删除"""
+        if self.closed:
+            return
+        self.closed = True
+        self._abort()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
         else:
-            from app import STORAGE_PATH
+            self.abort()
+
+
+class OSSMultipartUploadWriter(MultipartUploadWriter):
+    """
+    OSS 分片上传的写入流
+
+    :param bucket: oss2.Bucket
+    :param key: 文件在 OSS 中的完整路径
+    :param headers: 初始化分片上传时的 HTTP 头
+    """
+
+    def __init__(
+        self, bucket, key: str, /, *, part_size=MULTIPART_PART_SIZE, headers=None
+    ):
+        super().__init__(part_size=part_size)
+        self.bucket = bucket
+        self.key = key
+        self.upload_id = bucket.init_multipart_upload(key, headers=headers).upload_id
+
+    def _upload_part(self, part_number: int, data: bytes):
+        result = self.bucket.upload_part(self.key, self.upload_id, part_number, data)
+        return oss2.models.PartInfo(part_number, result.etag)
+
+    def _complete(self):
+        self.bucket.complete_multipart_upload(self.key, self.upload_id, self.parts)
+
+    def _abort(self):
+        self.bucket.abort_multipart_upload(self.key, self.upload_id)
+
+
+class S3MultipartUploadWriter(MultipartUploadWriter):
+    """
+    S3 分片上传的写入流
 
-            self.oss_domain = config["STORAGE_DOMAIN"]
-            self.STORAGE_PATH = STORAGE_PATH
+    :param client: boto3 的 S3 client
+    :param bucket_name: 储存桶名
+    :param key: 文件的完整路径
+    :param extra_args: 初始化分片上传的其他参数，如 ContentDisposition
+    """
 
+    def __init__(
+        self,
+        client,
+        bucket_name: str,
+        key: str,
+        /,
+        *,
+        part_size=MULTIPART_PART_SIZE,
+        extra_args=None,
+    ):
+        super().__init__(part_size=part_size)
+        self.client = client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.upload_id = client.create_multipart_upload(
+            Bucket=bucket_name, Key=key, **(extra_args or {})
+        )["UploadId"]
+
+    def _upload_part(self, part_number: int, data: bytes):
+        result = self.client.upload_part(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=data,
+        )
+        return {"PartNumber": part_number, "ETag": result["ETag"]}
+
+    def _complete(self):
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts},
+        )
+
+    def _abort(self):
+        self.client.abort_multipart_upload(
+            Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id
+        )
+
+
+class ObjectStream:
+    """
+    对象储存的流式响应体，与本地储存返回的文件对象接口相同：
+    read(size)、readable()、seekable()、close() 及 with 语句
+
+    读取时才从网络接收数据，不会将整个对象保存在内存中
+
+    :param body: 响应体，如 oss2 的 GetObjectResult、botocore 的 StreamingBody
+    :param close: 关闭连接的方法，默认为 body.close
+    """
+
+    def __init__(self, body, /, *, close=None):
+        self.body = body
+        self._close = close or body.close
+        self.closed = False
+
+    def read(self, size=-1) -> bytes:
+        return self.body.read(None if size is None or size < 0 else size)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._close()
+
+    def __iter__(self):
+        return iter(self.body)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class LimitedReader:
+    """
+    只读取流的前 limit 个字节（用于本地储存的 download_range）
+
+    :param stream: 已定位到起始位置的流，关闭时一起关闭
+    :param limit: 最多读取的字节数
+    """
+
+    def __init__(self, stream, limit: int):
+        self.stream = stream
+        self.remaining = limit
+
+    def read(self, size=-1) -> bytes:
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.stream.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def close(self):
+        self.stream.close()
+
+    @property
+    def closed(self):
+        return self.stream.closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class StorageBackend(ABC):
+    """
+    储存后端的接口
+
+    文件由 path（以 / 结尾的文件夹，如 files/）和 filename 定位
+
+    :param multipart_threshold: 超过此大小的文件分片上传
+    :param part_size: 分片大小
+    :param upload_threads: 并行上传分片的线程数
+    """
+
+    # 是否支持图片处理（如 OSS 的图片样式），不支持时缩略图由 create_thumbnail_task 生成
+    supports_image_process = False
+
+    def __init__(
+        self,
+        *,
+        multipart_threshold=MULTIPART_PART_SIZE,
+        part_size=MULTIPART_PART_SIZE,
+        upload_threads=1,
+    ):
+        self.multipart_threshold = multipart_threshold
+        self.part_size = part_size
+        self.upload_threads = upload_threads
+
+    @abstractmethod
     def upload(
         self,
         path: str,
         filename: str,
-        file: Union[str, BufferedReader, FileIO],
+        file: Union[str, bytes, BufferedReader, FileIO],
         headers=None,
         progress_callback=None,
     ):
-        """上传文件"""
-        if self.storage_type == StorageType.OSS:
-            return self.bucket.put_object(
-                path + filename,
-                file,
-                headers=headers,
-                progress_callback=progress_callback,
-            )
-        else:
-            folder_path = os.path.join(self.STORAGE_PATH, path)
-            os.makedirs(folder_path, exist_ok=True)
-            if isinstance(file, BufferedReader):
-                with open(os.path.join(folder_path, filename), "wb") as saved_file:
-                    saved_file.write(file.read())
-            elif isinstance(file, str):
-                with open(os.path.join(folder_path, filename), "w") as saved_file:
-                    saved_file.write(file)
-            else:
-                file.save(
-                    os.path.join(folder_path, filename)
-                )  # XXX: what's the type of file here?
-        logging.debug("saved file : %s / %s", folder_path, filename)
+        """上传文件，str 以 utf-8 编码保存"""
+
+    @abstractmethod
+    def multipart_upload(
+        self, path: str, filename: str, file, /, *, headers=None, progress_callback=None
+    ):
+        """
+        分片上传文件，用于可能很大的文件，不将整个文件读入内存
 
+        :param file: 文件流，如打开的文件、上传的 FileStorage，需位于开头
+        :param headers: HTTP 头，本地储存不使用
+        :param progress_callback: 进度回调 (已上传字节数, 总字节数)，本地储存不使用
+        """
+
+    @abstractmethod
+    def open_upload(self, path: str, filename: str, /, *, headers=None):
+        """
+        打开一个写入流，边写入边上传，使用 with 语句关闭后完成上传
+
+            with oss.open_upload(path, filename) as writer:
+                writer.write(data)
+
+        :param headers: HTTP 头，本地储存不使用
+        """
+
+    @abstractmethod
     def download(self, path, filename: str, /, *, local_path=None):
-        """下载文件"""
-        # 如果提供local_path，则下载到本地
-        if self.storage_type == StorageType.OSS:
-            if local_path:
-                self.bucket.get_object_to_file(path + filename, local_path)
-            else:
-                return self.bucket.get_object(path + filename)
-        else:
-            folder_path = os.path.join(self.STORAGE_PATH, path)
-            file_path = os.path.join(folder_path, filename)
-            if local_path:
-                if self.is_exist(folder_path, filename):
-                    shutil.copy2(file_path, local_path)
-                else:
-                    raise NoSuchKey(status=404, headers={}, body={}, details={})
-            else:
-                with open(file_path, "rb") as file:
-                    return BytesIO(file.read())
+        """
+        下载文件
 
-    def is_exist(self, path, filename, process_name=None):
+        提供 local_path 时下载到本地，否则返回可读的流，需由调用者关闭（可使用 with 语句），
+        对象储存返回流式的响应体（ObjectStream），本地储存直接返回打开的文件，都不会复制到内存中
+        """
+
+    @abstractmethod
+    def download_range(self, path, filename: str, start: int, end: int = None):
+        """
+        下载文件的一部分，返回与 download 相同的流
+
+        :param start: 开始位置（字节）
+        :param end: 结束位置（字节，包含在内），为 None 时读到文件结尾
+        """
+
+    @abstractmethod
+    def is_exist(self, path, filename, process_name=None) -> bool:
         """检查文件是否存在"""
-        if self.storage_type == StorageType.OSS:
-            return self.bucket.object_exists(path + filename)
-        else:
-            if os.path.isabs(path):
-                return os.path.isfile(
-                    os.path.join(
-                        path,
-                        (process_name + "-" if process_name is not None else "")
-                        + filename,
-                    )
-                )
-            else:
-                return os.path.isfile(
-                    os.path.join(
-                        self.STORAGE_PATH,
-                        path,
-                        (process_name + "-" if process_name is not None else "")
-                        + filename,
-                    )
-                )
 
+    @abstractmethod
     def delete(self, path, filename: Union[str, list[str]]):
-        """（批量）删除文件"""
-        if self.storage_type == StorageType.OSS:
-            # 如果给予列表，则批量删除
-            if isinstance(filename, list):
-                if len(filename) == 0:
-                    return
-                result = self.bucket.batch_delete_objects(
-                    [path + name for name in filename]
-                )
-            else:
-                result = self.bucket.delete_object(path + filename)
-            return result
+        """（批量）删除文件，文件不存在时忽略"""
+
+    def rmdir(self, path: Union[str, list[str]]):
+        """（批量）删除空文件夹，对象储存没有文件夹，不需要删除"""
+
+    def sign_url_window(self, expires: int) -> Optional[int]:
+        """
+        同一个文件签发的 URL 可以复用的时间窗口（秒），OSS 类按窗口缓存签发结果，
+        为 None 时不缓存
+
+        :param expires: sign_url 的有效期
+        """
+        return expires
+
+    @abstractmethod
+    def sign_url(
+        self,
+        path,
+        filename,
+        expires=604800,
+        oss_domain=None,
+        download=False,
+        process_name=None,
+        **kwargs,
+    ) -> str:
+        """
+        生成客户端可以访问的 URL
+
+        :param expires: 有效期（秒）
+        :param oss_domain: 使用其他域名，仅 OSS 使用
+        :param download: 作为附件下载
+        :param process_name: 图片处理名称，如 OSS_PROCESS_COVER_NAME
+        """
+
+
+class LocalStorageBackend(StorageBackend):
+    """
+    本地储存，文件保存在 storage_path 中，由 Flask 的静态文件提供访问
+
+    :param storage_path: 储存文件夹
+    :param domain: 访问储存文件夹的 URL 前缀
+    """
+
+    def __init__(self, storage_path: str, domain: str, **kwargs):
+        super().__init__(**kwargs)
+        self.STORAGE_PATH = storage_path
+        self.oss_domain = domain
+
+    def upload(
+        self,
+        path: str,
+        filename: str,
+        file: Union[str, bytes, BufferedReader, FileIO],
+        headers=None,
+        progress_callback=None,
+    ):
+        folder_path = os.path.join(self.STORAGE_PATH, path)
+        os.makedirs(folder_path, exist_ok=True)
+        if isinstance(file, str):
+            with open(
+                os.path.join(folder_path, filename), "w", encoding="utf-8"
+            ) as saved_file:
+                saved_file.write(file)
+        elif isinstance(file, bytes):
+            with open(os.path.join(folder_path, filename), "wb") as saved_file:
+                saved_file.write(file)
         else:
-            folder_path = os.path.join(self.STORAGE_PATH, path)
-            # 如果给予列表，则批量删除
-            if isinstance(filename, list):
-                for name in filename:
-                    if self.is_exist(folder_path, name):
-                        os.remove(os.path.join(folder_path, name))
-            else:
-                if self.is_exist(folder_path, filename):
-                    os.remove(os.path.join(folder_path, filename))
+            # 打开的文件、BytesIO 或上传的 FileStorage
+            with open(os.path.join(folder_path, filename), "wb") as saved_file:
+                shutil.copyfileobj(
+                    getattr(file, "stream", file), saved_file, self.part_size
+                )
+        logging.debug("saved file : %s / %s", folder_path, filename)
 
-    def rmdir(self, path):
-        """（批量）删除文件夹，仅本地储存"""
-        if self.storage_type == StorageType.LOCAL_STORAGE:
-            # 如果给予列表，则批量删除
-            if isinstance(path, list):
-                for p in path:
-                    folder_path = os.path.join(self.STORAGE_PATH, p)
-                    if os.path.isdir(folder_path) and len(os.listdir(folder_path)) == 0:
-                        os.rmdir(folder_path)
-            else:
-                folder_path = os.path.join(self.STORAGE_PATH, path)
-                if os.path.isdir(folder_path) and len(os.listdir(folder_path)) == 0:
-                    os.rmdir(folder_path)
+    def multipart_upload(
+        self, path: str, filename: str, file, /, *, headers=None, progress_callback=None
+    ):
+        """按分片大小分块复制"""
+        stream = getattr(file, "stream", file)  # FileStorage
+        with self.open_upload(path, filename) as saved_file:
+            shutil.copyfileobj(stream, saved_file, self.part_size)
+        logging.debug("saved file : %s / %s", path, filename)
 
-    def sign_url(self, *args, **kwargs):
-        if self.storage_type == StorageType.OSS:
-            if self.oss_via_cdn:
-                return self._sign_cdn_url(*args, **kwargs)
+    def open_upload(self, path: str, filename: str, /, *, headers=None):
+        folder_path = os.path.join(self.STORAGE_PATH, path)
+        os.makedirs(folder_path, exist_ok=True)
+        return open(os.path.join(folder_path, filename), "wb")
+
+    def download(self, path, filename: str, /, *, local_path=None):
+        folder_path = os.path.join(self.STORAGE_PATH, path)
+        file_path = os.path.join(folder_path, filename)
+        if local_path:
+            if self.is_exist(folder_path, filename):
+                shutil.copy2(file_path, local_path)
             else:
-                return self._sign_oss_url(*args, **kwargs)
+                raise NoSuchKey(status=404, headers={}, body={}, details={})
         else:
-            return self._sign_local_url(*args, **kwargs)
+            return open(file_path, "rb")
+
+    def download_range(self, path, filename: str, start: int, end: int = None):
+        file = open(os.path.join(self.STORAGE_PATH, path, filename), "rb")
+        file.seek(start)
+        if end is None:
+            return file
+        return LimitedReader(file, end - start + 1)
+
+    def is_exist(self, path, filename, process_name=None):
+        return os.path.isfile(
+            os.path.join(
+                # 绝对路径不在储存文件夹中查找
+                path if os.path.isabs(path) else os.path.join(self.STORAGE_PATH, path),
+                processed_filename(filename, process_name),
+            )
+        )
+
+    def delete(self, path, filename: Union[str, list[str]]):
+        folder_path = os.path.join(self.STORAGE_PATH, path)
+        # 如果给予列表，则批量删除
+        for name in filename if isinstance(filename, list) else [filename]:
+            if self.is_exist(folder_path, name):
+                os.remove(os.path.join(folder_path, name))
 
-    def _sign_local_url(
+    def rmdir(self, path: Union[str, list[str]]):
+        # 如果给予列表，则批量删除
+        for p in path if isinstance(path, list) else [path]:
+            folder_path = os.path.join(self.STORAGE_PATH, p)
+            if os.path.isdir(folder_path) and len(os.listdir(folder_path)) == 0:
+                os.rmdir(folder_path)
+
+    def sign_url(
         self,
         path,
         filename,
         expires=604800,
         oss_domain=None,
+        download=False,
         process_name=None,
         **kwargs,
     ):
-        return (
-            self.oss_domain
-            + path
-            + (process_name + "-" if process_name is not None else "")
-            + filename
+        return self.oss_domain + path + processed_filename(filename, process_name)
+
+
+class OSSStorageBackend(StorageBackend):
+    """
+    阿里云 OSS
+
+    :param bucket: oss2.Bucket
+    :param domain: 访问 OSS 的域名，绑定了 CDN 时为 CDN 的域名
+    :param via_cdn: 通过 CDN 的 URL 鉴权生成 URL，而不是 OSS 的 URL 签名
+    :param cdn_url_key: CDN URL 鉴权的 KEY
+    """
+
+    supports_image_process = True
+
+    def __init__(
+        self, bucket, domain: str, *, via_cdn=False, cdn_url_key=None, **kwargs
+    ):
+        super().__init__(**kwargs)
+        self.bucket = bucket
+        self.oss_domain = domain
+        self.oss_via_cdn = via_cdn
+        self.cdn_url_key = cdn_url_key
+
+    def upload(
+        self,
+        path: str,
+        filename: str,
+        file: Union[str, bytes, BufferedReader, FileIO],
+        headers=None,
+        progress_callback=None,
+    ):
+        return self.bucket.put_object(
+            path + filename,
+            file,
+            headers=headers,
+            progress_callback=progress_callback,
         )
 
+    def multipart_upload(
+        self, path: str, filename: str, file, /, *, headers=None, progress_callback=None
+    ):
+        """
+        有本地路径的文件使用 oss2.resumable_upload（断点续传，多线程上传分片），
+        其他文件流逐个分片上传，小于 multipart_threshold 时直接上传
+        """
+        stream = getattr(file, "stream", file)  # FileStorage
+        local_path = getattr(stream, "name", None)
+        if isinstance(local_path, str) and os.path.isfile(local_path):
+            return oss2.resumable_upload(
+                self.bucket,
+                path + filename,
+                local_path,
+                headers=headers,
+                multipart_threshold=self.multipart_threshold,
+                part_size=self.part_size,
+                progress_callback=progress_callback,
+                num_threads=self.upload_threads,
+            )
+        head = stream.read(self.multipart_threshold)
+        if len(head) < self.multipart_threshold:
+            return self.bucket.put_object(
+                path + filename,
+                head,
+                headers=headers,
+                progress_callback=progress_callback,
+            )
+        with self.open_upload(path, filename, headers=headers) as writer:
+            writer.write(head)
+            shutil.copyfileobj(stream, writer, self.part_size)
+        logging.debug("saved file : %s / %s", path, filename)
+
+    def open_upload(self, path: str, filename: str, /, *, headers=None):
+        return OSSMultipartUploadWriter(
+            self.bucket, path + filename, part_size=self.part_size, headers=headers
+        )
+
+    def download(self, path, filename: str, /, *, local_path=None):
+        if local_path:
+            self.bucket.get_object_to_file(path + filename, local_path)
+        else:
+            result = self.bucket.get_object(path + filename)
+            return ObjectStream(result, close=result.resp.response.close)
+
+    def download_range(self, path, filename: str, start: int, end: int = None):
+        result = self.bucket.get_object(path + filename, byte_range=(start, end))
+        return ObjectStream(result, close=result.resp.response.close)
+
+    def is_exist(self, path, filename, process_name=None):
+        """OSS 的图片处理不保存文件，只检查原文件"""
+        return self.bucket.object_exists(path + filename)
+
+    def delete(self, path, filename: Union[str, list[str]]):
+        # 如果给予列表，则批量删除
+        if isinstance(filename, list):
+            if len(filename) == 0:
+                return
+            return self.bucket.batch_delete_objects([path + name for name in filename])
+        return self.bucket.delete_object(path + filename)
+
+    def sign_url_window(self, expires: int) -> Optional[int]:
+        """过期时间已对齐到 expires 的整数倍，同一窗口内签发的 URL 相同"""
+        return expires
+
+    def sign_url(self, *args, **kwargs):
+        if self.oss_via_cdn:
+            return self._sign_cdn_url(*args, **kwargs)
+        else:
+            return self._sign_oss_url(*args, **kwargs)
+
     def _sign_cdn_url(
         self,
         path,
@@ -277,3 +695,374 @@ class OSS:
             method, oss_domain + parse.quote(key), headers=headers, params=params
         )
         return self.bucket.auth._sign_url(req, self.bucket.bucket_name, key, expires)
+
+
+def _is_s3_not_found(error: Exception) -> bool:
+    """botocore 的 ClientError 是否表示对象不存在"""
+    code = getattr(error, "response", {}).get("Error", {}).get("Code")
+    return code in ("404", "NoSuchKey", "NotFound")
+
+
+class S3StorageBackend(StorageBackend):
+    """
+    S3 兼容的对象储存（如 AWS S3、MinIO），不支持图片处理，缩略图保存为 <处理名>-<文件名>
+
+    :param client: boto3 的 S3 client，client 是线程安全的，连接池大小由其配置决定
+    :param bucket_name: 储存桶名
+    :param transfer_config: boto3.s3.transfer.TransferConfig，用于 multipart_upload
+    """
+
+    def __init__(self, client, bucket_name: str, *, transfer_config=None, **kwargs):
+        super().__init__(**kwargs)
+        self.client = client
+        self.bucket_name = bucket_name
+        self.transfer_config = transfer_config
+
+    @staticmethod
+    def _extra_args(headers) -> dict:
+        """将 OSS 风格的 HTTP 头转换为 S3 的上传参数，不支持的头会被忽略"""
+        extra_args = {}
+        for name, value in (headers or {}).items():
+            if name in S3_HEADER_ARGS:
+                if isinstance(value, bytes):
+                    value = value.decode("utf-8")
+                extra_args[S3_HEADER_ARGS[name]] = value
+        return extra_args
+
+    def _get_object(self, key: str, **kwargs):
+        """
+        获取对象
+
+        :raise FileNotFoundError: 对象不存在
+        """
+        try:
+            return self.client.get_object(Bucket=self.bucket_name, Key=key, **kwargs)
+        except Exception as e:
+            if _is_s3_not_found(e):
+                raise FileNotFoundError(key) from e
+            raise
+
+    def upload(
+        self,
+        path: str,
+        filename: str,
+        file: Union[str, bytes, BufferedReader, FileIO],
+        headers=None,
+        progress_callback=None,
+    ):
+        if isinstance(file, str):
+            file = file.encode("utf-8")
+        return self.client.put_object(
+            Bucket=self.bucket_name,
+            Key=path + filename,
+            Body=getattr(file, "stream", file),
+            **self._extra_args(headers),
+        )
+
+    def multipart_upload(
+        self, path: str, filename: str, file, /, *, headers=None, progress_callback=None
+    ):
+        """使用 boto3 的 upload_fileobj，超过阈值时多线程上传分片"""
+        callback = None
+        if progress_callback is not None:
+            consumed = 0
+
+            def callback(bytes_amount):
+                # boto3 回调本次上传的字节数，转换为 OSS 风格的累计字节数
+                nonlocal consumed
+                consumed += bytes_amount
+                progress_callback(consumed, None)
+
+        kwargs = {"Config": self.transfer_config} if self.transfer_config else {}
+        self.client.upload_fileobj(
+            getattr(file, "stream", file),  # FileStorage
+            self.bucket_name,
+            path + filename,
+            ExtraArgs=self._extra_args(headers),
+            Callback=callback,
+            **kwargs,
+        )
+        logging.debug("saved file : %s / %s", path, filename)
+
+    def open_upload(self, path: str, filename: str, /, *, headers=None):
+        return S3MultipartUploadWriter(
+            self.client,
+            self.bucket_name,
+            path + filename,
+            part_size=self.part_size,
+            extra_args=self._extra_args(headers),
+        )
+
+    def download(self, path, filename: str, /, *, local_path=None):
+        """:raise FileNotFoundError: 文件不存在"""
+        if local_path:
+            try:
+                self.client.download_file(self.bucket_name, path + filename, local_path)
+            except Exception as e:
+                if _is_s3_not_found(e):
+                    raise FileNotFoundError(path + filename) from e
+                raise
+        else:
+            return ObjectStream(self._get_object(path + filename)["Body"])
+
+    def download_range(self, path, filename: str, start: int, end: int = None):
+        byte_range = f"bytes={start}-{'' if end is None else end}"
+        return ObjectStream(self._get_object(path + filename, Range=byte_range)["Body"])
+
+    def is_exist(self, path, filename, process_name=None):
+        try:
+            self.client.head_object(
+                Bucket=self.bucket_name,
+                Key=path + processed_filename(filename, process_name),
+            )
+        except Exception as e:
+            if _is_s3_not_found(e):
+                return False
+            raise
+        return True
+
+    def delete(self, path, filename: Union[str, list[str]]):
+        # 如果给予列表，则批量删除，每次请求最多删除 1000 个
+        if isinstance(filename, list):
+            for i in range(0, len(filename), S3_MAX_DELETE_OBJECTS):
+                self.client.delete_objects(
+                    Bucket=self.bucket_name,
+                    Delete={
+                        "Objects": [
+                            {"Key": path + name}
+                            for name in filename[i : i + S3_MAX_DELETE_OBJECTS]
+                        ],
+                        "Quiet": True,
+                    },
+                )
+        else:
+            self.client.delete_object(Bucket=self.bucket_name, Key=path + filename)
+
+    def sign_url_window(self, expires: int) -> Optional[int]:
+        """预签名 URL 包含签发时间，在有效期的前一半内复用"""
+        return min(expires, S3_MAX_EXPIRES) // 2
+
+    def sign_url(
+        self,
+        path,
+        filename,
+        expires=604800,
+        oss_domain=None,
+        download=False,
+        process_name=None,
+        **kwargs,
+    ):
+        """预签名 URL，签名包含域名，所以使用 client 的 endpoint，有效期最长 7 天"""
+        # sign_url_window 保证复用的 URL 至少还有一半有效期
+        params = {
+            "Bucket": self.bucket_name,
+            "Key": path + processed_filename(filename, process_name),
+        }
+        if download:
+            params["ResponseContentDisposition"] = "attachment"
+        return self.client.generate_presigned_url(
+            "get_object", Params=params, ExpiresIn=min(expires, S3_MAX_EXPIRES)
+        )
+
+
+def _oss_session(pool_size: int) -> oss2.Session:
+    """创建 oss2 的 Session，连接池大小与并行下载/上传的线程数匹配"""
+    session = oss2.Session()
+    for prefix in ("http://", "https://"):
+        session.session.mount(
+            prefix,
+            requests.adapters.HTTPAdapter(
+                pool_connections=pool_size, pool_maxsize=pool_size
+            ),
+        )
+    return session
+
+
+class OSS:
+    """
+    文件储存服务，根据配置 STORAGE_TYPE 选择储存后端，方法见 StorageBackend
+    """
+
+    def __init__(self, config=None):
+        if config:
+            self.init(config)
+        else:
+            self.storage_type = None
+            self.backend: Optional[StorageBackend] = None
+            self.url_cache = None
+
+    def init(self, config):
+        """配置初始化"""
+        self.storage_type = config["STORAGE_TYPE"]
+        # 签发的 URL 按时间窗口缓存，列表中的每个文件不用重新计算签名
+        cache_size = config["STORAGE_SIGN_URL_CACHE_SIZE"]
+        self.url_cache = LRUCacheBackend(max_size=cache_size) if cache_size else None
+        kwargs = {
+            "multipart_threshold": config["STORAGE_MULTIPART_THRESHOLD"],
+            "part_size": config["STORAGE_PART_SIZE"],
+            "upload_threads": config["STORAGE_UPLOAD_THREADS"],
+        }
+        if self.storage_type == StorageType.OSS:
+            bucket = oss2.Bucket(
+                oss2.Auth(
+                    config["OSS_ACCESS_KEY_ID"],
+                    config["OSS_ACCESS_KEY_SECRET"],
+                ),
+                config["OSS_ENDPOINT"],
+                config["OSS_BUCKET_NAME"],
+                session=_oss_session(config["STORAGE_POOL_SIZE"]),
+            )
+            self.backend = OSSStorageBackend(
+                bucket,
+                config["STORAGE_DOMAIN"],
+                via_cdn=config["OSS_VIA_CDN"],
+                cdn_url_key=config["CDN_URL_KEY_A"],
+                **kwargs,
+            )
+        elif self.storage_type == StorageType.S3:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+
+            client = boto3.client(
+                "s3",
+                endpoint_url=config["S3_ENDPOINT_URL"] or None,
+                region_name=config["S3_REGION"] or None,
+                aws_access_key_id=config["S3_ACCESS_KEY_ID"],
+                aws_secret_access_key=config["S3_SECRET_ACCESS_KEY"],
+                config=Config(
+                    max_pool_connections=config["STORAGE_POOL_SIZE"],
+                    s3={"addressing_style": config["S3_ADDRESSING_STYLE"]},
+                ),
+            )
+            self.backend = S3StorageBackend(
+                client,
+                config["S3_BUCKET_NAME"],
+                transfer_config=TransferConfig(
+                    multipart_threshold=config["STORAGE_MULTIPART_THRESHOLD"],
+                    multipart_chunksize=config["STORAGE_PART_SIZE"],
+                    max_concurrency=config["STORAGE_UPLOAD_THREADS"],
+                ),
+                **kwargs,
+            )
+        else:
+            from app import STORAGE_PATH
+
+            self.backend = LocalStorageBackend(
+                STORAGE_PATH, config["STORAGE_DOMAIN"], **kwargs
+            )
+
+    @property
+    def supports_image_process(self) -> bool:
+        return self.backend.supports_image_process
+
+    def upload(
+        self,
+        path: str,
+        filename: str,
+        file: Union[str, bytes, BufferedReader, FileIO],
+        headers=None,
+        progress_callback=None,
+    ):
+        """上传文件"""
+        return self.backend.upload(
+            path, filename, file, headers=headers, progress_callback=progress_callback
+        )
+
+    def multipart_upload(
+        self, path: str, filename: str, file, /, *, headers=None, progress_callback=None
+    ):
+        """分片上传文件"""
+        return self.backend.multipart_upload(
+            path, filename, file, headers=headers, progress_callback=progress_callback
+        )
+
+    def open_upload(self, path: str, filename: str, /, *, headers=None):
+        """打开一个边写入边上传的写入流"""
+        return self.backend.open_upload(path, filename, headers=headers)
+
+    def download(self, path, filename: str, /, *, local_path=None):
+        """下载文件，不提供 local_path 时返回需由调用者关闭的流"""
+        return self.backend.download(path, filename, local_path=local_path)
+
+    def download_range(self, path, filename: str, start: int, end: int = None):
+        """下载文件的一部分"""
+        return self.backend.download_range(path, filename, start, end)
+
+    def is_exist(self, path, filename, process_name=None):
+        """检查文件是否存在"""
+        return self.backend.is_exist(path, filename, process_name=process_name)
+
+    def delete(self, path, filename: Union[str, list[str]]):
+        """（批量）删除文件"""
+        return self.backend.delete(path, filename)
+
+    def rmdir(self, path):
+        """（批量）删除空文件夹，仅本地储存"""
+        return self.backend.rmdir(path)
+
+    def sign_url(
+        self,
+        path: str,
+        filename: str,
+        /,
+        *,
+        expires=604800,
+        process_name=None,
+        **kwargs,
+    ) -> str:
+        """
+        生成客户端可以访问的 URL，同一时间窗口内的结果会被缓存（见 sign_urls）
+
+        :param process_name: 图片处理名称，如 OSS_PROCESS_COVER_NAME
+        :param kwargs: 其他参数，如 download=True，见 StorageBackend.sign_url
+        """
+        return self.sign_urls(
+            [(path, filename, process_name)], expires=expires, **kwargs
+        )[0]
+
+    def sign_urls(
+        self,
+        files: Iterable[Tuple[str, str, Optional[str]]],
+        /,
+        *,
+        expires=604800,
+        **kwargs,
+    ) -> list[str]:
+        """
+        批量生成 URL，使用相同的参数和时间窗口，只为缓存中没有的文件计算签名
+
+            url, cover_url = oss.sign_urls(
+                [(prefix, save_name, None), (prefix, save_name, "cover")]
+            )
+
+        :param files: (path, filename, process_name) 的列表
+        :param expires: 有效期（秒）
+        :param kwargs: 其他参数，如 download=True，见 StorageBackend.sign_url
+        """
+        window = self.backend.sign_url_window(expires)
+        try:
+            options = tuple(sorted(kwargs.items()))
+            hash(options)
+        except TypeError:
+            # headers、params 等不能作为缓存的 key
+            window = None
+        if self.url_cache is None or not window:
+            return [
+                self.backend.sign_url(
+                    path, filename, expires=expires, process_name=process_name, **kwargs
+                )
+                for path, filename, process_name in files
+            ]
+        bucket = int(time.time()) // window
+        urls = []
+        for path, filename, process_name in files:
+            key = (path, filename, process_name, expires, bucket, options)
+            url = self.url_cache.get(key)
+            if url is None:
+                url = self.backend.sign_url(
+                    path, filename, expires=expires, process_name=process_name, **kwargs
+                )
+                self.url_cache.set(key, url)
+            urls.append(url)
+        return urls
@@ -0,0 +1,89 @@
+"""
+术语库匹配器缓存
+
+每个术语库编译一个 TermMatcher，以术语库的 version 作为缓存 key 的一部分，
+术语增删改时 version 增加，旧的匹配器自然失效。先查进程内 LRU，再查共享缓存
+（cache 服务，使用 redis/disk 时多个 celery worker 可复用），都没有才重新编译
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from app.services.cache import Cache, LRUCacheBackend
+from app.utils.term_matcher import TermMatcher
+
+logger = logging.getLogger(__name__)
+
+
+class TermIndex:
+    def __init__(self, config=None, shared: Optional[Cache] = None):
+        self.memory = LRUCacheBackend()
+        self.shared = shared
+        self._lock = threading.Lock()
+        self.reset_metrics()
+        if config:
+            self.init(config, shared)
+
+    def init(self, config, shared: Optional[Cache] = None):
+        """配置初始化"""
+        self.memory = LRUCacheBackend(
+            max_size=config.get("TERM_INDEX_MEMORY_MAX_SIZE", 64)
+        )
+        self.shared = shared
+
+    def get(
+        self, term_bank_id: Any, version: int, build: Callable[[], TermMatcher]
+    ) -> TermMatcher:
+        """
+        获取术语库的匹配器
+
+        :param term_bank_id: 术语库 id
+        :param version: 术语库的版本
+        :param build: 缓存未命中时用于编译匹配器的函数
+        """
+        key = f"term_index:{term_bank_id}:{version}"
+        matcher = self.memory.get(key)
+        if matcher is not None:
+            self._count("memory_hits")
+            return matcher
+        if self.shared is not None:
+            matcher = self.shared.get(key)
+            if matcher is not None:
+                self._count("shared_hits")
+                self.memory.set(key, matcher)
+                return matcher
+        self._count("misses")
+        start = time.perf_counter()
+        matcher = build()
+        seconds = time.perf_counter() - start
+        with self._lock:
+            self._metrics["rebuild_seconds"] += seconds
+        logger.debug(
+            f"term index rebuilt: {key} ({len(matcher)} terms, {seconds:.3f}s)"
+        )
+        self.memory.set(key, matcher)
+        if self.shared is not None:
+            self.shared.set(key, matcher)
+        return matcher
+
+    def _count(self, name: str):
+        with self._lock:
+            self._metrics[name] += 1
+
+    def metrics(self) -> dict:
+        """
+        缓存统计：memory_hits（进程内命中）、shared_hits（共享缓存命中）、
+        misses（未命中，即编译次数）、rebuild_seconds（编译总耗时）
+        """
+        with self._lock:
+            return dict(self._metrics)
+
+    def reset_metrics(self):
+        self._metrics = {
+            "memory_hits": 0,
+            "shared_hits": 0,
+            "misses": 0,
+            "rebuild_seconds": 0.0,
+        }
@@ -2,20 +2,22 @@
 对上传的文件进行预处理
 """
 
+import codecs
 import datetime
-import re
+import itertools
 import uuid
 
-import chardet
 from aliyunsdkcore import client
 from aliyunsdkcore.profile import region_provider
 from aliyunsdkcore.request import RoaRequest
 from celery.exceptions import MaxRetriesExceededError
 from flask import json
+from pymongo import UpdateOne
 
 from app import celery
 from app import oss
 from app.models import connect_db
+from app.core.counter_buffer import counter_buffer
 from app.constants.file import (
     FileNotExistReason,
     FileSafeStatus,
@@ -25,8 +27,16 @@ from app.constants.file import (
     ParseStatus,
 )
 from app.utils.logging import logger
+from app.utils.text import CountingReader, detect_charset, iter_lines
 from . import SyncResult
 
+# 解析文本时每批写入的原文数量
+PARSE_TEXT_BATCH_SIZE = 1000
+# 用于检测字符集的文件开头字节数
+PARSE_TEXT_DETECT_BYTES = 64 * 1024
+# 项目寻找术语时每批处理的原文数量
+FIND_TERMS_BATCH_SIZE = 1000
+
 
 @celery.task(name="tasks.parse_text_task", time_limit=1200)
 def parse_text_task(file_id, old_revision_id=None):
@@ -40,6 +50,7 @@ def parse_text_task(file_id, old_revision_id=None):
     from app.models.file import File
     from app.models.project import Project
     from app.models.team import Team
+    from app.models.term import Term
     from app.models.user import User
 
     (Project, Team, User)
@@ -64,11 +75,12 @@ def parse_text_task(file_id, old_revision_id=None):
     file.update(
         parse_status=ParseStatus.PARSING,
         parse_start_time=datetime.datetime.utcnow(),
+        parse_percent=0,
     )
-    # 下载文件，并获取内容
-    text_file = oss.download(oss_file_prefix, file.save_name)
+    # 下载文件，读取开头部分用于检测字符集
     try:
-        text = text_file.read()
+        text_file = CountingReader(oss.download(oss_file_prefix, file.save_name))
+        head = text_file.read(PARSE_TEXT_DETECT_BYTES)
     except Exception as e:
         file.update(
             parse_status=ParseStatus.PARSE_FAILED,
@@ -77,11 +89,12 @@ def parse_text_task(file_id, old_revision_id=None):
         )
         logger.error(e)
         return f"失败：文件损坏 (File<{file.id}>)"
-        # 检测字符集
-    text_charset = chardet.detect(text)["encoding"]
+    # 检测字符集
+    text_charset = detect_charset(head)
     try:
-        text = text.decode(text_charset)
-    except Exception as e:
+        codecs.lookup(text_charset)
+    except (TypeError, LookupError) as e:
+        text_file.close()
         file.update(
             parse_status=ParseStatus.PARSE_FAILED,
             inc__parse_times=1,
@@ -89,27 +102,60 @@ def parse_text_task(file_id, old_revision_id=None):
         )
         logger.error(e)
         return f"失败：字符集转换失败 (File<{file.id}>)"
-    lines = re.split(r"\n|\r\n|\r", text)
-    # 为文件生成翻译原文
-    for key, line in enumerate(lines):
-        source = file.create_source(line, rank=key)
-        # 如果为空内容，则不进行下步操作
-        if source.blank:
-            continue
-        # 如果有旧修订版则将相同的翻译拷贝给新的
-        if old_revision and old_revision != file:
-            old_source = old_revision.sources().filter(content=line).first()
-            # 如果有旧的一模一样的原文
-            if old_source:
-                source.copy(old_source)
-        # 寻找术语并添加
-        source.find_terms()
+    lines = iter_lines(text_file, text_charset, head=head)
+    total_bytes = max(file.file_size * 1024, 1)  # file_size 单位为 KB
+    # 如果有旧修订版则将相同的翻译拷贝给新的，一次取出旧原文
+    old_sources = {}
+    if old_revision and old_revision != file:
+        old_sources = old_revision.sources_by_content()
+    # 术语匹配器只构建一次，所有原文复用
+    term_matcher = Term.matcher(file.project.term_banks)
+    # 边解码边分批生成翻译原文，计数缓存合并后统一写入
+    try:
+        with counter_buffer():
+            rank = 0
+            while batch := list(itertools.islice(lines, PARSE_TEXT_BATCH_SIZE)):
+                sources = file.create_sources_bulk(batch, start_rank=rank)
+                rank += len(batch)
+                for source in sources:
+                    # 如果为空内容，则不进行下步操作
+                    if source.blank:
+                        continue
+                    # 如果有旧的一模一样的原文
+                    old_source = old_sources.get(source.content)
+                    if old_source:
+                        source.copy(old_source)
+                    # 寻找术语并添加
+                    source.find_terms(term_matcher)
+                # 汇报进度，文件读完前最多为 99
+                file.update(
+                    parse_percent=min(text_file.read_bytes * 100 // total_bytes, 99)
+                )
+    except (UnicodeDecodeError, OSError) as e:
+        # 中途解码或读取失败，清除已生成的原文（计数缓存已在上面写入）
+        file.reload()
+        file.clear_all_sources()
+        file.update(
+            parse_status=ParseStatus.PARSE_FAILED,
+            inc__parse_times=1,
+            parse_error_type=(
+                ParseErrorType.TEXT_UNKNOWN_CHARSET
+                if isinstance(e, UnicodeDecodeError)
+                else ParseErrorType.FILE_CAN_NOT_READ
+            ),
+        )
+        logger.error(e)
+        return f"失败：字符集转换失败 (File<{file.id}>)"
+    finally:
+        text_file.close()
     # 将File设置成处理成功，并清理task_id/开始时间/解析次数
     file.update(
         parse_status=ParseStatus.PARSE_SUCCEEDED,
+        parse_percent=100,
         unset__parse_times=1,
         unset__parse_task_id=1,
         unset__parse_start_time=1,
+        inc__translator_version=1,
     )
     return f"成功：File<{file_id}>"
 
@@ -321,7 +367,7 @@ def find_terms_task(file_id):
     from app.models.term import Term
     from app.models.user import User
 
-    (Project, Team, Term, User)
+    (Project, Team, User)
     # 配置
     connect_db(celery.conf.app_config)
     # 获取file
@@ -336,8 +382,9 @@ def find_terms_task(file_id):
         find_terms_status=FindTermsStatus.FINDING,
         find_terms_start_time=datetime.datetime.utcnow(),
     )
+    term_matcher = Term.matcher(file.project.term_banks)
     for source in file.sources()():
-        source.find_terms()
+        source.find_terms(term_matcher)
     # 将File设置成处理成功，并清理task_id/开始时间/解析次数
     file.update(
         find_terms_status=FindTermsStatus.FINISHED,
@@ -355,3 +402,148 @@ def find_terms(file_id, /, *, run_sync=False):
     else:
         # 异步执行
         return find_terms_task.delay(file_id)
+
+
+@celery.task(name="tasks.find_project_terms_task", time_limit=3600)
+def find_project_terms_task(project_id):
+    """
+    为项目所有激活的文本文件的source寻找术语
+
+    分批读取原文，使用编译好的术语匹配器匹配，只将有变化的原文通过 bulk_write 写入，
+    并记录项目的寻找进度
+
+    :param project_id: 传入Project的Id(str or ObjectId)
+    :return:
+    """
+    from app.models.file import File
+    from app.models.project import Project
+    from app.models.team import Team
+    from app.models.term import Term
+    from app.models.user import User
+
+    (Team, User)
+    # 配置
+    connect_db(celery.conf.app_config)
+    project = Project.objects(id=project_id).first()
+    if project is None:
+        return f"跳过：项目不存在，Project <{project_id}>"
+    if project.find_terms_status == FindTermsStatus.FINDING:
+        return f"跳过：项目寻找术语中，Project <{project_id}>"
+    # 与增量更新（Term.rematch）相同，只处理激活的文本文件
+    files = File.term_files(project)
+    file_ids = list(files.scalar("id"))
+    # 将项目和所有File设置成寻找术语中，并设置开始时间
+    project.update(find_terms_status=FindTermsStatus.FINDING, find_terms_percent=0)
+    files.update(
+        find_terms_status=FindTermsStatus.FINDING,
+        find_terms_start_time=datetime.datetime.utcnow(),
+    )
+    try:
+        done = _find_sources_terms(file_ids, Term.matcher(project.term_banks), project)
+    except Exception as e:
+        logger.exception(e)
+        # 恢复为排队中，并提示项目重新寻找术语，避免一直停留在寻找中
+        files.update(
+            find_terms_status=FindTermsStatus.QUEUING,
+            unset__find_terms_start_time=1,
+        )
+        project.update(
+            find_terms_status=FindTermsStatus.QUEUING,
+            find_terms_percent=0,
+            need_find_terms=True,
+        )
+        return f"失败：已提示项目重新寻找术语，Project <{project_id}>"
+    # 将项目和File设置成处理成功，并清理task_id/开始时间
+    files.update(
+        find_terms_status=FindTermsStatus.FINISHED,
+        unset__find_terms_task_id=1,
+        unset__find_terms_start_time=1,
+    )
+    project.update(find_terms_status=FindTermsStatus.FINISHED, find_terms_percent=100)
+    return f"成功：{done} 个原文，Project<{project_id}>"
+
+
+def _find_sources_terms(file_ids, term_matcher, project) -> int:
+    """
+    分批为文件的原文寻找术语，只写入有变化的原文，并记录项目的寻找进度
+
+    :return: 处理的原文数量
+    """
+    from app.models.file import Source
+
+    collection = Source._get_collection()
+    file_field = Source.file.db_field
+    content_field = Source.content.db_field
+    terms_field = Source.possible_terms.db_field
+    query = {file_field: {"$in": file_ids}}
+    total = collection.count_documents(query)
+    cursor = collection.find(
+        query, {content_field: 1, terms_field: 1}, batch_size=FIND_TERMS_BATCH_SIZE
+    )
+    done = 0
+    while batch := list(itertools.islice(cursor, FIND_TERMS_BATCH_SIZE)):
+        operations = []
+        for source in batch:
+            possible_terms = term_matcher.match(source.get(content_field, ""))
+            if possible_terms != source.get(terms_field, []):
+                operations.append(
+                    UpdateOne(
+                        {"_id": source["_id"]}, {"$set": {terms_field: possible_terms}}
+                    )
+                )
+        if operations:
+            collection.bulk_write(operations, ordered=False)
+        done += len(batch)
+        project.update(find_terms_percent=done * 100 // total)
+    return done
+
+
+def find_project_terms(project_id, /, *, run_sync=False):
+    if run_sync:
+        # 同步执行
+        find_project_terms_task(project_id)
+        return SyncResult()
+    else:
+        # 异步执行
+        return find_project_terms_task.delay(project_id)
+
+
+@celery.task(name="tasks.match_term_task", time_limit=1200)
+def match_term_task(term_id):
+    """
+    使用新增或修改了原文的一个术语，增量更新相关原文的可能术语
+
+    失败时提示使用此术语库的项目需要重新寻找所有术语
+
+    :param term_id: 传入Term的Id(str or ObjectId)
+    :return:
+    """
+    from app.models.file import File
+    from app.models.project import Project
+    from app.models.team import Team
+    from app.models.term import Term
+    from app.models.user import User
+
+    (File, Team, User)
+    # 配置
+    connect_db(celery.conf.app_config)
+    term = Term.objects(id=term_id).first()
+    if term is None:
+        return f"跳过：术语不存在，Term <{term_id}>"
+    try:
+        count = term.rematch()
+    except Exception as e:
+        logger.exception(e)
+        Project.objects(_term_banks=term.term_bank).update(need_find_terms=True)
+        return f"失败：已提示项目重新寻找术语，Term <{term_id}>"
+    return f"成功：更新 {count} 个原文，Term <{term_id}>"
+
+
+def match_term(term_id, /, *, run_sync=False):
+    if run_sync:
+        # 同步执行
+        match_term_task(term_id)
+        return SyncResult()
+    else:
+        # 异步执行
+        return match_term_task.delay(term_id)
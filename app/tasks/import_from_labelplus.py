@@ -2,23 +2,80 @@
 导出项目
 """
 
+import time
+
 from app.constants.project import (
     ImportFromLabelplusErrorType,
     ImportFromLabelplusStatus,
 )
 from flask import Flask
 
-from app import celery
+from app import celery, oss
 
 from app.models import connect_db
 from . import SyncResult, _FORCE_SYNC_TASK
 from celery.utils.log import get_task_logger
-from app.utils.labelplus import load_from_labelplus
-from app.constants.source import SourcePositionType
+from app.utils.labelplus import (
+    iter_labelplus,
+    iter_labelplus_lines,
+    validate_labelplus,
+)
 from celery.result import AsyncResult
 
 logger = get_task_logger(__name__)
 
+# 每批导入的文件数量
+IMPORT_FROM_LABELPLUS_BATCH_SIZE = 50
+# 导入进度的最短更新间隔（秒）
+IMPORT_FROM_LABELPLUS_PROGRESS_INTERVAL = 1
+
+
+class _ProgressReporter:
+    """记录导入进度，进度变化且距上次更新超过间隔时才写入数据库"""
+
+    def __init__(self, project, file_count: int):
+        self.project = project
+        self.file_count = file_count
+        self.percent = 0
+        self.last_time = time.monotonic()
+
+    def report(self, imported_count: int):
+        percent = int(imported_count / self.file_count * 100)
+        now = time.monotonic()
+        if (
+            percent == self.percent
+            or now - self.last_time < IMPORT_FROM_LABELPLUS_PROGRESS_INTERVAL
+        ):
+            return
+        self.percent = percent
+        self.last_time = now
+        self.project.update(import_from_labelplus_percent=percent)
+
+
+def _open_labelplus(project):
+    """逐行读取等待导入的文本，兼容直接保存在项目上的旧数据"""
+    if project.import_from_labelplus_save_name:
+        return _iter_saved_labelplus(project.import_from_labelplus_save_name)
+    return project.import_from_labelplus_txt
+
+
+def _iter_saved_labelplus(save_name):
+    """从储存服务中逐行读取，读完后关闭"""
+    with oss.download(celery.conf.app_config["OSS_IMPORT_PREFIX"], save_name) as stream:
+        yield from iter_labelplus_lines(stream)
+
+
+def _finish(project, **kwargs):
+    """删除等待导入的文本，并更新导入状态"""
+    if project.import_from_labelplus_save_name:
+        oss.delete(
+            celery.conf.app_config["OSS_IMPORT_PREFIX"],
+            project.import_from_labelplus_save_name,
+        )
+    project.update(
+        import_from_labelplus_txt="", import_from_labelplus_save_name="", **kwargs
+    )
+
 
 @celery.task(name="tasks.import_from_labelplus_task")
 def import_from_labelplus_task(project_id):
@@ -33,6 +90,7 @@ def import_from_labelplus_task(project_id):
 
     (Project, Team)
     connect_db(celery.conf.app_config)
+    oss.init(celery.conf.app_config)
     app = Flask(__name__)
     app.config.from_object(celery.conf.app_config)
 
@@ -42,15 +100,15 @@ def import_from_labelplus_task(project_id):
     target = project.targets().first()
     creator = project.users(role=project.role_cls.by_system_code("creator")).first()
     if target is None:
-        project.update(
-            import_from_labelplus_txt="",
+        _finish(
+            project,
             import_from_labelplus_status=ImportFromLabelplusStatus.ERROR,
             import_from_labelplus_error_type=ImportFromLabelplusErrorType.NO_TARGET,
         )
         return f"失败：目标语言不存在，Project {project_id}"
     if creator is None:
-        project.update(
-            import_from_labelplus_txt="",
+        _finish(
+            project,
             import_from_labelplus_status=ImportFromLabelplusStatus.ERROR,
             import_from_labelplus_error_type=ImportFromLabelplusErrorType.NO_CREATOR,
         )
@@ -61,37 +119,26 @@ def import_from_labelplus_task(project_id):
                 import_from_labelplus_percent=0,
                 import_from_labelplus_status=ImportFromLabelplusStatus.RUNNING,
             )
-            labelplus_data = load_from_labelplus(project.import_from_labelplus_txt)
-            file_count = len(labelplus_data)
-            for file_index, labelplus_file in enumerate(labelplus_data):
-                file = project.create_file(labelplus_file["file_name"])
-                for labelplus_label in labelplus_file["labels"]:
-                    source = file.create_source(
-                        content="",
-                        x=labelplus_label["x"],
-                        y=labelplus_label["y"],
-                        position_type=SourcePositionType.IN
-                        if labelplus_label["position_type"] == SourcePositionType.IN
-                        else SourcePositionType.OUT,
-                    )
-                    source.create_translation(
-                        content=labelplus_label["translation"],
-                        target=target,
-                        user=creator,
-                    )
-                project.update(
-                    import_from_labelplus_percent=int((file_index / file_count) * 100)
-                )
+            # 先快速检查并计数，再逐个文件解析导入，不同时保留所有文件的标签
+            file_count = validate_labelplus(_open_labelplus(project))
+            progress = _ProgressReporter(project, file_count)
+            project.import_labelplus(
+                iter_labelplus(_open_labelplus(project)),
+                target=target,
+                user=creator,
+                batch_size=IMPORT_FROM_LABELPLUS_BATCH_SIZE,
+                on_progress=progress.report,
+            )
     except Exception:
         logger.exception(Exception)
-        project.update(
-            import_from_labelplus_txt="",
+        _finish(
+            project,
             import_from_labelplus_status=ImportFromLabelplusStatus.ERROR,
             import_from_labelplus_error_type=ImportFromLabelplusErrorType.PARSE_FAILED,
         )
         return f"失败：解析/创建时发生错误，详见 log，Project {project_id}"
-    project.update(
-        import_from_labelplus_txt="",
+    _finish(
+        project,
         import_from_labelplus_percent=0,
         import_from_labelplus_status=ImportFromLabelplusStatus.SUCCEEDED,
     )
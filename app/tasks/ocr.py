@@ -4,6 +4,7 @@
 
 import datetime
 import math
+from contextlib import ExitStack
 from io import BytesIO
 from typing import BinaryIO, List, Optional
 from uuid import uuid4
@@ -432,87 +433,95 @@ def merge_and_ocr(parsing_images, /, *, parse_alone=False):
             images_group_count = 1 if parse_alone else 5
             downloading_images = parsing_images[0:images_group_count]
             parsing_images = parsing_images[images_group_count:]
-            image_files = []
-            merging_images = []
-            for downloading_image in downloading_images:
-                downloading_image.update(image_ocr_percent=ImageOCRPercent.DOWALOADING)
-                # 从 OSS 下载图片（重试）
-                while (
-                    image_error_counts.get(
-                        str(downloading_image.id), "oss_download_error"
+            # 下载的图片在合并完成后关闭
+            with ExitStack() as stack:
+                image_files = []
+                merging_images = []
+                for downloading_image in downloading_images:
+                    downloading_image.update(
+                        image_ocr_percent=ImageOCRPercent.DOWALOADING
                     )
-                    < 3
-                ):
-                    try:
-                        image_file = BytesIO(
-                            oss.download(
-                                oss_file_prefix, downloading_image.save_name
-                            ).read()
-                        )
-                        image_files.append(image_file)
-                        merging_images.append(downloading_image)
-                        break
-                    except Exception as e:
-                        logger.error(e, exc_info=True)
-                        image_error_counts.inc(
+                    # 从 OSS 下载图片（重试）
+                    while (
+                        image_error_counts.get(
                             str(downloading_image.id), "oss_download_error"
                         )
-                else:
-                    logger.error(
-                        f"ImageFile<{str(downloading_image.id)}> 下载失败且超过重试次数"
-                    )
-                    downloading_image.update(
-                        parse_status=ParseStatus.PARSE_FAILED,
-                        parse_error_type=ParseErrorType.IMAGE_CAN_NOT_DOWNLOAD_FROM_OSS,
-                    )
-            try:
-                for merging_image in merging_images:
-                    merging_image.update(image_ocr_percent=ImageOCRPercent.MERGING)
-                try:
-                    merge_data = merge_images_with_limit(
-                        merging_images, image_files, merged_image_file
-                    )
-                except OverGoogleVisionLimitError:
-                    # 第一次合并就超限，则让这些图片都单独处理
-                    if len(merged_images_data) == 0:
-                        if parse_alone:
-                            for merging_image in merging_images:
-                                merging_image.update(
-                                    parse_status=ParseStatus.PARSE_FAILED,
-                                    parse_error_type=ParseErrorType.IMAGE_TOO_LARGE,
-                                )
-                        else:
-                            for merging_image in merging_images:
-                                merging_image.update(
-                                    image_ocr_percent=ImageOCRPercent.WAITING_PARSE_ALONE  # noqa: E501
+                        < 3
+                    ):
+                        try:
+                            image_file = stack.enter_context(
+                                oss.download(
+                                    oss_file_prefix, downloading_image.save_name
                                 )
-                                parsing_alone_images.append(merging_image)
+                            )
+                            # 本地储存直接使用打开的文件；OSS 的流不能 seek，
+                            # 且需要在重试范围内读完，只读入内存一次
+                            if not image_file.seekable():
+                                image_file = BytesIO(image_file.read())
+                            image_files.append(image_file)
+                            merging_images.append(downloading_image)
+                            break
+                        except Exception as e:
+                            logger.error(e, exc_info=True)
+                            image_error_counts.inc(
+                                str(downloading_image.id), "oss_download_error"
+                            )
                     else:
-                        parsing_images = merging_images + parsing_images
-                    break
-                new_merged_image_file = merge_data["merged_image_file"]
-                new_images_data = merge_data["images_data"]
-                merged_image_file = new_merged_image_file
-                if len(merged_images_data) == 0:
-                    merged_images_data = new_images_data
-                else:
-                    merged_images_data = [*merged_images_data, *new_images_data[1:]]
-                for merging_image in merging_images:
-                    merging_image.update(image_ocr_percent=ImageOCRPercent.OCRING)
-            except Exception as e:
-                logger.error(e, exc_info=True)
-                for merging_image in merging_images:
-                    if parse_alone:
-                        merging_image.update(
+                        logger.error(
+                            f"ImageFile<{str(downloading_image.id)}> 下载失败且超过重试次数"
+                        )
+                        downloading_image.update(
                             parse_status=ParseStatus.PARSE_FAILED,
-                            parse_error_type=ParseErrorType.IMAGE_PARSE_ALONE_ERROR,
+                            parse_error_type=ParseErrorType.IMAGE_CAN_NOT_DOWNLOAD_FROM_OSS,
                         )
-                    else:
-                        merging_image.update(
-                            image_ocr_percent=ImageOCRPercent.WAITING_PARSE_ALONE,
+                try:
+                    for merging_image in merging_images:
+                        merging_image.update(image_ocr_percent=ImageOCRPercent.MERGING)
+                    try:
+                        merge_data = merge_images_with_limit(
+                            merging_images, image_files, merged_image_file
                         )
-                        parsing_alone_images.append(merging_image)
-                break
+                    except OverGoogleVisionLimitError:
+                        # 第一次合并就超限，则让这些图片都单独处理
+                        if len(merged_images_data) == 0:
+                            if parse_alone:
+                                for merging_image in merging_images:
+                                    merging_image.update(
+                                        parse_status=ParseStatus.PARSE_FAILED,
+                                        parse_error_type=ParseErrorType.IMAGE_TOO_LARGE,
+                                    )
+                            else:
+                                for merging_image in merging_images:
+                                    merging_image.update(
+                                        image_ocr_percent=ImageOCRPercent.WAITING_PARSE_ALONE  # noqa: E501
+                                    )
+                                    parsing_alone_images.append(merging_image)
+                        else:
+                            parsing_images = merging_images + parsing_images
+                        break
+                    new_merged_image_file = merge_data["merged_image_file"]
+                    new_images_data = merge_data["images_data"]
+                    merged_image_file = new_merged_image_file
+                    if len(merged_images_data) == 0:
+                        merged_images_data = new_images_data
+                    else:
+                        merged_images_data = [*merged_images_data, *new_images_data[1:]]
+                    for merging_image in merging_images:
+                        merging_image.update(image_ocr_percent=ImageOCRPercent.OCRING)
+                except Exception as e:
+                    logger.error(e, exc_info=True)
+                    for merging_image in merging_images:
+                        if parse_alone:
+                            merging_image.update(
+                                parse_status=ParseStatus.PARSE_FAILED,
+                                parse_error_type=ParseErrorType.IMAGE_PARSE_ALONE_ERROR,
+                            )
+                        else:
+                            merging_image.update(
+                                image_ocr_percent=ImageOCRPercent.WAITING_PARSE_ALONE,
+                            )
+                            parsing_alone_images.append(merging_image)
+                    break
             if parse_alone:
                 break
         # 第一次合并就失败，没有生成合并图片，跳过处理后续图片
@@ -605,6 +614,7 @@ def ocr_task(type, id):
     # TODO 现在可以一下启动很多项目，即使限额不够。需要检查限额并多加一个超限额的错误类型。
     project.update(ocring=True)
     parsing_images = [*queuing_images]
+    project.bump_files_version()
     queuing_images.update(
         parse_status=ParseStatus.PARSING,
         image_ocr_percent=ImageOCRPercent.QUEUING,
@@ -620,6 +630,7 @@ def ocr_task(type, id):
         return f"Celery 将要关闭，停止标记 <{type}>{id}"
     except Exception as e:
         project.update(ocring=False)
+        project.bump_files_version()
         project.files(type_only=FileType.IMAGE).filter(
             parse_status=ParseStatus.PARSING
         ).update(
@@ -650,6 +661,7 @@ def recover_ocr_tasks():
         parse_status=ParseStatus.PARSING,
     )
     logger.info(f"共 {parsing_images.count()} 张图片已恢复 QUEUING")
+    File.bump_projects_files_version(parsing_images)
     parsing_images.update(parse_status=ParseStatus.QUEUING)
     # 恢复项目
     ocring_projects = Project.objects(ocring=True)
@@ -8,7 +8,11 @@ import os
 import re
 import oss2
 import shutil
-from zipfile import ZipFile
+from contextlib import ExitStack
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, Iterator, Tuple
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
 
 from app import FILE_PATH, TMP_PATH, celery
 
@@ -17,11 +21,47 @@ from app.constants.file import FileType
 from app import oss
 from app.models import connect_db
 from app.regexs import SAFE_FILENAME_REGEX
+from app.utils.output_formats import OUTPUT_FORMATS
 from . import SyncResult, _FORCE_SYNC_TASK
 from celery.utils.log import get_task_logger
 
 logger = get_task_logger(__name__)
 
+# 各导出类型包含的格式（OUTPUT_FORMATS 中的名称），所有格式在一次遍历中生成
+OUTPUT_TYPE_FORMATS = {
+    OutputTypes.ALL: ["labelplus", "json", "csv"],
+    OutputTypes.ONLY_TEXT: ["labelplus"],
+    OutputTypes.ONLY_JSON: ["json"],
+    OutputTypes.ONLY_CSV: ["csv"],
+}
+
+
+def _download_files(
+    files: Iterable, prefix: str, /, *, workers: int
+) -> Iterator[Tuple[object, Future]]:
+    """
+    使用线程池并行下载文件，按原顺序返回 (文件, 下载内容的 Future)
+
+    同时最多有 workers * 2 个下载中或等待写入的文件，内存占用与项目大小无关
+
+    :param files: 文件，需要有 save_name
+    :param prefix: 储存前缀
+    :param workers: 线程数
+    """
+
+    def download(save_name):
+        with oss.download(prefix, save_name) as stream:
+            return stream.read()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for file in files:
+            pending.append((file, executor.submit(download, file.save_name)))
+            if len(pending) >= workers * 2:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
+
 
 @celery.task(name="tasks.output_project_task")
 def output_project_task(output_id):
@@ -63,10 +103,7 @@ def output_project_task(output_id):
 
     # 各个文件夹/文件路径
     zip_tmp_folder_name = str(output.id)  # 临时文件夹名
-    zip_name = str(output.id) + ".zip"  # 压缩文件名（和文件夹同名，并都存在zips根目录）
     zip_download_name = download_name + ".zip"
-    txt_name = str(output.id) + ".txt"  # 翻译文本名（当仅导出翻译文本的时候使用）
-    txt_download_name = download_name + ".txt"
     # PS脚本和其资源文件夹 原位置
     ps_script_path = os.path.abspath(
         os.path.join(FILE_PATH, "ps_script", "ps_script.jsx")
@@ -76,8 +113,6 @@ def output_project_task(output_id):
     )
     # tmp中存放zip的临时文件夹
     zips_tmp_folder_path = os.path.abspath(os.path.join(TMP_PATH, "zips"))
-    # 压缩文件路径
-    zip_path = os.path.abspath(os.path.join(zips_tmp_folder_path, zip_name))
     zip_tmp_folder_path = os.path.abspath(
         os.path.join(zips_tmp_folder_path, zip_tmp_folder_name)
     )
@@ -88,80 +123,61 @@ def output_project_task(output_id):
     zip_ps_script_res_folder_path = os.path.abspath(
         os.path.join(zip_tmp_folder_path, "ps_script_res")
     )
-    zip_images_folder_path = os.path.abspath(
-        os.path.join(zip_tmp_folder_path, "images")
-    )
-    zip_translations_txt_path = os.path.abspath(
-        os.path.join(zip_tmp_folder_path, "translations.txt")
-    )
-    zip_errors_txt_path = os.path.abspath(
-        os.path.join(zip_tmp_folder_path, "errors.txt")
-    )
-    project_json_path = os.path.abspath(
-        os.path.join(zip_tmp_folder_path, "project.json")
-    )
+    # 各格式的翻译文本，如 translations.txt
+    output_formats = {name: OUTPUT_FORMATS[name] for name in OUTPUT_TYPE_FORMATS[type]}
+    zip_translations_paths = {
+        name: os.path.abspath(
+            os.path.join(zip_tmp_folder_path, "translations." + output_format.extension)
+        )
+        for name, output_format in output_formats.items()
+    }
 
     errors = ""
     try:
-        # 创建图片临时文件夹
-        os.makedirs(zip_images_folder_path, exist_ok=True)
-        # 导出 Labelplus 翻译文本
+        # 创建临时文件夹
+        os.makedirs(zip_tmp_folder_path, exist_ok=True)
+        # 导出翻译文本，所有格式共用一次遍历
         output.update(status=OutputStatus.TRANSLATION_OUTPUTING)
-        labelplus = project.to_labelplus(
-            target=target,
-            file_ids_include=file_ids_include,
-            file_ids_exclude=file_ids_exclude,
-        )
-        with open(zip_translations_txt_path, "w", encoding="utf-8") as txt:
-            txt.write(labelplus)
-        if type == OutputTypes.ONLY_TEXT:
-            # 上传txt到oss
-            output.update(file_name=txt_download_name)
-            with open(zip_translations_txt_path, "rb") as txt:
-                oss.upload(
+        with ExitStack() as stack:
+            project.write_outputs(
+                [
+                    output_format(
+                        stack.enter_context(
+                            open(
+                                zip_translations_paths[name],
+                                "w",
+                                encoding=output_format.encoding,
+                                newline="",
+                            )
+                        )
+                    )
+                    for name, output_format in output_formats.items()
+                ],
+                target=target,
+                file_ids_include=file_ids_include,
+                file_ids_exclude=file_ids_exclude,
+            )
+        if type != OutputTypes.ALL:
+            # 仅导出一种格式的翻译文本，直接上传到oss
+            ((name, output_format),) = output_formats.items()
+            translations_download_name = download_name + "." + output_format.extension
+            output.update(file_name=translations_download_name)
+            with open(zip_translations_paths[name], "rb") as translations_file:
+                oss.multipart_upload(
                     os.path.join(
                         celery.conf.app_config["OSS_OUTPUT_PREFIX"], str(output.id)
                     )
                     + "/",
-                    txt_download_name,
-                    txt,
+                    translations_download_name,
+                    translations_file,
                     headers={"Content-Disposition": 'attachment;"'.encode("utf8")},
                 )
-        elif type == OutputTypes.ALL:
+        else:
             output.update(status=OutputStatus.DOWNLOADING)
             # 创建项目信息文件
             project_json = project.to_output_json()
             project_json["output_id"] = str(output.id)
             project_json["output_language"] = target.language.code
-            with open(project_json_path, "w", encoding="utf-8") as json_file:
-                json.dump(project_json, json_file)
-            # 下载项目图片
-            files = project.files(
-                type_only=FileType.IMAGE,
-                file_ids_include=file_ids_include,
-                file_ids_exclude=file_ids_exclude,
-            )
-            for file in files:
-                file_path = os.path.abspath(
-                    os.path.join(zip_images_folder_path, file.name)
-                )
-                try:
-                    oss.download(
-                        oss_file_prefix,
-                        file.save_name,
-                        local_path=file_path,
-                    )
-                except oss2.exceptions.NoSuchKey:
-                    errors += (
-                        f"File {file.name}<{str(file.id)}> is not found in server.\r\n"
-                    )
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                except Exception:
-                    logger.exception(Exception)
-                    errors += f"File {file.name}<{str(file.id)}> download error.\r\n"
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
             # 放入PS脚本和其资源文件夹
             # if os.path.exists(ps_script_path):
             #     shutil.copy(ps_script_path, zip_ps_script_path)
@@ -169,39 +185,67 @@ def output_project_task(output_id):
             #     shutil.copytree(
             #         ps_script_res_folder_path, zip_ps_script_res_folder_path
             #     )
-            # 记录错误
-            if errors:
-                with open(zip_errors_txt_path, "w") as txt:
-                    txt.write(
-                        f"Project Name: {project.name}\r\n"
-                        + f"Project ID:   {str(project.id)}\r\n"
-                        + f"Target ID:    {str(target.id)}\r\n"
-                        + f"Output ID:    {str(output.id)}\r\n"
-                        + "------------------------\r\n"
-                    )
-                    txt.write(errors)
-            # 压缩临时文件夹
-            output.update(status=OutputStatus.ZIPING)
-            with ZipFile(zip_path, "w") as zip_file:
-                for dirpath, dirnames, filenames in os.walk(zip_tmp_folder_path):
-                    for filename in filenames:
-                        file_path = os.path.abspath(os.path.join(dirpath, filename))
-                        file_in_zip_path = os.path.relpath(
-                            file_path, zip_tmp_folder_path
-                        )
-                        zip_file.write(file_path, file_in_zip_path)
-            # 上传zip到oss
-            with open(zip_path, "rb") as zip_file:
-                output.update(file_name=zip_download_name)
-                oss.upload(
+            files = project.files(
+                type_only=FileType.IMAGE,
+                file_ids_include=file_ids_include,
+                file_ids_exclude=file_ids_exclude,
+            ).only("name", "save_name")
+            output.update(file_name=zip_download_name)
+            # 边下载图片边压缩上传，不在本地保存图片和 zip
+            with (
+                oss.open_upload(
                     os.path.join(
                         celery.conf.app_config["OSS_OUTPUT_PREFIX"], str(output.id)
                     )
                     + "/",
                     zip_download_name,
-                    zip_file,
                     headers={"Content-Disposition": 'attachment;"'.encode("utf8")},
-                )
+                ) as upload,
+                ZipFile(upload, "w", compression=ZIP_DEFLATED) as zip_file,
+            ):
+                zip_file.writestr("project.json", json.dumps(project_json))
+                for path in zip_translations_paths.values():
+                    zip_file.write(path, os.path.basename(path))
+                # 图片已经压缩过，直接存储
+                image_names = set()
+                for file, future in _download_files(
+                    files,
+                    oss_file_prefix,
+                    workers=celery.conf.app_config["OUTPUT_DOWNLOAD_WORKERS"],
+                ):
+                    try:
+                        data = future.result()
+                    except (oss2.exceptions.NoSuchKey, FileNotFoundError):
+                        errors += (
+                            f"File {file.name}<{str(file.id)}> "
+                            + "is not found in server.\r\n"
+                        )
+                        continue
+                    except Exception:
+                        logger.exception(Exception)
+                        errors += (
+                            f"File {file.name}<{str(file.id)}> download error.\r\n"
+                        )
+                        continue
+                    # 不同文件夹中的同名图片只保留一个
+                    if file.name in image_names:
+                        continue
+                    image_names.add(file.name)
+                    zip_file.writestr(
+                        "images/" + file.name, data, compress_type=ZIP_STORED
+                    )
+                # 记录错误
+                output.update(status=OutputStatus.ZIPING)
+                if errors:
+                    zip_file.writestr(
+                        "errors.txt",
+                        f"Project Name: {project.name}\r\n"
+                        + f"Project ID:   {str(project.id)}\r\n"
+                        + f"Target ID:    {str(target.id)}\r\n"
+                        + f"Output ID:    {str(output.id)}\r\n"
+                        + "------------------------\r\n"
+                        + errors,
+                    )
     except Exception:
         output.update(status=OutputStatus.ERROR)
         logger.exception(Exception)
@@ -210,9 +254,7 @@ def output_project_task(output_id):
             + f"Target<{str(target.id)}> Output<{str(output.id)}>"
         )
     finally:
-        # 删除临时文件夹和zip
-        if os.path.exists(zip_path):
-            os.remove(zip_path)
+        # 删除临时文件夹
         if os.path.exists(zip_tmp_folder_path):
             shutil.rmtree(zip_tmp_folder_path)
     output.update(status=OutputStatus.SUCCEEDED)
@@ -2,13 +2,14 @@
 导出项目
 """
 
-import os
+from io import BytesIO
 from PIL import Image, ImageOps
 
-from app import STORAGE_PATH, celery
-from app.constants.storage import StorageType
+from app import celery
+from app.constants.file import FileType, ThumbnailStatus
 from app.exceptions.file import FileNotExistError
 from app import oss
+from app.services.oss import processed_filename
 
 from app.models import connect_db
 from . import SyncResult
@@ -37,37 +38,44 @@ def create_thumbnail_task(image_id: str):
     oss_file_prefix = celery.conf.app_config["OSS_FILE_PREFIX"]
     connect_db(celery.conf.app_config)
     oss.init(celery.conf.app_config)
-    if celery.conf.app_config["STORAGE_TYPE"] != StorageType.LOCAL_STORAGE:
-        return f"失败：创建缩略图失败，非本地模式 {image_id}"
+    if oss.supports_image_process:
+        return f"失败：创建缩略图失败，储存服务支持图片处理 {image_id}"
+    image = None
     try:
         image = File.by_id(image_id)
         if not oss.is_exist(oss_file_prefix, image.save_name):
+            image.update(thumbnail_status=ThumbnailStatus.FAILED)
             return f"失败：创建缩略图失败，原图文件未找到 {image_id}"
-        image_path = os.path.join(STORAGE_PATH, oss_file_prefix, image.save_name)
-        cover_image_path = os.path.join(
-            STORAGE_PATH,
-            oss_file_prefix,
-            celery.conf.app_config["OSS_PROCESS_COVER_NAME"] + "-" + image.save_name,
-        )
-        safe_check_image_path = os.path.join(
-            STORAGE_PATH,
-            oss_file_prefix,
-            celery.conf.app_config["OSS_PROCESS_SAFE_CHECK_NAME"]
-            + "-"
-            + image.save_name,
-        )
-        original = Image.open(image_path)
+        # 通过储存服务读写，本地储存和 S3 等不支持图片处理的储存都可以生成缩略图
+        with oss.download(oss_file_prefix, image.save_name) as image_file:
+            original = Image.open(
+                image_file if image_file.seekable() else BytesIO(image_file.read())
+            )
+            original.load()
+        image_format = original.format
         thumbnail = ImageOps.fit(original, (180, 140), Image.ANTIALIAS)
+        thumbnail2 = original.copy()
         original.close()
-        thumbnail.save(cover_image_path)
-        thumbnail2 = Image.open(image_path)
         thumbnail2.thumbnail((400, 500))
-        thumbnail2.save(safe_check_image_path)
-        thumbnail2.close()
+        for process_name, processed in (
+            (celery.conf.app_config["OSS_PROCESS_COVER_NAME"], thumbnail),
+            (celery.conf.app_config["OSS_PROCESS_SAFE_CHECK_NAME"], thumbnail2),
+        ):
+            data = BytesIO()
+            processed.save(data, format=image_format)
+            processed.close()
+            oss.upload(
+                oss_file_prefix,
+                processed_filename(image.save_name, process_name),
+                data.getvalue(),
+            )
+        image.update(thumbnail_status=ThumbnailStatus.SUCCEEDED)
     except FileNotExistError:
         return f"失败：创建缩略图失败，原图不存在 {image_id}"
     except Exception:
         logger.exception(Exception)
+        if image is not None:
+            image.update(thumbnail_status=ThumbnailStatus.FAILED)
         return f"失败：创建缩略图失败 {image_id}"
     return f"成功：创建缩略图成功 {image_id}"
 
@@ -81,3 +89,83 @@ def create_thumbnail(image_id, /, *, run_sync=False):
     else:
         # 异步执行
         return create_thumbnail_task.delay(image_id)
+
+
+@celery.task(name="tasks.reconcile_thumbnails_task")
+def reconcile_thumbnails_task(
+    project_id: str = None, retry_failed=False, batch_size=500
+):
+    """
+    校正图片的缩略图状态，使其与储存中的缩略图文件一致：
+    缩略图都存在的标记为已生成，缺失的（包括生成任务丢失、文件被删除）重新生成。
+    worker 崩溃时停留在生成中的图片也由此恢复，结果中单独列出其数量。
+    重新生成是幂等的，可以随时执行，如 worker 重启后或定时执行
+    ``python manage.py reconcile_thumbnails``
+
+    :param project_id: 只校正这个项目的图片，为 None 时校正所有图片
+    :param retry_failed: 是否重新生成之前失败的缩略图
+    :param batch_size: 每次从数据库读取的数量
+    """
+    from app.models.file import File
+    from app.models.project import Project
+    from app.models.output import Output
+    from app.models.team import Team
+    from app.models.target import Target
+    from app.models.user import User
+
+    (File, Project, Team, Target, User, Output)
+
+    oss_file_prefix = celery.conf.app_config["OSS_FILE_PREFIX"]
+    connect_db(celery.conf.app_config)
+    oss.init(celery.conf.app_config)
+    if oss.supports_image_process:
+        return "成功：储存服务支持图片处理，不需要校正缩略图"
+    process_names = [
+        celery.conf.app_config["OSS_PROCESS_COVER_NAME"],
+        celery.conf.app_config["OSS_PROCESS_SAFE_CHECK_NAME"],
+    ]
+    files = File.objects(type=FileType.IMAGE, save_name__ne="")
+    if project_id:
+        files = files.filter(project=project_id)
+    checked_count = 0
+    ready_ids = []
+    missing_ids = []
+    generating_count = 0  # 停留在生成中（如 worker 崩溃）而被恢复的数量
+    for file in files.only("save_name", "thumbnail_status").batch_size(batch_size):
+        checked_count += 1
+        if file.thumbnail_status == ThumbnailStatus.GENERATING:
+            generating_count += 1
+        if all(
+            oss.is_exist(oss_file_prefix, file.save_name, process_name=process_name)
+            for process_name in process_names
+        ):
+            if file.thumbnail_status != ThumbnailStatus.SUCCEEDED:
+                ready_ids.append(file.id)
+        elif retry_failed or file.thumbnail_status != ThumbnailStatus.FAILED:
+            missing_ids.append(file.id)
+    if ready_ids or missing_ids:
+        File.bump_projects_files_version(files.filter(id__in=ready_ids + missing_ids))
+    for i in range(0, len(ready_ids), batch_size):
+        File.objects(id__in=ready_ids[i : i + batch_size]).update(
+            thumbnail_status=ThumbnailStatus.SUCCEEDED
+        )
+    # 本身已在后台运行，直接生成
+    for file_id in missing_ids:
+        File.objects(id=file_id).update(thumbnail_status=ThumbnailStatus.GENERATING)
+        create_thumbnail_task(str(file_id))
+    return (
+        f"成功：检查 {checked_count} 张图片，"
+        + f"标记已生成 {len(ready_ids)} 张，重新生成 {len(missing_ids)} 张，"
+        + f"其中恢复停留在生成中的 {generating_count} 张"
+    )
+
+
+def reconcile_thumbnails(project_id=None, /, *, retry_failed=False, run_sync=False):
+    alive_workers = celery.control.ping()
+    if len(alive_workers) == 0 or run_sync:
+        # 同步执行
+        logger.info(reconcile_thumbnails_task(project_id, retry_failed=retry_failed))
+        return SyncResult()
+    else:
+        # 异步执行
+        return reconcile_thumbnails_task.delay(project_id, retry_failed=retry_failed)
@@ -12,7 +12,9 @@ def md5(src):
 def get_file_md5(file):
     """获取文件的md5"""
     m = hashlib.md5()
-    m.update(file.read())
+    # 分块读取，不将整个文件读入内存
+    for chunk in iter(lambda: file.read(1024 * 1024), b""):
+        m.update(chunk)
     # 如果是文件，则还原指针
     if isinstance(file, BufferedReader):
         file.seek(0)
@@ -1,5 +1,22 @@
+import io
 import re
-from typing import List, TypedDict
+from typing import (
+    BinaryIO,
+    Iterable,
+    Iterator,
+    List,
+    TextIO,
+    Tuple,
+    TypedDict,
+    Union,
+)
+
+from app.utils.text import iter_lines
+
+# 文件行，如 >>>>>>>>[1.jpg]<<<<<<<<
+FILE_LINE_PATTERN = re.compile(r".+>>>\[(.+)\]<<<.+")
+# 标签行，如 ----------------[1]----------------[0.509,0.270,2]
+LABEL_LINE_PATTERN = re.compile(r".+---\[.+\]---.+\[(.+),(.+),(.+)\]")
 
 
 class LPLabel(TypedDict):
@@ -14,40 +31,129 @@ class LPFile(TypedDict):
     labels: List[LPLabel]
 
 
-def load_from_labelplus(labelplus: str) -> List[LPFile]:
-    files: List[LPFile] = []
-    lines = labelplus.splitlines()
-    file_index = -1
-    label_index = -1
-    for line in lines:
+def _iter_lines(labelplus: Union[str, Iterable[str]]) -> Iterator[str]:
+    """逐行读取，去掉行尾换行符"""
+    if isinstance(labelplus, str):
+        # newline=None 时 \r\n 和 \r 都会转换为 \n
+        labelplus = io.StringIO(labelplus, newline=None)
+    for line in labelplus:
+        yield line.rstrip("\r\n")
+
+
+def iter_labelplus_lines(stream: BinaryIO) -> Iterator[str]:
+    """
+    从 utf-8 编码的二进制流中逐行读取 LabelPlus 文本（如储存服务中的文件）
+
+    分行方式与直接传入完整文本时相同，末尾的换行符不会产生额外的空行
+    """
+    previous = None
+    for line in iter_lines(stream, "utf-8"):
+        if previous is not None:
+            yield previous
+        previous = line
+    if previous:
+        yield previous
+
+
+def _iter_tokens(
+    labelplus: Union[str, Iterable[str]],
+) -> Iterator[Tuple[str, Union[str, LPLabel]]]:
+    """
+    逐行解析为 ("file", 文件名)、("label", 标签) 和 ("line", 翻译行)
+
+    第一个文件之前和每个文件第一个标签之前的行会被忽略
+
+    :raise ValueError: 标签坐标格式错误，或标签不属于任何文件
+    """
+    has_file = False
+    has_label = False
+    for line in _iter_lines(labelplus):
         # 检测文件行
-        file_match = re.match(r".+>>>\[(.+)\]<<<.+", line)
-        if file_match and file_match.group(1):
-            file_name = file_match.group(1)
-            files.append({"file_name": file_name, "labels": []})
-            file_index += 1
-            label_index = -1
+        file_match = FILE_LINE_PATTERN.match(line)
+        if file_match:
+            has_file = True
+            has_label = False
+            yield "file", file_match.group(1)
             continue
         # 检测标签行
-        label_match = re.match(r".+---\[.+\]---.+\[(.+),(.+),(.+)\]", line)
-        if label_match and label_match.group(1):
-            label_x = label_match.group(1)
-            label_y = label_match.group(2)
-            position_type = label_match.group(3)
-            files[file_index]["labels"].append(
+        label_match = LABEL_LINE_PATTERN.match(line)
+        if label_match:
+            if not has_file:
+                raise ValueError("label before file line")
+            has_label = True
+            yield (
+                "label",
                 {
-                    "x": float(label_x),
-                    "y": float(label_y),
-                    "position_type": int(position_type),
+                    "x": float(label_match.group(1)),
+                    "y": float(label_match.group(2)),
+                    "position_type": int(label_match.group(3)),
                     "translation": "",
-                }
+                },
             )
-            label_index += 1
             continue
-        if file_index > -1 and label_index > -1:
-            files[file_index]["labels"][label_index]["translation"] += line + "\n"
-    for file in files:
-        for label in file["labels"]:
-            if label["translation"].endswith("\n"):
-                label["translation"] = label["translation"][0:-1]
-    return files
+        if has_label:
+            yield "line", line
+
+
+def iter_labelplus(labelplus: Union[str, Iterable[str]]) -> Iterator[LPFile]:
+    """
+    逐个文件解析 LabelPlus 翻译文本，同一时间只保留一个文件的标签
+
+    :param labelplus: 完整文本，或逐行读取的文本流（如打开的文件）
+    :raise ValueError: 格式错误
+    """
+    file = None
+    label = None
+    translation_lines: List[str] = []
+    for kind, value in _iter_tokens(labelplus):
+        if kind == "line":
+            translation_lines.append(value)
+            continue
+        if label is not None:
+            label["translation"] = "\n".join(translation_lines)
+            label = None
+        if kind == "file":
+            if file is not None:
+                yield file
+            file = {"file_name": value, "labels": []}
+        else:
+            label = value
+            translation_lines = []
+            file["labels"].append(label)
+    if label is not None:
+        label["translation"] = "\n".join(translation_lines)
+    if file is not None:
+        yield file
+
+
+def load_from_labelplus(labelplus: Union[str, Iterable[str]]) -> List[LPFile]:
+    """解析 LabelPlus 翻译文本的所有文件"""
+    return list(iter_labelplus(labelplus))
+
+
+def validate_labelplus(labelplus: Union[str, Iterable[str]]) -> int:
+    """
+    检查 LabelPlus 翻译文本能否解析，不保留标签和翻译
+
+    :raise ValueError: 格式错误
+    :return: 文件数量
+    """
+    return sum(1 for kind, _ in _iter_tokens(labelplus) if kind == "file")
+
+
+def dump_labelplus_file(labelplus_file: LPFile, stream: TextIO):
+    """
+    将一个文件的标签和翻译以 LabelPlus 格式写入文本流，统一使用 Windows 换行符
+
+    :param labelplus_file: 文件，文件名可以包含文件夹路径，如 a/b/1.jpg
+    :param stream: 文本流，如 open(path, "w", encoding="utf-8") 或 io.StringIO()
+    """
+    # 文件路径行
+    stream.write(">>>>>>>>[" + labelplus_file["file_name"] + "]<<<<<<<<\r\n")
+    for id, label in enumerate(labelplus_file["labels"], start=1):
+        # 标签信息 ---[id]---[x,y,group_id]
+        stream.write(
+            f"----------------[{id}]----------------"
+            f"[{label['x']},{label['y']},{label['position_type']}]\r\n"
+        )
+        stream.write(label["translation"].replace("\n", "\r\n") + "\r\n")
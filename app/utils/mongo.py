@@ -1,7 +1,13 @@
+import base64
 from typing import TypeVar, List
 
+from bson import json_util
+
 T = TypeVar("T")
 
+# 数据库中的时间均为 UTC 的 naive datetime，解码游标时保持一致
+_CURSOR_JSON_OPTIONS = json_util.JSONOptions(tz_aware=False)
+
 
 def mongo_order(objects: List[T], order_by, default_order_by) -> List[T]:
     """处理排序"""
@@ -24,3 +30,85 @@ def mongo_slice(objects: List[T], skip, limit) -> List[T]:
     if limit:
         objects = objects.limit(limit)
     return objects
+
+
+def count_documents(objects) -> int:
+    """
+    使用 count_documents 计算查询的总数（忽略 skip 和 limit）
+
+    mongoengine 的 QuerySet.count() 使用的是已弃用的 cursor.count
+    """
+    return objects._collection.count_documents(objects._query)
+
+
+def encode_cursor(values: list) -> str:
+    """将排序键的值编码为不透明的游标"""
+    return base64.urlsafe_b64encode(
+        json_util.dumps(values, json_options=_CURSOR_JSON_OPTIONS).encode("utf-8")
+    ).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> list:
+    """
+    解码游标
+
+    :raise ValueError: 游标格式错误
+    """
+    try:
+        values = json_util.loads(
+            base64.urlsafe_b64decode(cursor.encode("ascii")),
+            json_options=_CURSOR_JSON_OPTIONS,
+        )
+    except Exception as e:
+        raise ValueError(f"invalid cursor: {cursor}") from e
+    if not isinstance(values, list):
+        raise ValueError(f"invalid cursor: {cursor}")
+    return values
+
+
+def mongo_sort(document: type, order_by: List[str]) -> dict:
+    """
+    将排序键转换为聚合的 $sort 阶段
+
+    :param document: 文档类，用于获取数据库中的字段名
+    :param order_by: 排序键，如 ["-edit_time", "id"]
+    """
+    sort = {}
+    for key in order_by:
+        sort[document._fields[key.lstrip("-+")].db_field] = (
+            -1 if key.startswith("-") else 1
+        )
+    return {"$sort": sort}
+
+
+def mongo_keyset(document: type, order_by: List[str], values: list) -> dict:
+    """
+    生成游标分页（keyset）的查询条件，查询排在 values 之后的文档
+
+    条件形如 (k1 > v1) or (k1 = v1 and k2 > v2) or ...，可以直接使用索引，
+    不用像 skip 一样扫描之前的所有文档。order_by 的最后一个键需能唯一确定文档
+
+    :param document: 文档类，用于获取数据库中的字段名
+    :param order_by: 排序键，如 ["-edit_time", "id"]
+    :param values: 上一页最后一个文档的排序键的值
+    :return: 原始查询条件，可用于 objects(__raw__=...) 或 $match
+    """
+    if len(values) != len(order_by):
+        raise ValueError("cursor does not match order")
+    keys = []
+    for key in order_by:
+        descending = key.startswith("-")
+        name = key.lstrip("-+")
+        db_field = document._fields[name].db_field
+        keys.append((db_field, "$lt" if descending else "$gt"))
+    conditions = []
+    for i, (db_field, op) in enumerate(keys):
+        condition = {keys[j][0]: values[j] for j in range(i)}
+        condition[db_field] = {op: values[i]}
+        conditions.append(condition)
+    return {"$or": conditions}
+
+
+def keyset_values(obj, order_by: List[str]) -> list:
+    """取出文档的排序键的值，用于生成游标"""
+    return [getattr(obj, key.lstrip("-+")) for key in order_by]
@@ -0,0 +1,153 @@
+"""
+导出格式
+
+每种格式逐个文件写入文本流，多个格式可以共用同一次遍历的数据（见 Project.write_outputs）：
+
+    formats = [OUTPUT_FORMATS["labelplus"](txt), OUTPUT_FORMATS["json"](json_file)]
+    project.write_outputs(formats, target=target)
+
+导出的文件数据形如：
+
+    {
+        "id": "文件 id",
+        "file_name": "文件夹/文件名.jpg",
+        "sources": [
+            {
+                "id": "原文 id",
+                "content": "原文",
+                "x": 0.5,
+                "y": 0.5,
+                "position_type": 1,
+                "translation": "最佳翻译（优先使用校对内容）",
+                "tips": ["备注"],  # 仅 with_tips 为 True 的格式需要
+            }
+        ],
+    }
+"""
+
+import csv
+import json
+from typing import TextIO
+
+from flask_babel import gettext
+
+from app.utils.labelplus import dump_labelplus_file
+
+
+class OutputFormat:
+    """
+    导出格式的基类
+
+    :param stream: 文本流，文件需使用 encoding 打开，且 newline=""
+    """
+
+    extension = ""  # 文件扩展名
+    encoding = "utf-8"  # 保存时使用的编码
+    with_tips = False  # 是否需要备注（需要额外查询）
+
+    def __init__(self, stream: TextIO):
+        self.stream = stream
+
+    def begin(self, info: dict):
+        """
+        写入文件头
+
+        :param info: 项目信息，包含 project_id、project_name、target_language
+        """
+
+    def write_file(self, output_file: dict):
+        """写入一个文件"""
+        raise NotImplementedError
+
+    def end(self):
+        """写入文件尾"""
+
+
+class LabelplusFormat(OutputFormat):
+    """LabelPlus 翻译文本"""
+
+    extension = "txt"
+
+    def begin(self, info: dict):
+        # Labelplus翻译文件头格式
+        self.stream.write(
+            "1,0\r\n"  # 版本
+            + "-\r\n"
+            + gettext("框内")
+            + "\r\n"  # 标签分组
+            + gettext("框外")
+            + "\r\n"
+            + "-\r\n"
+            + gettext("可使用 LabelPlus Photoshop 脚本导入 psd 中")
+            + "\r\n"  # 注释
+        )
+
+    def write_file(self, output_file: dict):
+        dump_labelplus_file(
+            {"file_name": output_file["file_name"], "labels": output_file["sources"]},
+            self.stream,
+        )
+
+
+class JSONFormat(OutputFormat):
+    """结构化的 JSON，包含原文、坐标、最佳翻译和备注，逐个文件写入 files 数组"""
+
+    extension = "json"
+    with_tips = True
+
+    def begin(self, info: dict):
+        # 去掉结尾的 }，之后接着写入 files 数组
+        self.stream.write(json.dumps(info, ensure_ascii=False)[:-1])
+        self.stream.write(', "files": [' if info else '"files": [')
+        self.file_count = 0
+
+    def write_file(self, output_file: dict):
+        if self.file_count:
+            self.stream.write(", ")
+        self.stream.write(json.dumps(output_file, ensure_ascii=False))
+        self.file_count += 1
+
+    def end(self):
+        self.stream.write("]}")
+
+
+class CSVFormat(OutputFormat):
+    """CSV 表格，每个原文一行，带 BOM 以便 Excel 识别编码"""
+
+    extension = "csv"
+    encoding = "utf-8-sig"
+    columns = [
+        "file_name",
+        "label",
+        "x",
+        "y",
+        "position_type",
+        "source",
+        "translation",
+    ]
+
+    def begin(self, info: dict):
+        self.writer = csv.writer(self.stream)
+        self.writer.writerow(self.columns)
+
+    def write_file(self, output_file: dict):
+        self.writer.writerows(
+            [
+                output_file["file_name"],
+                id,
+                source["x"],
+                source["y"],
+                source["position_type"],
+                source["content"],
+                source["translation"],
+            ]
+            for id, source in enumerate(output_file["sources"], start=1)
+        )
+
+
+# 所有导出格式
+OUTPUT_FORMATS: dict[str, type[OutputFormat]] = {
+    "labelplus": LabelplusFormat,
+    "json": JSONFormat,
+    "csv": CSVFormat,
+}
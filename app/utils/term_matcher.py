@@ -0,0 +1,100 @@
+"""
+多模式字符串匹配（Aho-Corasick 自动机）
+
+用于在原文中寻找术语：构建一次后可在多个原文中复用，每个原文只需遍历一遍，
+耗时与原文长度和匹配数量相关，与术语数量无关。
+"""
+
+from collections import deque
+from typing import Generic, Iterable, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class TermMatcher(Generic[T]):
+    """
+    多模式匹配器
+
+        matcher = TermMatcher([("猫", 1), ("小猫", 2)])
+        matcher.match("一只小猫")  # [1, 2]
+
+    :param patterns: (模式, 值) 的列表，匹配结果返回值。
+        空模式与任何内容都匹配（与 `"" in content` 相同）
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, T]]):
+        self.values: list[T] = []
+        # 每个状态的转移表、失败指针、输出（值的序号）
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._output: list[tuple[int, ...]] = [()]
+        for pattern, value in patterns:
+            index = len(self.values)
+            self.values.append(value)
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                state = next_state
+            self._output[state] += (index,)
+        self._build_fail()
+
+    def _build_fail(self):
+        """广度优先计算失败指针，并将失败指针上的输出合并到当前状态"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[next_state] = fail
+                self._output[next_state] += self._output[fail]
+                queue.append(next_state)
+
+    def __len__(self):
+        return len(self.values)
+
+    def match(self, content: str) -> list[T]:
+        """
+        返回在内容中出现的模式对应的值，按构建时的顺序排列，每个值最多出现一次
+
+        :param content: 要匹配的内容
+        """
+        # 根状态的输出为空模式，总是匹配
+        found = set(self._output[0])
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for char in content:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return [self.values[index] for index in sorted(found)]
+
+
+class TermMatcherChain(Generic[T]):
+    """
+    组合多个匹配器（如每个术语库一个），结果按匹配器的顺序连接
+
+    :param matchers: TermMatcher 列表
+    """
+
+    def __init__(self, matchers: Iterable[TermMatcher[T]]):
+        self.matchers = list(matchers)
+
+    def __len__(self):
+        return sum(len(matcher) for matcher in self.matchers)
+
+    def match(self, content: str) -> list[T]:
+        values = []
+        for matcher in self.matchers:
+            values.extend(matcher.match(content))
+        return values
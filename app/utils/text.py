@@ -0,0 +1,90 @@
+import codecs
+import re
+from typing import BinaryIO, Iterator, Optional
+
+from chardet.universaldetector import UniversalDetector
+
+# 与 re.split(r"\n|\r\n|\r", text) 的分行方式相同
+LINE_SPLIT_PATTERN = re.compile(r"\n|\r\n|\r")
+# 检测结果只基于开头部分，替换为兼容的超集，避免后面出现的字符无法解码
+CHARSET_SUPERSETS = {"ascii": "utf-8", "gb2312": "gb18030"}
+
+
+def detect_charset(head: bytes, chunk_size: int = 4096) -> Optional[str]:
+    """
+    使用 chardet 的 UniversalDetector 检测字符集，检测结果确定后即停止
+
+    结果会替换为 CHARSET_SUPERSETS 中的超集，如 ascii 会被视为 utf-8，
+    因为之后的内容可能含有非 ascii 字符
+
+    :param head: 文件开头的一部分
+    :return: 字符集名称，无法检测时返回 None
+    """
+    detector = UniversalDetector()
+    for start in range(0, len(head), chunk_size):
+        detector.feed(head[start : start + chunk_size])
+        if detector.done:
+            break
+    detector.close()
+    encoding = detector.result["encoding"]
+    if encoding is None:
+        return None
+    return CHARSET_SUPERSETS.get(encoding.lower(), encoding)
+
+
+def iter_lines(
+    stream: BinaryIO,
+    encoding: str,
+    /,
+    *,
+    head: bytes = b"",
+    chunk_size: int = 64 * 1024,
+) -> Iterator[str]:
+    """
+    从二进制流中逐块解码并分行，内存占用与块大小相关，而不是整个文件
+
+    :param stream: 二进制流，需支持 read(size)
+    :param encoding: 字符集
+    :param head: 已经从流中读出的开头部分（如用于检测字符集的部分）
+    :param chunk_size: 每次读取的字节数
+    :raise UnicodeDecodeError: 内容无法使用此字符集解码
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ""  # 还未遇到换行符的部分
+    for chunk in _iter_chunks(stream, head, chunk_size):
+        pending += decoder.decode(chunk)
+        # \r 可能和下一块开头的 \n 组成 \r\n，留到下次处理
+        carriage_return = ""
+        if pending.endswith("\r"):
+            pending, carriage_return = pending[:-1], "\r"
+        lines = LINE_SPLIT_PATTERN.split(pending)
+        pending = lines.pop() + carriage_return
+        yield from lines
+    pending += decoder.decode(b"", final=True)
+    yield from LINE_SPLIT_PATTERN.split(pending)
+
+
+def _iter_chunks(stream: BinaryIO, head: bytes, chunk_size: int) -> Iterator[bytes]:
+    if head:
+        yield head
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+class CountingReader:
+    """包装二进制流，记录已读取的字节数，用于汇报进度"""
+
+    def __init__(self, stream: BinaryIO, read_bytes: int = 0):
+        self.stream = stream
+        self.read_bytes = read_bytes
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.stream.read(size)
+        self.read_bytes += len(data)
+        return data
+
+    def close(self):
+        self.stream.close()
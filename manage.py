@@ -45,6 +45,22 @@ def list_translations():
         print(babel.list_translations())
 
 
+@click.command("reconcile_thumbnails")
+@click.option("--project", "project_id", default=None, help="只校正这个项目的图片")
+@click.option("--retry-failed", is_flag=True, help="重新生成之前失败的缩略图")
+@click.option("--sync", "run_sync", is_flag=True, help="在当前进程中执行")
+def reconcile_thumbnails(project_id: str, retry_failed: bool, run_sync: bool):
+    """
+    校正图片的缩略图状态（本地储存、S3），缺失的和停留在生成中的缩略图会重新生成
+
+    worker 崩溃后或定时（如 cron）执行，有 worker 时交给 worker 执行
+    """
+    from app.tasks.thumbnail import reconcile_thumbnails as reconcile
+
+    result = reconcile(project_id, retry_failed=retry_failed, run_sync=run_sync)
+    logger.info(f"校正缩略图任务：{result.task_id}")
+
+
 @click.command("mit_file")
 @click.option("--file", help="path to image file")
 def mit_preprocess_file(file: str):
@@ -79,6 +95,7 @@ def mit_preprocess_dir(dir: str):
 main.add_command(docs)
 main.add_command(migrate)
 main.add_command(list_translations)
+main.add_command(reconcile_thumbnails)
 main.add_command(mit_preprocess_file)
 main.add_command(mit_preprocess_dir)
 
@@ -14,6 +14,12 @@ from app.models.team import Team
 from app.models.project import ProjectSet
 from app.models.v_code import VCodeType, VCode
 from typing import Any, Union
+from unittest import mock
+
+from mongomock import aggregate as mock_aggregate
+from mongomock import helpers as mock_helpers
+from mongomock.collection import Collection as MockCollection
+from mongomock.collection import Cursor as MockCursor
 
 TEST_FILE_PATH = os.path.abspath(os.path.join(FILE_PATH, "test"))
 DEFAULT_TEAMS_COUNT = 1
@@ -21,6 +27,55 @@ DEFAULT_TEAM_USER_RELATIONS = 1
 DEFAULT_PROJECT_SETS_COUNT = 1
 DEFAULT_USERS_COUNT = 1
 
+_mock_lookup_stage = mock_aggregate._PIPELINE_HANDLERS["$lookup"]
+
+
+def _substitute_variables(value, variables: dict):
+    """将子管道中的 $$变量 替换为对应的值"""
+    if isinstance(value, str) and value.startswith("$$"):
+        return variables[value[2:]]
+    if isinstance(value, dict):
+        return {k: _substitute_variables(v, variables) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_substitute_variables(v, variables) for v in value]
+    return value
+
+
+def _lookup_stage(in_collection, database, options):
+    """
+    mongomock 未实现带 let/pipeline 的 $lookup，测试中逐个文档代入变量后执行子管道
+    （let 只支持字段路径）
+    """
+    if "pipeline" not in options:
+        return _mock_lookup_stage(in_collection, database, options)
+    foreign_collection = database.get_collection(options["from"])
+    for doc in in_collection:
+        variables = {
+            name: mock_helpers.get_value_by_dot(doc, path[1:])
+            for name, path in options.get("let", {}).items()
+        }
+        doc[options["as"]] = list(
+            foreign_collection.aggregate(
+                _substitute_variables(options["pipeline"], variables)
+            )
+        )
+    return in_collection
+
+
+def mock_lookup_pipeline():
+    """
+    使 mongomock 支持带 let/pipeline 的 $lookup，只在测试聚合管道模式时使用
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock_lookup_pipeline()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    """
+    return mock.patch.dict(
+        mock_aggregate._PIPELINE_HANDLERS, {"$lookup": _lookup_stage}
+    )
+
 
 def create_test_app():
     # 先创建app连接上数据库
@@ -34,8 +89,68 @@ def create_test_app():
     return app
 
 
+class QueryCounter:
+    """
+    统计代码块中对数据库发起的读查询次数（仅支持 mongomock）
+
+    with QueryCounter() as counter:
+        ...
+    counter.count
+    """
+
+    # find_one 和解引用最终都会调用 find
+    methods = [
+        (MockCollection, "find"),
+        (MockCollection, "aggregate"),
+        (MockCollection, "count_documents"),
+        (MockCollection, "distinct"),
+        (MockCursor, "count"),
+        (MockCursor, "distinct"),
+    ]
+
+    def __init__(self):
+        self.count = 0
+        self._depth = 0  # mongomock 内部的嵌套调用不重复计数
+        self._patches = []
+
+    def _wrap(self, func):
+        def wrapper(*args, **kwargs):
+            if self._depth == 0:
+                self.count += 1
+            self._depth += 1
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._depth -= 1
+
+        return wrapper
+
+    def __enter__(self):
+        for cls, name in self.methods:
+            patch = mock.patch.object(cls, name, self._wrap(getattr(cls, name)))
+            patch.start()
+            self._patches.append(patch)
+        return self
+
+    def __exit__(self, *exc):
+        for patch in self._patches:
+            patch.stop()
+        self._patches = []
+
+
+class WriteCounter(QueryCounter):
+    """统计代码块中对数据库发起的更新请求次数（仅支持 mongomock）"""
+
+    methods = [
+        (MockCollection, "update_one"),
+        (MockCollection, "update_many"),
+        (MockCollection, "bulk_write"),
+    ]
+
+
 class MoeTestCase(TestCase):
     maxDiff = None
+
     def setUp(self):
         self.app = create_test_app()
         self.app_context = self.app.app_context()
@@ -1,7 +1,12 @@
 import os
 
 from app import oss
-from app.constants.file import FileNotExistReason, FileSafeStatus, FileType
+from app.constants.file import (
+    FileNotExistReason,
+    FileSafeStatus,
+    FileType,
+    ParseStatus,
+)
 from app.exceptions import (
     FilenameIllegalError,
     FolderNotExistError,
@@ -11,12 +16,13 @@ from app.exceptions import (
     UploadFileNotFoundError,
 )
 from app.exceptions.project import ProjectFinishedError
+from app.models.file import File
 from app.models.language import Language
 from app.models.project import Project
 from app.models.team import Team
 from app.models.user import User
 from flask_apikit.exceptions import ValidateError
-from tests import TEST_FILE_PATH, MoeAPITestCase
+from tests import TEST_FILE_PATH, MoeAPITestCase, QueryCounter
 
 
 class FileAPITestCase(MoeAPITestCase):
@@ -529,3 +535,82 @@ class FileAPITestCase(MoeAPITestCase):
                 )
                 self.assertEqual(file3.safe_status, FileSafeStatus.BLOCK)
                 self.assertEqual(file3.file_not_exist_reason, FileNotExistReason.BLOCK)
+
+    def test_get_project_file_etag(self):
+        """测试文件列表的条件请求"""
+        token = self.create_user("11", "1@1.com", "111111").generate_token()
+        user = User.objects(email="1@1.com").first()
+        team = Team.create("t1", creator=user)
+        project = Project.create("p1", team=team, creator=user)
+        file1 = project.create_file("file1.txt")
+        url = "/v1/projects/{}/files".format(project.id)
+        headers = {"Authorization": "Bearer " + token}
+        with self.app.test_request_context():
+            data = self.get(url, token=token)
+            self.assertErrorEqual(data)
+            etag = data.headers.get("ETag")
+            self.assertIsNotNone(etag)
+            resp = self.client.get(url, headers={**headers, "If-None-Match": etag})
+            self.assertEqual(304, resp.status_code)
+            # 重命名后 ETag 失效
+            file1.rename("file2.txt")
+            resp = self.client.get(url, headers={**headers, "If-None-Match": etag})
+            self.assertEqual(200, resp.status_code)
+            self.assertEqual("file2.txt", resp.json[0]["name"])
+            etag = resp.headers.get("ETag")
+            # 后台任务修改状态后 ETag 失效
+            # 与后台任务相同重新读取文件，频繁的状态更新不读取项目
+            file1 = File.objects(id=file1.id).first()
+            with QueryCounter() as counter:
+                file1.update(safe_status=FileSafeStatus.SAFE)
+            self.assertEqual(0, counter.count)
+            resp = self.client.get(url, headers={**headers, "If-None-Match": etag})
+            self.assertEqual(200, resp.status_code)
+            self.assertNotEqual(etag, resp.headers.get("ETag"))
+            etag = resp.headers.get("ETag")
+            # 批量修改状态
+            files = File.objects(project=project)
+            File.bump_projects_files_version(files)
+            files.update(parse_status=ParseStatus.PARSING)
+            resp = self.client.get(url, headers={**headers, "If-None-Match": etag})
+            self.assertEqual(200, resp.status_code)
+            self.assertEqual(ParseStatus.PARSING, resp.json[0]["parse_status"])
+
+    def test_get_project_file_cursor(self):
+        """测试文件列表的游标分页"""
+        token = self.create_user("11", "1@1.com", "111111").generate_token()
+        user = User.objects(email="1@1.com").first()
+        team = Team.create("t1", creator=user)
+        project = Project.create("p1", team=team, creator=user)
+        names = ["dir1", "dir2", "a.txt", "b.txt", "c.txt"]
+        project.create_folder("dir2")
+        project.create_folder("dir1")
+        for name in ["c.txt", "a.txt", "b.txt"]:
+            project.create_file(name)
+        url = "/v1/projects/{}/files".format(project.id)
+        with self.app.test_request_context():
+            # 页码分页仍然可用
+            data = self.get(url, query_string={"page": 2, "limit": 2}, token=token)
+            self.assertErrorEqual(data)
+            self.assertEqual(names[2:4], [file["name"] for file in data.json])
+            self.assertEqual(5, int(data.headers.get("X-Pagination-Count")))
+            # 游标分页
+            result = []
+            cursor = ""
+            while True:
+                data = self.get(
+                    url, query_string={"limit": 2, "cursor": cursor}, token=token
+                )
+                self.assertErrorEqual(data)
+                result += [file["name"] for file in data.json]
+                cursor = data.headers.get("X-Pagination-Next-Cursor")
+                if not cursor:
+                    break
+            self.assertEqual(names, result)
+            # 游标分页不能自定义排序
+            data = self.get(
+                url,
+                query_string={"cursor": "", "order_by": "name"},
+                token=token,
+            )
+            self.assertErrorEqual(data, ValidateError)
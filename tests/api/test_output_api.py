@@ -1,9 +1,12 @@
+import csv
 import io
+import json
 import os
 from zipfile import ZipFile
 
 from app import oss
 from app.constants.output import OutputTypes
+from app.constants.source import SourcePositionType
 from app.models.language import Language
 from tests import TEST_FILE_PATH, MoeAPITestCase
 
@@ -18,6 +21,7 @@ class OutputAPITestCase(MoeAPITestCase):
             project.upload("1.png", file)
             project.upload("2.png", file)
             project.upload("3.png", file)
+        project.create_file("4.png")  # 未上传的图片记录在 errors.txt 中
         data = self.post(
             f"/v1/projects/{str(project.id)}/targets/{str(target.id)}/outputs",
             json={"type": OutputTypes.ALL},
@@ -42,6 +46,8 @@ class OutputAPITestCase(MoeAPITestCase):
         self.assertIn("[1.png]", translations_txt)
         self.assertIn("[2.png]", translations_txt)
         self.assertIn("[3.png]", translations_txt)
+        self.assertNotIn("images/4.png", output_zip_namelist)
+        self.assertIn("4.png", output_zip.read("errors.txt").decode("utf-8"))
 
     def test_output_project2(self):
         """测试导出项目全部内容（不含图片）"""
@@ -241,3 +247,87 @@ class OutputAPITestCase(MoeAPITestCase):
         self.assertIn("[1.png]", translations_txt)
         self.assertIn("[2.png]", translations_txt)
         self.assertIn("[3.png]", translations_txt)
+
+    def test_output_project_formats(self):
+        """测试导出 JSON 和 CSV，导出全部内容时同时包含所有格式"""
+        project = self.create_project("p", target_languages=Language.by_code("en"))
+        target = project.targets().first()
+        user = self.get_creator(project)
+        token = user.generate_token()
+        with open(os.path.join(TEST_FILE_PATH, "2kb.png"), "rb") as file:
+            file1 = project.upload("1.png", file)
+        source = file1.create_source("s1", x=0.5, y=0.25)
+        source.create_translation("t1", target=target, user=user)
+        source.create_tip("tip1", target=target, user=user)
+        # 同一目标语言连续导出
+        self.addCleanup(
+            self.app.config.__setitem__,
+            "OUTPUT_WAIT_SECONDS",
+            self.app.config["OUTPUT_WAIT_SECONDS"],
+        )
+        self.app.config["OUTPUT_WAIT_SECONDS"] = 0
+        for type in [OutputTypes.ONLY_JSON, OutputTypes.ONLY_CSV, OutputTypes.ALL]:
+            data = self.post(
+                f"/v1/projects/{str(project.id)}/targets/{str(target.id)}/outputs",
+                json={"type": type},
+                token=token,
+            )
+            self.assertErrorEqual(data)
+        json_output, csv_output, all_output = project.outputs().order_by("id")
+        contents = {}
+        for output in [json_output, csv_output]:
+            contents[output.file_name.rsplit(".", 1)[1]] = oss.download(
+                self.app.config["OSS_OUTPUT_PREFIX"] + str(output.id) + "/",
+                output.file_name,
+            ).read()
+        output_zip = ZipFile(
+            io.BytesIO(
+                oss.download(
+                    self.app.config["OSS_OUTPUT_PREFIX"] + str(all_output.id) + "/",
+                    all_output.file_name,
+                ).read()
+            )
+        )
+        self.assertEqual(contents["json"], output_zip.read("translations.json"))
+        self.assertEqual(contents["csv"], output_zip.read("translations.csv"))
+        self.assertIn("translations.txt", output_zip.namelist())
+        # JSON
+        translations_json = json.loads(contents["json"])
+        self.assertEqual("en", translations_json["target_language"])
+        self.assertEqual(
+            [
+                {
+                    "id": str(file1.id),
+                    "file_name": "1.png",
+                    "sources": [
+                        {
+                            "id": str(source.id),
+                            "content": "s1",
+                            "x": 0.5,
+                            "y": 0.25,
+                            "position_type": SourcePositionType.IN,
+                            "translation": "t1",
+                            "tips": ["tip1"],
+                        }
+                    ],
+                }
+            ],
+            translations_json["files"],
+        )
+        # CSV
+        rows = list(csv.reader(io.StringIO(contents["csv"].decode("utf-8-sig"))))
+        self.assertEqual(
+            [
+                [
+                    "file_name",
+                    "label",
+                    "x",
+                    "y",
+                    "position_type",
+                    "source",
+                    "translation",
+                ],
+                ["1.png", "1", "0.5", "0.25", str(SourcePositionType.IN), "s1", "t1"],
+            ],
+            rows,
+        )
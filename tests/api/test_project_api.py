@@ -21,6 +21,7 @@ from app.models.language import Language
 from app.models.project import Project, ProjectRole, ProjectSet
 from app.models.team import Team
 from app.models.user import User
+from app import oss
 from flask_apikit.exceptions import ValidateError
 from tests import MoeAPITestCase
 
@@ -1788,3 +1789,9 @@ class ProjectAPITestCase(MoeAPITestCase):
         source1_translations = sources[1].translations()
         self.assertEqual(source1_translations.count(), 1)
         self.assertEqual(source1_translations[0].content, "第一行\n\n")
+        # 导入文本只保存在储存服务中，导入完成后删除
+        self.assertEqual(project.import_from_labelplus_txt, "")
+        self.assertEqual(project.import_from_labelplus_save_name, "")
+        self.assertFalse(
+            oss.is_exist(self.app.config["OSS_IMPORT_PREFIX"], f"{project.id}.txt")
+        )
@@ -10,7 +10,7 @@ from app.models.project import Project
 from app.models.team import Team
 from app.models.user import User
 from flask_apikit.exceptions import ValidateError
-from tests import MoeAPITestCase
+from tests import MoeAPITestCase, mock_lookup_pipeline
 
 
 class SourceAPITestCase(MoeAPITestCase):
@@ -431,3 +431,147 @@ class SourceAPITestCase(MoeAPITestCase):
                 json={"position_type": 3},
             )
             self.assertErrorEqual(data, ValidateError)
+
+    def test_get_sources_etag(self):
+        """测试原文列表的条件请求"""
+        token = self.create_user("11", "1@1.com", "111111").generate_token()
+        user = User.objects(email="1@1.com").first()
+        token2 = self.create_user("22", "2@2.com", "111111").generate_token()
+        team = Team.create("t1", creator=user)
+        project = Project.create("p1", team=team, creator=user)
+        target = project.targets().first()
+        image_file = project.create_file("f1.jpg")
+        source = image_file.create_source("1")
+        url = "/v1/files/{}/sources".format(image_file.id)
+        query = {"target_id": str(target.id)}
+        with self.app.test_request_context():
+            data = self.get(url, query_string=query, token=token)
+            self.assertErrorEqual(data)
+            etag = data.headers.get("ETag")
+            self.assertIsNotNone(etag)
+            self.assertIn("ETAG", data.headers.get("Access-Control-Expose-Headers"))
+            # 未修改返回 304
+            resp = self.client.get(
+                url,
+                query_string=query,
+                headers={"Authorization": "Bearer " + token, "If-None-Match": etag},
+            )
+            self.assertEqual(304, resp.status_code)
+            self.assertEqual(etag, resp.headers.get("ETag"))
+            # 查询参数不同则 ETag 不同
+            data = self.get(
+                url, query_string={**query, "page": 2, "limit": 1}, token=token
+            )
+            self.assertNotEqual(etag, data.headers.get("ETag"))
+            # 没有权限的用户不能通过 304 获取信息
+            data = self.get(
+                url,
+                query_string=query,
+                token=token2,
+                headers={"Origin": "https://example.com", "If-None-Match": etag},
+            )
+            self.assertErrorEqual(data, NoPermissionError)
+            # 新增翻译后 ETag 失效
+            source.create_translation("t", target=target, user=user)
+            resp = self.client.get(
+                url,
+                query_string=query,
+                headers={"Authorization": "Bearer " + token, "If-None-Match": etag},
+            )
+            self.assertEqual(200, resp.status_code)
+            self.assertEqual("t", resp.json[0]["my_translation"]["content"])
+            self.assertNotEqual(etag, resp.headers.get("ETag"))
+            etag = resp.headers.get("ETag")
+            # 与 OCR 任务相同，直接调用 create_source 新增原文后 ETag 失效
+            image_file.create_source("2", x=0.5, y=0.5, machine=True, rank=1)
+            resp = self.client.get(
+                url,
+                query_string=query,
+                headers={"Authorization": "Bearer " + token, "If-None-Match": etag},
+            )
+            self.assertEqual(200, resp.status_code)
+            self.assertEqual(2, len(resp.json))
+            self.assertNotEqual(etag, resp.headers.get("ETag"))
+
+    def test_get_sources_cursor(self):
+        """测试原文列表的游标分页"""
+        token = self.create_user("11", "1@1.com", "111111").generate_token()
+        user = User.objects(email="1@1.com").first()
+        team = Team.create("t1", creator=user)
+        project = Project.create("p1", team=team, creator=user)
+        target = project.targets().first()
+        image_file = project.create_file("f1.jpg")
+        for i in range(5):
+            image_file.create_source(str(i))
+        url = "/v1/files/{}/sources".format(image_file.id)
+        with self.app.test_request_context():
+            contents = []
+            cursor = ""
+            for _ in range(3):
+                data = self.get(
+                    url,
+                    query_string={"target_id": str(target.id), "limit": 2, "cursor": cursor},
+                    token=token,
+                )
+                self.assertErrorEqual(data)
+                self.assertIsNone(data.headers.get("X-Pagination-Count"))
+                contents += [source["content"] for source in data.json]
+                cursor = data.headers.get("X-Pagination-Next-Cursor")
+            self.assertEqual(["0", "1", "2", "3", "4"], contents)
+            self.assertEqual("", cursor)
+            # 需要时返回总数
+            data = self.get(
+                url,
+                query_string={
+                    "target_id": str(target.id),
+                    "limit": 2,
+                    "cursor": "",
+                    "count": "true",
+                },
+                token=token,
+            )
+            self.assertEqual(5, int(data.headers.get("X-Pagination-Count")))
+            # 错误的游标
+            data = self.get(
+                url,
+                query_string={"target_id": str(target.id), "cursor": "bad"},
+                token=token,
+            )
+            self.assertErrorEqual(data, ValidateError)
+
+    def test_get_sources_cursor_same_rank(self):
+        """测试游标分页时 rank 相同的原文跨越分页边界"""
+        token = self.create_user("11", "1@1.com", "111111").generate_token()
+        user = User.objects(email="1@1.com").first()
+        team = Team.create("t1", creator=user)
+        project = Project.create("p1", team=team, creator=user)
+        target = project.targets().first()
+        image_file = project.create_file("f1.jpg")
+        for i, rank in enumerate([0, 1, 1, 1, 2]):
+            image_file.create_source(str(i), rank=rank)
+        url = "/v1/files/{}/sources".format(image_file.id)
+        old_mode = self.app.config.get("TRANSLATOR_QUERY_MODE")
+        self.addCleanup(self.app.config.update, TRANSLATOR_QUERY_MODE=old_mode)
+        patcher = mock_lookup_pipeline()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for mode in ["query", "pipeline"]:
+            with self.subTest(mode=mode), self.app.test_request_context():
+                self.app.config["TRANSLATOR_QUERY_MODE"] = mode
+                contents = []
+                cursor = ""
+                for _ in range(3):
+                    data = self.get(
+                        url,
+                        query_string={
+                            "target_id": str(target.id),
+                            "limit": 2,
+                            "cursor": cursor,
+                        },
+                        token=token,
+                    )
+                    self.assertErrorEqual(data)
+                    contents += [source["content"] for source in data.json]
+                    cursor = data.headers.get("X-Pagination-Next-Cursor")
+                self.assertEqual(["0", "1", "2", "3", "4"], contents)
+                self.assertEqual("", cursor)
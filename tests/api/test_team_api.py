@@ -1,3 +1,5 @@
+import datetime
+
 from mongoengine import DoesNotExist
 
 from app.core.rbac import AllowApplyType, ApplicationCheckType
@@ -1002,6 +1004,36 @@ class TeamProjectAPITestCase(MoeAPITestCase):
             )
             self.assertEqual("0", data.headers.get("X-Pagination-Count"))
 
+    def test_get_team_project_cursor(self):
+        """测试团队项目的游标分页"""
+        with self.app.test_request_context():
+            token1 = self.create_user("11", "1@1.com", "111111").generate_token()
+            user1 = User.by_name("11")
+            team1 = Team.create("t1", creator=user1)
+            projects = [
+                Project.create(f"p{i}", team=team1, creator=user1) for i in range(5)
+            ]
+            # 修改时间相同时按 id 排序
+            same_time = datetime.datetime(2020, 1, 1)
+            for project in projects[:3]:
+                project.update(edit_time=same_time)
+            projects[3].update(edit_time=datetime.datetime(2021, 1, 1))
+            projects[4].update(edit_time=datetime.datetime(2019, 1, 1))
+            names = []
+            cursor = ""
+            while True:
+                data = self.get(
+                    f"/v1/teams/{str(team1.id)}/projects",
+                    query_string={"limit": 2, "cursor": cursor},
+                    token=token1,
+                )
+                self.assertErrorEqual(data)
+                names += [project["name"] for project in data.json]
+                cursor = data.headers.get("X-Pagination-Next-Cursor")
+                if not cursor:
+                    break
+            self.assertEqual(["p3", "p0", "p1", "p2", "p4"], names)
+
 
 class TeamProjectSetAPITestCase(MoeAPITestCase):
     def test_get_team_project_set(self):
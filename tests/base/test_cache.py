@@ -0,0 +1,123 @@
+import tempfile
+import time
+from unittest import TestCase
+
+from app.services.cache import (
+    Cache,
+    DiskCacheBackend,
+    LRUCacheBackend,
+    NullCacheBackend,
+    RedisCacheBackend,
+)
+
+
+class FakeRedis:
+    """实现 get/set/delete 的本地 Redis 替身"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        value = self.data.get(key)
+        if value is None:
+            return None
+        expire_at, value = value
+        if expire_at is not None and expire_at <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def set(self, key, value, ex=None):
+        expire_at = time.monotonic() + ex if ex else None
+        self.data[key] = (expire_at, value)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+class BrokenBackend:
+    def get(self, key):
+        raise ConnectionError
+
+    def set(self, key, value, ttl=None):
+        raise ConnectionError
+
+    def delete(self, key):
+        raise ConnectionError
+
+
+class CacheTestCase(TestCase):
+    def test_lru_backend(self):
+        """LRU 超出容量时淘汰最久未使用的"""
+        backend = LRUCacheBackend(max_size=2)
+        backend.set("a", 1)
+        backend.set("b", 2)
+        self.assertEqual(1, backend.get("a"))  # a 变为最近使用
+        backend.set("c", 3)
+        self.assertIsNone(backend.get("b"))
+        self.assertEqual(1, backend.get("a"))
+        self.assertEqual(3, backend.get("c"))
+        self.assertEqual(2, len(backend))
+        backend.delete("a")
+        self.assertIsNone(backend.get("a"))
+
+    def test_lru_backend_ttl(self):
+        """LRU 过期"""
+        backend = LRUCacheBackend(max_size=2, default_ttl=0.05)
+        backend.set("a", 1)
+        backend.set("b", 2, ttl=60)
+        self.assertEqual(1, backend.get("a"))
+        time.sleep(0.06)
+        self.assertIsNone(backend.get("a"))
+        self.assertEqual(2, backend.get("b"))
+
+    def test_redis_backend(self):
+        """Redis 后端序列化任意对象，并带有前缀和过期时间"""
+        client = FakeRedis()
+        backend = RedisCacheBackend(client, prefix="test:", default_ttl=60)
+        value = ([{"id": "1", "content": "内容"}], 3)
+        backend.set("a", value)
+        self.assertEqual(value, backend.get("a"))
+        self.assertIn("test:a", client.data)
+        self.assertIsNotNone(client.data["test:a"][0])
+        backend.delete("a")
+        self.assertIsNone(backend.get("a"))
+        self.assertIsNone(backend.get("not-exist"))
+
+    def test_disk_backend(self):
+        """磁盘后端可被其他进程（另一个实例）读取，并带有过期时间"""
+        with tempfile.TemporaryDirectory() as directory:
+            backend = DiskCacheBackend(directory, default_ttl=60)
+            value = ([{"id": "1", "content": "内容"}], 3)
+            backend.set("a", value)
+            self.assertEqual(value, DiskCacheBackend(directory).get("a"))
+            backend.set("b", 2, ttl=0.05)
+            time.sleep(0.06)
+            self.assertIsNone(backend.get("b"))
+            backend.delete("a")
+            backend.delete("a")
+            self.assertIsNone(backend.get("a"))
+
+    def test_cache_init(self):
+        """根据配置选择后端"""
+        cache = Cache()
+        self.assertIsInstance(cache.backend, NullCacheBackend)
+        cache.init({"CACHE_TYPE": "memory", "CACHE_MEMORY_MAX_SIZE": 10})
+        self.assertIsInstance(cache.backend, LRUCacheBackend)
+        self.assertEqual(10, cache.backend.max_size)
+        cache.init({"CACHE_TYPE": "redis", "CACHE_REDIS_URL": "redis://localhost/0"})
+        self.assertIsInstance(cache.backend, RedisCacheBackend)
+        with tempfile.TemporaryDirectory() as directory:
+            cache.init({"CACHE_TYPE": "disk", "CACHE_DISK_DIR": directory})
+            self.assertIsInstance(cache.backend, DiskCacheBackend)
+        cache.init({"CACHE_TYPE": "none"})
+        cache.set("a", 1)
+        self.assertIsNone(cache.get("a"))
+
+    def test_cache_backend_error(self):
+        """后端出错时当作未命中"""
+        cache = Cache()
+        cache.backend = BrokenBackend()
+        cache.set("a", 1)
+        self.assertIsNone(cache.get("a"))
+        cache.delete("a")
@@ -0,0 +1,401 @@
+import io
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+from zipfile import ZIP_STORED, ZipFile
+
+from app.constants.storage import StorageType
+from app.services.cache import LRUCacheBackend
+from app.services.oss import (
+    OSS,
+    LocalStorageBackend,
+    ObjectStream,
+    OSSMultipartUploadWriter,
+    OSSStorageBackend,
+    S3StorageBackend,
+)
+from tests import MoeTestCase
+
+
+class FakeBucket:
+    """记录分片上传的请求，完成后合并为对象"""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+
+    def put_object(self, key, data, headers=None, progress_callback=None):
+        self.objects[key] = data
+
+    def get_object(self, key, byte_range=None):
+        data = self.objects[key]
+        if byte_range:
+            start, end = byte_range
+            data = data[start : None if end is None else end + 1]
+        stream = io.BytesIO(data)
+        # 与 GetObjectResult 相同，read(None) 读取全部
+        return SimpleNamespace(
+            read=stream.read,
+            resp=SimpleNamespace(response=SimpleNamespace(close=stream.close)),
+        )
+
+    def init_multipart_upload(self, key, headers=None):
+        upload_id = str(len(self.uploads))
+        self.uploads[upload_id] = {}
+        return SimpleNamespace(upload_id=upload_id)
+
+    def upload_part(self, key, upload_id, part_number, data):
+        self.uploads[upload_id][part_number] = data
+        return SimpleNamespace(etag=str(part_number))
+
+    def complete_multipart_upload(self, key, upload_id, parts):
+        upload = self.uploads.pop(upload_id)
+        self.objects[key] = b"".join(upload[part.part_number] for part in parts)
+
+    def abort_multipart_upload(self, key, upload_id):
+        self.uploads.pop(upload_id)
+
+
+class FakeS3Error(Exception):
+    """与 botocore 的 ClientError 相同，错误码在 response 中"""
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+class FakeS3Client:
+    """内存中的 S3 client，行为与 boto3 的 S3 client 相同"""
+
+    def __init__(self):
+        self.objects = {}
+        self.extra_args = {}
+        self.uploads = {}
+        self.delete_requests = []
+
+    def _body(self, Body):
+        return Body if isinstance(Body, bytes) else Body.read()
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = self._body(Body)
+        self.extra_args[Key] = kwargs
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, Callback=None):
+        self.objects[Key] = Fileobj.read()
+        self.extra_args[Key] = ExtraArgs or {}
+        if Callback:
+            Callback(len(self.objects[Key]))
+
+    def get_object(self, Bucket, Key, Range=None):
+        if Key not in self.objects:
+            raise FakeS3Error("NoSuchKey")
+        data = self.objects[Key]
+        if Range:
+            start, end = Range[len("bytes=") :].split("-")
+            data = data[int(start) : int(end) + 1 if end else None]
+        return {"Body": io.BytesIO(data)}
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise FakeS3Error("404")
+        return {"ContentLength": len(self.objects[Key])}
+
+    def download_file(self, Bucket, Key, Filename):
+        if Key not in self.objects:
+            raise FakeS3Error("404")
+        with open(Filename, "wb") as file:
+            file.write(self.objects[Key])
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+    def delete_objects(self, Bucket, Delete):
+        self.delete_requests.append(len(Delete["Objects"]))
+        for item in Delete["Objects"]:
+            self.objects.pop(item["Key"], None)
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        upload_id = str(len(self.uploads))
+        self.uploads[upload_id] = {}
+        self.extra_args[Key] = kwargs
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.uploads[UploadId][PartNumber] = Body
+        return {"ETag": str(PartNumber)}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        upload = self.uploads.pop(UploadId)
+        self.objects[Key] = b"".join(
+            upload[part["PartNumber"]] for part in MultipartUpload["Parts"]
+        )
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId)
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn):
+        query = "&".join(
+            f"{name}={value}" for name, value in Params.items() if name != "Key"
+        )
+        return f"https://s3/{Params['Key']}?{query}&Expires={ExpiresIn}"
+
+
+class OSSTestCase(MoeTestCase):
+    def test_init_backend(self):
+        """根据 STORAGE_TYPE 选择储存后端"""
+        storage = OSS(dict(self.app.config, STORAGE_TYPE=StorageType.LOCAL_STORAGE))
+        self.assertIsInstance(storage.backend, LocalStorageBackend)
+        self.assertFalse(storage.supports_image_process)
+        storage.init(
+            dict(
+                self.app.config,
+                STORAGE_TYPE=StorageType.OSS,
+                OSS_ENDPOINT="https://oss-cn-shanghai.aliyuncs.com",
+                OSS_BUCKET_NAME="bucket",
+                STORAGE_POOL_SIZE=32,
+            )
+        )
+        self.assertIsInstance(storage.backend, OSSStorageBackend)
+        self.assertTrue(storage.supports_image_process)
+        # 连接池大小与配置相同
+        adapter = storage.backend.bucket.session.session.get_adapter("https://a")
+        self.assertEqual(32, adapter._pool_maxsize)
+
+    def test_multipart_upload_writer(self):
+        bucket = FakeBucket()
+        with OSSMultipartUploadWriter(bucket, "a", part_size=4) as writer:
+            writer.write(b"12345")
+            writer.write(b"678")
+            self.assertEqual(2, len(writer.parts))
+        self.assertEqual(b"12345678", bucket.objects["a"])
+        # 空文件
+        with OSSMultipartUploadWriter(bucket, "b", part_size=4):
+            pass
+        self.assertEqual(b"", bucket.objects["b"])
+        # 出错时取消上传
+        with self.assertRaises(ValueError):
+            with OSSMultipartUploadWriter(bucket, "c", part_size=4) as writer:
+                writer.write(b"12345")
+                raise ValueError
+        self.assertNotIn("c", bucket.objects)
+        self.assertEqual({}, bucket.uploads)
+
+    def test_multipart_upload_writer_zip(self):
+        """ZipFile 可以直接写入不能 seek 的分片上传流"""
+        bucket = FakeBucket()
+        with OSSMultipartUploadWriter(bucket, "a.zip", part_size=1024) as writer:
+            with ZipFile(writer, "w") as zip_file:
+                zip_file.writestr("1.png", b"\x89PNG" * 1000, compress_type=ZIP_STORED)
+                zip_file.writestr("a.txt", "a")
+        with ZipFile(io.BytesIO(bucket.objects["a.zip"])) as zip_file:
+            self.assertEqual(["1.png", "a.txt"], zip_file.namelist())
+            self.assertEqual(b"\x89PNG" * 1000, zip_file.read("1.png"))
+
+    def test_multipart_upload(self):
+        storage = OSSStorageBackend(
+            FakeBucket(), "https://oss/", multipart_threshold=8, part_size=4
+        )
+        # 小于阈值直接上传
+        storage.multipart_upload("p/", "a", io.BytesIO(b"1234"))
+        self.assertEqual(b"1234", storage.bucket.objects["p/a"])
+        self.assertEqual(0, len(storage.bucket.uploads))
+        # 文件流逐个分片上传
+        with mock.patch.object(
+            storage.bucket, "upload_part", wraps=storage.bucket.upload_part
+        ) as upload_part:
+            storage.multipart_upload("p/", "b", io.BytesIO(b"1234567890"))
+        self.assertEqual(b"1234567890", storage.bucket.objects["p/b"])
+        self.assertEqual(3, upload_part.call_count)
+        # 有本地路径的文件使用断点续传
+        with (
+            tempfile.NamedTemporaryFile() as file,
+            open(file.name, "rb") as local_file,
+            mock.patch("oss2.resumable_upload") as resumable_upload,
+        ):
+            storage.multipart_upload("p/", "c", local_file)
+        resumable_upload.assert_called_once()
+        self.assertEqual(
+            (storage.bucket, "p/c", file.name), resumable_upload.call_args.args
+        )
+        self.assertEqual(4, resumable_upload.call_args.kwargs["part_size"])
+
+    def test_multipart_upload_local(self):
+        with tempfile.TemporaryDirectory() as storage_path:
+            storage = LocalStorageBackend(storage_path, "https://local/", part_size=4)
+            storage.multipart_upload("p/", "a", io.BytesIO(b"1234567890"))
+            with open(os.path.join(storage_path, "p", "a"), "rb") as file:
+                self.assertEqual(b"1234567890", file.read())
+
+    def test_download_stream(self):
+        """OSS 返回流式响应体，读取和关闭方式与本地文件相同"""
+        storage = OSSStorageBackend(FakeBucket(), "https://oss/")
+        storage.bucket.objects["p/a"] = b"1234567890"
+        with storage.download("p/", "a") as stream:
+            self.assertIsInstance(stream, ObjectStream)
+            self.assertFalse(stream.seekable())
+            self.assertEqual(b"123", stream.read(3))
+            self.assertEqual(b"4567890", stream.read())
+        self.assertTrue(stream.closed)
+        with storage.download_range("p/", "a", 2, 4) as stream:
+            self.assertEqual(b"345", stream.read())
+
+
+class S3StorageTestCase(MoeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = S3StorageBackend(FakeS3Client(), "bucket", part_size=4)
+        self.client = self.storage.client
+
+    def test_upload_and_download(self):
+        storage = self.storage
+        self.assertFalse(storage.is_exist("p/", "a"))
+        storage.upload("p/", "a", "文本")
+        storage.upload("p/", "b", io.BytesIO(b"1234567890"))
+        self.assertTrue(storage.is_exist("p/", "a"))
+        self.assertEqual("文本".encode("utf-8"), self.client.objects["p/a"])
+        with storage.download("p/", "b") as stream:
+            self.assertIsInstance(stream, ObjectStream)
+            self.assertEqual(b"123", stream.read(3))
+            self.assertEqual(b"4567890", stream.read())
+        with storage.download_range("p/", "b", 2, 4) as stream:
+            self.assertEqual(b"345", stream.read())
+        with storage.download_range("p/", "b", 8) as stream:
+            self.assertEqual(b"90", stream.read())
+        with tempfile.TemporaryDirectory() as tmp_path:
+            local_path = os.path.join(tmp_path, "b")
+            storage.download("p/", "b", local_path=local_path)
+            with open(local_path, "rb") as file:
+                self.assertEqual(b"1234567890", file.read())
+            # 文件不存在时与本地储存相同，抛出 FileNotFoundError
+            with self.assertRaises(FileNotFoundError):
+                storage.download("p/", "c", local_path=local_path)
+        with self.assertRaises(FileNotFoundError):
+            storage.download("p/", "c")
+        # 缩略图保存为 <处理名>-<文件名>
+        self.assertFalse(storage.is_exist("p/", "a", process_name="cover"))
+        storage.upload("p/", "cover-a", b"")
+        self.assertTrue(storage.is_exist("p/", "a", process_name="cover"))
+
+    def test_headers(self):
+        """OSS 风格的 HTTP 头转换为 S3 的上传参数"""
+        headers = {"Content-Disposition": 'attachment;"'.encode("utf8"), "X-A": "1"}
+        self.storage.multipart_upload("p/", "a", io.BytesIO(b"1"), headers=headers)
+        self.assertEqual(
+            {"ContentDisposition": 'attachment;"'}, self.client.extra_args["p/a"]
+        )
+        with self.storage.open_upload("p/", "b", headers=headers) as writer:
+            writer.write(b"1")
+        self.assertEqual(
+            {"ContentDisposition": 'attachment;"'}, self.client.extra_args["p/b"]
+        )
+
+    def test_multipart_upload(self):
+        progress = []
+        self.storage.multipart_upload(
+            "p/",
+            "a",
+            io.BytesIO(b"1234567890"),
+            progress_callback=lambda consumed, total: progress.append(consumed),
+        )
+        self.assertEqual(b"1234567890", self.client.objects["p/a"])
+        self.assertEqual([10], progress)
+        # 边写入边上传
+        with self.storage.open_upload("p/", "b") as writer:
+            writer.write(b"12345")
+            writer.write(b"678")
+        self.assertEqual(b"12345678", self.client.objects["p/b"])
+        with self.assertRaises(ValueError):
+            with self.storage.open_upload("p/", "c") as writer:
+                writer.write(b"12345")
+                raise ValueError
+        self.assertNotIn("p/c", self.client.objects)
+        self.assertEqual({}, self.client.uploads)
+
+    def test_delete(self):
+        names = [str(i) for i in range(1001)]
+        for name in names:
+            self.storage.upload("p/", name, b"")
+        self.storage.upload("p/", "a", b"")
+        self.storage.delete("p/", "a")
+        self.assertFalse(self.storage.is_exist("p/", "a"))
+        # 不存在的文件被忽略
+        self.storage.delete("p/", "a")
+        # 批量删除每次最多 1000 个
+        self.storage.delete("p/", names)
+        self.assertEqual([1000, 1], self.client.delete_requests)
+        self.assertEqual({}, self.client.objects)
+        self.storage.rmdir("p/")
+
+    def test_sign_url(self):
+        self.assertEqual(
+            "https://s3/p/cover-a.jpg?Bucket=bucket&Expires=604800",
+            self.storage.sign_url(
+                "p/", "a.jpg", expires=86400 * 30, process_name="cover"
+            ),
+        )
+        self.assertEqual(
+            "https://s3/p/a.zip?Bucket=bucket"
+            + "&ResponseContentDisposition=attachment&Expires=3600",
+            self.storage.sign_url("p/", "a.zip", expires=3600, download=True),
+        )
+
+
+class SignURLCacheTestCase(MoeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = OSS()
+        self.storage.backend = LocalStorageBackend("/tmp", "https://local/")
+        self.storage.url_cache = LRUCacheBackend(max_size=3)
+        patcher = mock.patch.object(
+            self.storage.backend, "sign_url", wraps=self.storage.backend.sign_url
+        )
+        self.sign_url = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sign_url_cache(self):
+        storage = self.storage
+        with mock.patch("time.time", return_value=3600 * 100):
+            self.assertEqual("https://local/p/a", storage.sign_url("p/", "a"))
+            self.assertEqual("https://local/p/a", storage.sign_url("p/", "a"))
+            self.assertEqual(1, self.sign_url.call_count)
+            # 处理名称和参数不同时分别缓存
+            self.assertEqual(
+                "https://local/p/cover-a",
+                storage.sign_url("p/", "a", process_name="cover"),
+            )
+            storage.sign_url("p/", "a", download=True)
+            self.assertEqual(3, self.sign_url.call_count)
+            # 不能作为 key 的参数不缓存
+            storage.sign_url("p/", "a", headers={})
+            storage.sign_url("p/", "a", headers={})
+            self.assertEqual(5, self.sign_url.call_count)
+        # 进入下一个时间窗口后重新签发
+        with mock.patch("time.time", return_value=3600 * 100 + 604800):
+            storage.sign_url("p/", "a")
+            self.assertEqual(6, self.sign_url.call_count)
+        # 超出数量后淘汰最久未使用的 URL
+        self.assertEqual(3, len(storage.url_cache))
+
+    def test_sign_urls(self):
+        storage = self.storage
+        storage.sign_url("p/", "b")
+        urls = storage.sign_urls(
+            [("p/", "a", None), ("p/", "b", None), ("p/", "a", "cover")]
+        )
+        self.assertEqual(
+            ["https://local/p/a", "https://local/p/b", "https://local/p/cover-a"],
+            urls,
+        )
+        # 只为缓存中没有的文件签发
+        self.assertEqual(3, self.sign_url.call_count)
+        # 不缓存时每次都签发
+        storage.url_cache = None
+        storage.sign_urls([("p/", "a", None), ("p/", "a", None)])
+        self.assertEqual(5, self.sign_url.call_count)
+
+    def test_sign_url_window(self):
+        """S3 的预签名 URL 包含签发时间，只在有效期的前一半内复用"""
+        storage = S3StorageBackend(FakeS3Client(), "bucket")
+        self.assertEqual(1800, storage.sign_url_window(3600))
+        self.assertEqual(302400, storage.sign_url_window(86400 * 30))
@@ -1,5 +1,20 @@
+import datetime
+import io
+import random
+import re
+
+from bson import ObjectId
+
 from app.utils.str import to_underscore
-from app.utils.labelplus import load_from_labelplus
+from app.utils.labelplus import (
+    iter_labelplus,
+    iter_labelplus_lines,
+    load_from_labelplus,
+    validate_labelplus,
+)
+from app.utils.mongo import decode_cursor, encode_cursor, mongo_keyset
+from app.utils.term_matcher import TermMatcher
+from app.utils.text import CountingReader, detect_charset, iter_lines
 from tests import MoeTestCase
 
 
@@ -145,3 +160,131 @@ class TestUtilsCase(MoeTestCase):
                 },
             ],
         )
+
+    def test_iter_labelplus(self):
+        labelplus = (
+            "1,0\r\n-\r\n框内\r\n-\r\n"
+            ">>>>>>>>[1.jpg]<<<<<<<<\r\n"
+            "----------------[1]----------------[0.5,0.2,1]\r\n"
+            "a\r\n\r\nb\r\n"
+            ">>>>>>>>[2.jpg]<<<<<<<<\r\n"
+            "忽略\r\n"
+            ">>>>>>>>[3.jpg]<<<<<<<<\r\n"
+            "----------------[1]----------------[0.1,0.9,2]\r\n"
+            "----------------[2]----------------[0.3,0.4,1]\r\n"
+            "c\r\n"
+        )
+        expected = [
+            {
+                "file_name": "1.jpg",
+                "labels": [
+                    {"x": 0.5, "y": 0.2, "position_type": 1, "translation": "a\n\nb"}
+                ],
+            },
+            {"file_name": "2.jpg", "labels": []},
+            {
+                "file_name": "3.jpg",
+                "labels": [
+                    {"x": 0.1, "y": 0.9, "position_type": 2, "translation": ""},
+                    {"x": 0.3, "y": 0.4, "position_type": 1, "translation": "c"},
+                ],
+            },
+        ]
+        self.assertEqual(expected, load_from_labelplus(labelplus))
+        # 从文本流逐个文件读取
+        files = iter_labelplus(io.StringIO(labelplus, newline=""))
+        self.assertEqual(expected[0], next(files))
+        self.assertEqual(expected[1:], list(files))
+        self.assertEqual(3, validate_labelplus(labelplus))
+        self.assertEqual(0, validate_labelplus(""))
+        # 坐标错误或标签不属于任何文件
+        for labelplus in [
+            ">>>>>>>>[1.jpg]<<<<<<<<\n----------------[1]----------------[a,0.2,1]",
+            "----------------[1]----------------[0.5,0.2,1]",
+        ]:
+            with self.assertRaises(ValueError):
+                validate_labelplus(labelplus)
+            with self.assertRaises(ValueError):
+                load_from_labelplus(labelplus)
+
+    def test_iter_labelplus_lines(self):
+        """从二进制流读取与直接使用文本的分行相同"""
+        for labelplus in ["", "a", "a\n", "a\r\n\r\nb\r", "一\r二\n\n", "\n"]:
+            stream = io.BytesIO(labelplus.encode("utf-8"))
+            self.assertEqual(
+                io.StringIO(labelplus, newline=None).read().splitlines(),
+                list(iter_labelplus_lines(stream)),
+            )
+
+    def test_cursor(self):
+        values = [datetime.datetime(2020, 1, 2, 3, 4, 5, 6000), ObjectId(), "a/b"]
+        self.assertEqual(values, decode_cursor(encode_cursor(values)))
+        for cursor in ["", "zzz", encode_cursor({"a": 1})[:-2], "e30="]:
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+    def test_mongo_keyset(self):
+        from app.models.project import Project
+
+        id = ObjectId()
+        time = datetime.datetime(2020, 1, 1)
+        et = Project.edit_time.db_field
+        self.assertEqual(
+            {"$or": [{et: {"$lt": time}}, {et: time, "_id": {"$gt": id}}]},
+            mongo_keyset(Project, ["-edit_time", "id"], [time, id]),
+        )
+        with self.assertRaises(ValueError):
+            mongo_keyset(Project, ["-edit_time", "id"], [time])
+
+    def test_detect_charset(self):
+        self.assertEqual("utf-8", detect_charset(b"abc"))
+        self.assertEqual("utf-8", detect_charset("中文".encode("utf-8") * 100))
+        # GB2312 替换为 GB18030，开头之后出现的 GBK 字符也能解码
+        self.assertEqual(
+            "gb18030", detect_charset("这是一段中文文本。".encode("gb2312") * 100)
+        )
+        self.assertIsNone(detect_charset(b""))
+
+    def test_iter_lines(self):
+        text = "第一行\r\n第二行\r第三行\n\n\r\n最后"
+        for encoding in ["utf-8", "utf-16", "gb18030", "shift_jis"]:
+            data = text.replace("第", "だい").encode(encoding)
+            expected = re.split(r"\n|\r\n|\r", text.replace("第", "だい"))
+            # 块大小为 1 时多字节字符和 \r\n 都会跨块
+            for chunk_size in [1, 2, 3, 7, 1024]:
+                for head_size in [0, 5]:
+                    reader = CountingReader(io.BytesIO(data))
+                    head = reader.read(head_size)
+                    lines = iter_lines(
+                        reader, encoding, head=head, chunk_size=chunk_size
+                    )
+                    self.assertEqual(expected, list(lines))
+                    self.assertEqual(len(data), reader.read_bytes)
+        # 末尾有换行时，与 re.split 相同，最后是空行
+        self.assertEqual(["a", ""], list(iter_lines(io.BytesIO(b"a\r"), "utf-8")))
+        self.assertEqual([""], list(iter_lines(io.BytesIO(b""), "utf-8")))
+        with self.assertRaises(UnicodeDecodeError):
+            list(iter_lines(io.BytesIO(b"a\nb\xff"), "utf-8"))
+
+    def test_term_matcher(self):
+        matcher = TermMatcher([("猫", 1), ("小猫", 2), ("他", 3), ("他们", 4)])
+        self.assertEqual([1, 2], matcher.match("一只小猫和猫"))
+        self.assertEqual([3, 4], matcher.match("他们"))
+        self.assertEqual([], matcher.match(""))
+        # 空模式总是匹配，相同模式分别返回
+        matcher = TermMatcher([("ab", 1), ("", 2), ("ab", 3)])
+        self.assertEqual([1, 2, 3], matcher.match("cab"))
+        self.assertEqual([2], matcher.match(""))
+        # 与逐个使用 in 判断的结果相同
+        rand = random.Random(0)
+        patterns = [
+            "".join(rand.choice("abc") for _ in range(rand.randint(0, 4)))
+            for _ in range(50)
+        ]
+        matcher = TermMatcher((pattern, i) for i, pattern in enumerate(patterns))
+        for _ in range(200):
+            content = "".join(rand.choice("abcd") for _ in range(rand.randint(0, 12)))
+            self.assertEqual(
+                [i for i, pattern in enumerate(patterns) if pattern in content],
+                matcher.match(content),
+            )
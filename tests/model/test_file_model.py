@@ -1,8 +1,11 @@
+import io
 import math
 import os
+from unittest import mock
 
 from flask import current_app
 from mongoengine import DoesNotExist
+from werkzeug.datastructures import FileStorage
 
 from app import oss
 from app.exceptions import (
@@ -24,7 +27,17 @@ from app.constants.file import FileNotExistReason, FileType
 from app.utils.file import get_file_size
 from app.utils.hash import get_file_md5
 from tests import TEST_FILE_PATH, MoeTestCase
-from app.constants.file import FileSafeStatus
+from app.constants.file import (
+    FileSafeStatus,
+    ParseErrorType,
+    ParseStatus,
+    ThumbnailStatus,
+)
+from app.tasks.thumbnail import (
+    create_thumbnail_task,
+    reconcile_thumbnails,
+    reconcile_thumbnails_task,
+)
 
 
 class FileModelTestCase(MoeTestCase):
@@ -302,6 +315,83 @@ class FileModelTestCase(MoeTestCase):
             self.assertEqual(md5sum, file1.md5)
             self.assertEqual(md5sum, get_file_md5(download_file))
 
+    def test_thumbnail_status(self):
+        """缩略图状态记录在文件中，列表不用逐个检查缩略图文件"""
+        prefix = self.app.config["OSS_FILE_PREFIX"]
+        cover_name = self.app.config["OSS_PROCESS_COVER_NAME"]
+        safe_check_name = self.app.config["OSS_PROCESS_SAFE_CHECK_NAME"]
+        with open(os.path.join(TEST_FILE_PATH, "2kb.png"), "rb") as file:
+            image = self.tmp_project.upload("1.png", file)
+        self.assertEqual(ThumbnailStatus.SUCCEEDED, image.thumbnail_status)
+        with mock.patch.object(oss, "is_exist", wraps=oss.is_exist) as is_exist:
+            data = image.to_api()
+            is_exist.assert_not_called()
+            self.assertEqual(oss.sign_url(prefix, image.save_name), data["url"])
+            self.assertEqual(
+                oss.sign_url(prefix, image.save_name, process_name=cover_name),
+                data["cover_url"],
+            )
+            # 之前上传的图片没有记录状态，检查缩略图文件
+            image.update(unset__thumbnail_status=1)
+            image.reload()
+            self.assertIsNone(image.thumbnail_status)
+            data = image.to_api()
+            self.assertEqual(2, is_exist.call_count)
+            self.assertNotEqual("generating", data["cover_url"])
+        # 生成中
+        image.update(thumbnail_status=ThumbnailStatus.GENERATING)
+        image.reload()
+        data = image.to_api()
+        self.assertEqual("generating", data["cover_url"])
+        self.assertEqual("generating", data["safe_check_url"])
+        # 校正：缩略图已存在则标记为已生成，缺失则重新生成
+        reconcile_thumbnails_task(str(self.tmp_project.id))
+        image.reload()
+        self.assertEqual(ThumbnailStatus.SUCCEEDED, image.thumbnail_status)
+        oss.delete(prefix, [cover_name + "-" + image.save_name])
+        reconcile_thumbnails_task(str(self.tmp_project.id))
+        image.reload()
+        self.assertEqual(ThumbnailStatus.SUCCEEDED, image.thumbnail_status)
+        self.assertTrue(oss.is_exist(prefix, image.save_name, process_name=cover_name))
+        # worker 崩溃时停留在生成中，缩略图未生成
+        image.update(thumbnail_status=ThumbnailStatus.GENERATING)
+        oss.delete(prefix, [cover_name + "-" + image.save_name])
+        result = reconcile_thumbnails_task(str(self.tmp_project.id))
+        self.assertIn("重新生成 1 张", result)
+        self.assertIn("恢复停留在生成中的 1 张", result)
+        image.reload()
+        self.assertEqual(ThumbnailStatus.SUCCEEDED, image.thumbnail_status)
+        self.assertTrue(oss.is_exist(prefix, image.save_name, process_name=cover_name))
+        # manage.py 的命令通过 reconcile_thumbnails 执行
+        image.update(thumbnail_status=ThumbnailStatus.GENERATING)
+        reconcile_thumbnails(str(self.tmp_project.id), run_sync=True)
+        image.reload()
+        self.assertEqual(ThumbnailStatus.SUCCEEDED, image.thumbnail_status)
+        # 原图丢失时生成失败，校正时默认不重试
+        oss.delete(
+            prefix,
+            [
+                image.save_name,
+                cover_name + "-" + image.save_name,
+                safe_check_name + "-" + image.save_name,
+            ],
+        )
+        create_thumbnail_task(str(image.id))
+        image.reload()
+        self.assertEqual(ThumbnailStatus.FAILED, image.thumbnail_status)
+        self.assertEqual("generating", image.to_api()["cover_url"])
+        with mock.patch(
+            "app.tasks.thumbnail.create_thumbnail_task", wraps=create_thumbnail_task
+        ) as create_thumbnail:
+            reconcile_thumbnails_task(str(self.tmp_project.id))
+            create_thumbnail.assert_not_called()
+            reconcile_thumbnails_task(str(self.tmp_project.id), retry_failed=True)
+            create_thumbnail.assert_called_once_with(str(image.id))
+        # 删除源文件后清除状态
+        image.reload()
+        image.delete_real_file()
+        self.assertIsNone(image.thumbnail_status)
+
     def test_upload_image_file(self):
         """测试上传图片文件"""
         """
@@ -3046,3 +3136,84 @@ class FileModelTestCase(MoeTestCase):
         file.create_source("2", x=0, y=0, rank=8)  # file 中 rank 最大的 source
         file2.create_source("3", x=0, y=0, rank=3)
         self.assertEqual(9, file.next_source_rank())
+
+    def test_create_sources_bulk(self):
+        """批量创建文本原文"""
+        user = User(name="u1", email="u1@1.com").save()
+        team = Team.create("t1", creator=user)
+        project = Project.create("p1", team=team, creator=user)
+        dir1 = project.create_folder("dir1")
+        file = project.create_file("1.txt", parent=dir1)
+        sources = file.create_sources_bulk(["a", " ", "b"])
+        self.assertEqual([0, 1, 2], [source.rank for source in sources])
+        self.assertEqual([False, True, False], [source.blank for source in sources])
+        # 接在已有原文之后
+        sources += file.create_sources_bulk(["c"])
+        self.assertEqual(3, sources[-1].rank)
+        self.assertEqual(
+            ["a", " ", "b", "c"], [source.content for source in file.sources()]
+        )
+        for item in [file, dir1, project]:
+            item.reload()
+            self.assertEqual(3, item.source_count)
+        # 返回的原文可以继续保存
+        sources[0].find_terms()
+        self.assertEqual(4, file.sources().count())
+        self.assertEqual([], file.create_sources_bulk([]))
+
+    def test_parse_text_copy_old_revision(self):
+        """解析文本时导入旧修订版中相同原文的翻译"""
+        with self.app.test_request_context():
+            user = User(name="u1", email="u1@1.com").save()
+            team = Team.create("t1", creator=user)
+            project = Project.create("p1", team=team, creator=user)
+            target = project.targets().first()
+            file1 = project.upload(
+                "1.txt", FileStorage(io.BytesIO("a\nb\nb".encode("utf-8")))
+            )
+            self.assertEqual(3, file1.sources().count())
+            file1.sources().filter(content="b").first().create_translation(
+                "t", target=target, user=user
+            )
+            file2 = project.upload(
+                "1.txt", FileStorage(io.BytesIO("c\r\nb\r\n".encode("utf-8")))
+            )
+            self.assertEqual(file1.activated_revision, file2)
+            sources = list(file2.sources())
+            self.assertEqual(["c", "b", ""], [source.content for source in sources])
+            self.assertEqual(0, sources[0].translations().count())
+            self.assertEqual("t", sources[1].translations().first().content)
+            file2.reload()
+            self.assertEqual(2, file2.source_count)
+            self.assertEqual(1, file2.cache(target=target).translated_source_count)
+
+    def test_parse_text_stream(self):
+        """流式解析非 UTF-8 文本，记录进度；中途无法解码时清除已生成的原文"""
+        with self.app.test_request_context():
+            user = User(name="u1", email="u1@1.com").save()
+            team = Team.create("t1", creator=user)
+            project = Project.create("p1", team=team, creator=user)
+            # 超过一批的行数，且 GBK 字符出现在用于检测字符集的开头之后
+            lines = ["这是第{}行".format(i) for i in range(2500)] + ["丟"]
+            file = project.upload(
+                "1.txt",
+                FileStorage(io.BytesIO("\r\n".join(lines).encode("gbk"))),
+            )
+            file.reload()
+            self.assertEqual(ParseStatus.PARSE_SUCCEEDED, file.parse_status)
+            self.assertEqual(100, file.parse_percent)
+            self.assertEqual(2501, file.source_count)
+            self.assertEqual(lines, [source.content for source in file.sources()])
+            self.assertEqual(
+                list(range(2501)), [source.rank for source in file.sources()]
+            )
+            # 开头可以解码，后面出现非法字节
+            data = "第一行\n".encode("utf-8") * 20000 + b"\xff\xfe\n"
+            file = project.upload("2.txt", FileStorage(io.BytesIO(data)))
+            file.reload()
+            self.assertEqual(ParseStatus.PARSE_FAILED, file.parse_status)
+            self.assertEqual(ParseErrorType.TEXT_UNKNOWN_CHARSET, file.parse_error_type)
+            self.assertEqual(0, file.sources().count())
+            self.assertEqual(0, file.source_count)
+            project.reload()
+            self.assertEqual(2501, project.source_count)
@@ -55,9 +55,18 @@ class OSSModelTestCase(MoeTestCase):
         oss.upload(self.path, filename2, filename2)
         self.assertTrue(oss.is_exist(self.path, filename1))
         self.assertTrue(oss.is_exist(self.path, filename2))
-        # 下载第一个为对象
-        file1 = oss.download(self.path, filename1)
-        self.assertEqual(filename1.encode("utf-8"), file1.read())
+        # 下载第一个为流
+        with oss.download(self.path, filename1) as file1:
+            self.assertEqual(filename1.encode("utf-8"), file1.read())
+        # 下载一部分
+        with oss.download_range(self.path, filename1, 2, 5) as file1:
+            self.assertEqual(filename1[2:6].encode("utf-8"), file1.read())
+        with oss.download_range(self.path, filename1, 2, 5) as file1:
+            self.assertEqual(filename1[2:4].encode("utf-8"), file1.read(2))
+            self.assertEqual(filename1[4:6].encode("utf-8"), file1.read(10))
+            self.assertEqual(b"", file1.read())
+        with oss.download_range(self.path, filename1, 20) as file1:
+            self.assertEqual(filename1[20:].encode("utf-8"), file1.read())
         # 下载第二个为文件
         file2_path = os.path.join(TMP_PATH, filename2)
         oss.download(self.path, filename2, local_path=file2_path)
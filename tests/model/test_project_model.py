@@ -1,5 +1,7 @@
+from app.tasks.import_from_labelplus import import_from_labelplus
 from app.tasks.output_project import output_project
 from app.models.output import Output
+import io
 import os
 
 from flask import current_app
@@ -13,7 +15,7 @@ from app.exceptions import (
 )
 from app.exceptions.language import TargetAndSourceLanguageSameError
 from app.models.application import Application, ApplicationStatus
-from app.models.file import File, Source, Tip, Translation
+from app.models.file import File, FileTargetCache, Source, Tip, Translation
 from app.models.invitation import Invitation
 from app.models.language import Language
 from app.models.project import (
@@ -26,7 +28,9 @@ from app.models.team import Team, TeamRole
 from app.models.user import User
 from app.constants.file import FileNotExistReason, FileType
 from app.constants.project import ProjectStatus
-from tests import TEST_FILE_PATH, MoeTestCase
+from app.utils.labelplus import load_from_labelplus
+from app.utils.output_formats import OUTPUT_FORMATS
+from tests import TEST_FILE_PATH, MoeTestCase, QueryCounter
 from app.constants.output import OutputTypes
 
 
@@ -610,6 +614,29 @@ class ProjectModelTestCase(MoeTestCase):
             )
             result = project.to_labelplus(target=default_target)
             self.assertEqual(need_result, result)
+            self.assertEqual(
+                need_result[need_result.index(">>>>>>>>[f1/f2/") :],
+                file2.to_labelplus(target=default_target),
+            )
+            # 文件夹名称、文件、每批的原文和最佳翻译各查询一次，与文件数量无关
+            with QueryCounter() as counter:
+                project.to_labelplus(target=default_target)
+            self.assertEqual(4, counter.count)
+            # 多个格式共用一次遍历，只多查询一次备注
+            txt = io.StringIO()
+            with QueryCounter() as counter:
+                project.write_outputs(
+                    [
+                        output_format(stream)
+                        for output_format, stream in zip(
+                            OUTPUT_FORMATS.values(),
+                            [txt, io.StringIO(), io.StringIO()],
+                        )
+                    ],
+                    target=default_target,
+                )
+            self.assertEqual(5, counter.count)
+            self.assertEqual(need_result, txt.getvalue())
 
     def test_apply_auto_become_project_team1(self):
         """
@@ -703,3 +730,117 @@ class ProjectModelTestCase(MoeTestCase):
                 0,
                 user1.invitations(group=project).count(),
             )
+
+    def test_import_labelplus(self):
+        """批量导入 LabelPlus 与逐个创建的结果（包括计数缓存）相同"""
+        labelplus_txt = (
+            ">>>>>>>>[1.jpg]<<<<<<<<\n"
+            "----------------[1]----------------[0.5,0.2,1]\n"
+            "a\n"
+            "----------------[2]----------------[0.1,0.9,2]\n"
+            "\n"
+            ">>>>>>>>[2.jpg]<<<<<<<<\n"
+            ">>>>>>>>[1.jpg]<<<<<<<<\n"  # 同名文件追加到已有文件
+            "----------------[1]----------------[0.3,0.4,1]\n"
+            "b\n"
+            ">>>>>>>>[3.png]<<<<<<<<\n"
+            "----------------[1]----------------[0.3,0.4,1]\n"
+            "c\n"
+            ">>>>>>>>[2.JPG]<<<<<<<<\n"  # 文件名大小写不敏感
+            "----------------[1]----------------[0.3,0.4,1]\n"
+            "d\n"
+        )
+        with self.app.test_request_context():
+            user = User.create(name="1", email="1@1.com", password="123456")
+            team = Team.create("t1")
+            bulk = Project.create("p1", team=team, creator=user)
+            target = bulk.targets().first()
+            bulk.import_labelplus(
+                load_from_labelplus(labelplus_txt),
+                target=target,
+                user=user,
+                batch_size=3,
+            )
+            one_by_one = Project.create("p2", team=team, creator=user)
+            one_by_one_target = one_by_one.targets().first()
+            for labelplus_file in load_from_labelplus(labelplus_txt):
+                one_by_one._create_labelplus_file(
+                    labelplus_file, target=one_by_one_target, user=user
+                )
+
+            def summary(project, target):
+                project.reload()
+                target.reload()
+                files = []
+                for file in project.files():
+                    files.append(
+                        (
+                            file.name,
+                            file.source_count,
+                            file.translated_source_count,
+                            file.cache(target=target).translated_source_count,
+                            [
+                                (
+                                    source.rank,
+                                    source.x,
+                                    source.position_type,
+                                    source.machine,
+                                    [t.content for t in source.translations()],
+                                )
+                                for source in file.sources()
+                            ],
+                        )
+                    )
+                return (
+                    project.file_count,
+                    project.source_count,
+                    project.translated_source_count,
+                    target.translated_source_count,
+                    files,
+                )
+
+            self.assertEqual(
+                summary(one_by_one, one_by_one_target), summary(bulk, target)
+            )
+            self.assertEqual((3, 5, 4, 4), summary(bulk, target)[:4])
+            self.assertEqual(3, FileTargetCache.objects(file__in=bulk.files()).count())
+
+    def test_import_labelplus_existing_file(self):
+        """导入到大小写不同的已有文件时，不创建重复的文件"""
+        labelplus_txt = (
+            ">>>>>>>>[1.JPG]<<<<<<<<\n"
+            "----------------[1]----------------[0.5,0.2,1]\n"
+            "a\n"
+        )
+        with self.app.test_request_context():
+            user = User.create(name="1", email="1@1.com", password="123456")
+            team = Team.create("t1")
+            project = Project.create("p1", team=team, creator=user)
+            target = project.targets().first()
+            file = project.create_file("1.jpg")
+            file.create_source("old")
+            project.import_labelplus(
+                load_from_labelplus(labelplus_txt), target=target, user=user
+            )
+            project.reload()
+            self.assertEqual(1, project.file_count)
+            self.assertEqual(["old", ""], [source.content for source in file.sources()])
+
+    def test_import_labelplus_legacy_txt(self):
+        """列表查询不加载旧版本保存在项目上的导入文本，导入时仍可读取"""
+        with self.app.test_request_context():
+            user = User.create(name="1", email="1@1.com", password="123456")
+            team = Team.create("t1")
+            project = Project.create("p1", team=team, creator=user)
+            project.update(
+                import_from_labelplus_txt=">>>>>>>>[1.jpg]<<<<<<<<\n"
+                "----------------[1]----------------[0.5,0.2,1]\n"
+                "a\n"
+            )
+            self.assertEqual("", team.projects().first().import_from_labelplus_txt)
+            self.assertEqual("", user.projects().first().import_from_labelplus_txt)
+            self.assertNotEqual("", Project.by_id(project.id).import_from_labelplus_txt)
+            import_from_labelplus(str(project.id), run_sync=True)
+            project.reload()
+            self.assertEqual("", project.import_from_labelplus_txt)
+            self.assertEqual(1, project.source_count)
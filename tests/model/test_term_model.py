@@ -1,12 +1,23 @@
 import os
+from unittest import mock
 
+from mongomock.collection import Collection as MockCollection
+
+from app import term_index
+from app.constants.file import FindTermsStatus
 from app.exceptions.language import TargetAndSourceLanguageSameError
 from app.models.language import Language
 from app.models.project import Project
 from app.models.team import Team
 from app.models.term import Term, TermBank
 from app.models.user import User
-from tests import TEST_FILE_PATH, MoeTestCase
+from app.services.cache import Cache, LRUCacheBackend
+from app.services.term_index import TermIndex
+from tests import TEST_FILE_PATH, MoeTestCase, WriteCounter
+
+
+class BulkWriteCounter(WriteCounter):
+    methods = [(MockCollection, "bulk_write")]
 
 
 class TermModelTestCase(MoeTestCase):
@@ -44,6 +55,181 @@ class TermModelTestCase(MoeTestCase):
         self.assertEqual(TermBank.objects.count(), 0)
         self.assertEqual(Term.objects.count(), 0)
 
+    def test_term_bank_version(self):
+        """术语增删改、术语库修改时增加版本"""
+        term_bank = TermBank.create("term", self.team, self.JA, self.CN, user=self.user)
+        self.assertEqual(0, term_bank.version)
+        term = Term.create(term_bank, "原文", "译文", user=self.user)
+        term.edit("原文2", "译文")
+        term_bank.reload()
+        self.assertEqual(2, term_bank.version)
+        term_bank.edit("term", self.JA, self.CN, "")
+        term.clear()
+        term_bank.reload()
+        self.assertEqual(4, term_bank.version)
+        # 使用旧的对象修改术语库时，不会覆盖其他术语修改增加的版本
+        stale_term_bank = TermBank.objects(id=term_bank.id).first()
+        Term.create(term_bank, "原文3", "译文", user=self.user)
+        stale_term_bank.edit("term2", self.JA, self.CN, "")
+        self.assertEqual(6, stale_term_bank.version)
+        term_bank.reload()
+        self.assertEqual(6, term_bank.version)
+
+    def test_term_matcher_cache(self):
+        """术语库匹配器按版本缓存，术语修改后重新编译"""
+        term_bank = TermBank.create("term", self.team, self.JA, self.CN, user=self.user)
+        term_bank2 = TermBank.create("t2", self.team, self.JA, self.CN, user=self.user)
+        term1 = Term.create(term_bank, "Hello", "term1", user=self.user)
+        term2 = Term.create(term_bank2, "你好", "term2", user=self.user)
+        term_index.reset_metrics()
+        matcher = Term.matcher([term_bank, term_bank2])
+        self.assertEqual([term1.id, term2.id], matcher.match("Hello 你好"))
+        self.assertEqual(2, term_index.metrics()["misses"])
+        Term.matcher([term_bank, term_bank2])
+        self.assertEqual(2, term_index.metrics()["memory_hits"])
+        self.assertEqual(2, term_index.metrics()["misses"])
+        # 修改后只有修改的术语库重新编译，旧的术语库对象也能获取到新版本
+        term3 = Term.create(term_bank, "你好", "term3", user=self.user)
+        matcher = Term.matcher([term_bank, term_bank2])
+        self.assertEqual([term1.id, term3.id, term2.id], matcher.match("Hello 你好"))
+        self.assertEqual(3, term_index.metrics()["misses"])
+        self.assertEqual(3, term_index.metrics()["memory_hits"])
+        self.assertGreater(term_index.metrics()["rebuild_seconds"], 0)
+
+    def test_term_index_shared_cache(self):
+        """其他进程已编译的匹配器可从共享缓存获取"""
+        term_bank = TermBank.create("term", self.team, self.JA, self.CN, user=self.user)
+        term = Term.create(term_bank, "Hello", "term1", user=self.user)
+        shared = Cache()
+        shared.backend = LRUCacheBackend()
+        worker1 = TermIndex({}, shared=shared)
+        worker2 = TermIndex({}, shared=shared)
+        worker1.get(term_bank.id, 1, lambda: Term._build_matcher(term_bank.id))
+        matcher = worker2.get(term_bank.id, 1, lambda: self.fail("不应重新编译"))
+        self.assertEqual([term.id], matcher.match("Hello"))
+        self.assertEqual(1, worker1.metrics()["misses"])
+        self.assertEqual(1, worker2.metrics()["shared_hits"])
+        self.assertEqual(0, worker2.metrics()["misses"])
+
+    def test_incremental_match(self):
+        """新增、修改、删除术语时只用此术语增量更新可能术语，不提示项目重新寻找"""
+        term_bank = TermBank.create("term", self.team, self.JA, self.CN, user=self.user)
+        term1 = Term.create(term_bank, "Hello", "term1", user=self.user)
+        self.project.term_banks = [term_bank]
+        self.project.find_terms()
+        # 未使用此术语库的项目不受影响
+        other_project = Project.create("p2", self.team, creator=self.user)
+        with open(os.path.join(TEST_FILE_PATH, "term.txt"), "rb") as f:
+            file = self.project.upload("term.txt", f)
+        with open(os.path.join(TEST_FILE_PATH, "term.txt"), "rb") as f:
+            other_file = other_project.upload("term.txt", f)
+        # 新增术语
+        term2 = Term.create(term_bank, "你好", "term2", user=self.user)
+        self.assertEqual(
+            [[], [term1], [term1, term2]],
+            [source.possible_terms for source in file.sources()],
+        )
+        self.assertEqual(
+            [[], [], []], [source.possible_terms for source in other_file.sources()]
+        )
+        # 修改原文，不再含有的原文移除此术语
+        term2.edit("第一行", "t")
+        self.assertEqual(
+            [[], [term1, term2], [term1]],
+            [source.possible_terms for source in file.sources()],
+        )
+        # 只修改译文，不更新
+        self.assertEqual(0, term2.rematch())
+        # 删除术语
+        term1.clear()
+        self.assertEqual(
+            [[], [term2], []], [source.possible_terms for source in file.sources()]
+        )
+        self.project.reload()
+        self.assertFalse(self.project.need_find_terms)
+
+    def test_incremental_match_scope(self):
+        """增量更新与全量寻找范围相同，不处理图片的标签和未激活的修订版"""
+        term_bank = TermBank.create("term", self.team, self.JA, self.CN, user=self.user)
+        self.project.term_banks = [term_bank]
+        self.project.find_terms()
+        with open(os.path.join(TEST_FILE_PATH, "term.txt"), "rb") as f:
+            old_file = self.project.upload("term.txt", f)
+        # 上传同名文本，创建并激活新修订版
+        with open(os.path.join(TEST_FILE_PATH, "term.txt"), "rb") as f:
+            file = self.project.upload("term.txt", f)
+        old_file.reload()
+        self.assertFalse(old_file.activated)
+        image_source = self.project.create_file("1.jpg").create_source("Hello")
+        term = Term.create(term_bank, "Hello", "term", user=self.user)
+        self.assertEqual(
+            [[], [term], [term]], [source.possible_terms for source in file.sources()]
+        )
+        image_source.reload()
+        self.assertEqual([], image_source.possible_terms)
+        self.assertEqual(
+            [[], [], []], [source.possible_terms for source in old_file.sources()]
+        )
+        # 再次增量更新也不会修改这些原文
+        self.assertEqual(0, term.rematch())
+
+    def test_find_project_terms(self):
+        """整个项目一个任务寻找术语，批量写入并记录进度"""
+        self.app.config["TERM_INCREMENTAL_MATCH"] = False
+        self.addCleanup(self.app.config.__setitem__, "TERM_INCREMENTAL_MATCH", True)
+        term_bank = TermBank.create("term", self.team, self.JA, self.CN, user=self.user)
+        term1 = Term.create(term_bank, "Hello", "term1", user=self.user)
+        files = []
+        for name in ["1.txt", "2.txt", "3.txt"]:
+            with open(os.path.join(TEST_FILE_PATH, "term.txt"), "rb") as f:
+                files.append(self.project.upload(name, f))
+        self.project.create_folder("dir")
+        # 与之前逐个文件的任务相同，不处理图片的标签
+        image_source = self.project.create_file("1.jpg").create_source("Hello")
+        self.project.term_banks = [term_bank]
+        with BulkWriteCounter() as counter:
+            self.project.find_terms()
+        # 所有文件有变化的原文在一次 bulk_write 中写入
+        self.assertEqual(1, counter.count)
+        image_source.reload()
+        self.assertEqual([], image_source.possible_terms)
+        self.project.reload()
+        self.assertEqual(FindTermsStatus.FINISHED, self.project.find_terms_status)
+        self.assertEqual(100, self.project.find_terms_percent)
+        self.assertEqual(100, self.project.to_api()["find_terms_percent"])
+        for file in files:
+            file.reload()
+            self.assertEqual(FindTermsStatus.FINISHED, file.find_terms_status)
+            self.assertIsNone(file.find_terms_start_time)
+            self.assertEqual(
+                [[], [term1], [term1]],
+                [source.possible_terms for source in file.sources()],
+            )
+        # 没有变化时不写入原文
+        with BulkWriteCounter() as counter:
+            self.project.find_terms()
+        self.assertEqual(0, counter.count)
+
+    def test_find_project_terms_failed(self):
+        """寻找术语出错时恢复状态，并提示项目重新寻找"""
+        term_bank = TermBank.create("term", self.team, self.JA, self.CN, user=self.user)
+        with open(os.path.join(TEST_FILE_PATH, "term.txt"), "rb") as f:
+            file = self.project.upload("1.txt", f)
+        self.project.term_banks = [term_bank]
+        with mock.patch.object(Term, "matcher", side_effect=RuntimeError("error")):
+            self.project.find_terms()
+        self.project.reload()
+        self.assertEqual(FindTermsStatus.QUEUING, self.project.find_terms_status)
+        self.assertTrue(self.project.need_find_terms)
+        file.reload()
+        self.assertEqual(FindTermsStatus.QUEUING, file.find_terms_status)
+        self.assertIsNone(file.find_terms_start_time)
+        # 可以再次寻找
+        self.project.find_terms()
+        self.project.reload()
+        self.assertEqual(FindTermsStatus.FINISHED, self.project.find_terms_status)
+        self.assertFalse(self.project.need_find_terms)
+
     def test_set_project_term_bank(self):
         """测试设置项目使用的术语库"""
         term_bank = TermBank.create("term", self.team, self.JA, self.CN, user=self.user)
@@ -182,8 +368,10 @@ class TermModelTestCase(MoeTestCase):
 
     def test_need_find_terms(self):
         """
-        测试更新创建术语库时，提示需要刷新相关项目
+        测试更新创建术语库时，提示需要刷新相关项目（关闭增量更新时）
         """
+        self.app.config["TERM_INCREMENTAL_MATCH"] = False
+        self.addCleanup(self.app.config.__setitem__, "TERM_INCREMENTAL_MATCH", True)
         team = Team.create("t")
         project1 = Project.create("p1", team=team)
         project2 = Project.create("p2", team=team)
@@ -0,0 +1,89 @@
+from app import cache
+from app.constants.cache import CountStrategy
+from app.core.responses import MoePagination
+from app.models.project import Project
+from app.models.team import Team
+from app.services.cache import LRUCacheBackend
+from tests import MoeAPITestCase, QueryCounter
+
+
+class CountStrategyTestCase(MoeAPITestCase):
+    """测试分页列表总数的获取策略"""
+
+    def setUp(self):
+        super().setUp()
+        self.old_backend = cache.backend
+        cache.backend = LRUCacheBackend()
+
+    def tearDown(self):
+        cache.backend = self.old_backend
+        super().tearDown()
+
+    def test_count_objects(self):
+        user = self.create_user("u1")
+        team = Team.create("t1", creator=user)
+        project = Project.create("p1", team=team, creator=user)
+        for i in range(3):
+            project.create_file(f"{i}.txt")
+        with self.app.test_request_context("/?page=1&limit=1"):
+            p = MoePagination()
+            files = project.files(skip=p.skip, limit=p.limit)
+            # 精确计数忽略分页
+            self.assertEqual(3, p.count_objects(files))
+            # 计数缓存字段
+            self.assertEqual(
+                10, p.count_objects(files, CountStrategy.DENORMALIZED, value=10)
+            )
+            # 缓存计数
+            self.assertEqual(3, p.count_objects(files, CountStrategy.CACHED))
+            project.create_file("3.txt")
+            with QueryCounter() as counter:
+                self.assertEqual(3, p.count_objects(files, CountStrategy.CACHED))
+            self.assertEqual(0, counter.count)
+            # 不同的查询条件分别缓存
+            self.assertEqual(
+                1,
+                p.count_objects(
+                    project.files(word="3", limit=1), CountStrategy.CACHED
+                ),
+            )
+            # 版本变化时重新计数
+            self.assertEqual(
+                4, p.count_objects(files, CountStrategy.CACHED, version=1)
+            )
+        # 游标分页默认不计数
+        with self.app.test_request_context("/?cursor="):
+            p = MoePagination(cursor_keys=["id"])
+            self.assertIsNone(p.count_objects(project.files()))
+
+    def test_file_list_count(self):
+        """文件列表的缓存计数随项目文件数失效"""
+        user = self.create_user("u1")
+        token = user.generate_token()
+        team = Team.create("t1", creator=user)
+        project = Project.create("p1", team=team, creator=user)
+        project.create_file("1.txt")
+        url = "/v1/projects/{}/files".format(project.id)
+        with self.app.test_request_context():
+            data = self.get(url, token=token)
+            self.assertEqual("1", data.headers.get("X-Pagination-Count"))
+            project.create_file("2.txt")
+            data = self.get(url, token=token)
+            self.assertEqual("2", data.headers.get("X-Pagination-Count"))
+
+    def test_member_list_count(self):
+        """成员列表无搜索时使用计数缓存字段"""
+        user = self.create_user("u1")
+        token = user.generate_token()
+        team = Team.create("t1", creator=user)
+        self.create_user("u2").join(team)
+        with self.app.test_request_context():
+            data = self.get(f"/v1/teams/{team.id}/users", token=token)
+            self.assertErrorEqual(data)
+            self.assertEqual("2", data.headers.get("X-Pagination-Count"))
+            data = self.get(
+                f"/v1/teams/{team.id}/users",
+                query_string={"word": "u2"},
+                token=token,
+            )
+            self.assertEqual("1", data.headers.get("X-Pagination-Count"))
@@ -0,0 +1,80 @@
+import datetime
+
+from app.core.counter_buffer import counter_buffer
+from app.models.file import File, FileTargetCache
+from app.models.project import Project
+from app.models.target import Target
+from app.models.team import Team
+from tests import MoeTestCase, WriteCounter
+
+
+class CounterBufferTestCase(MoeTestCase):
+    """测试计数缓存写缓冲"""
+
+    def create_data(self):
+        user = self.create_user("u1")
+        team = Team.create("t1", creator=user)
+        project = Project.create("p1", team=team, creator=user)
+        target = project.targets().first()
+        dir1 = project.create_folder("dir1")
+        dir2 = project.create_folder("dir2", parent=dir1)
+        file = project.create_file("1.jpg", parent=dir2)
+        return user, project, target, [dir1, dir2, file]
+
+    def assert_counts(self, project, target, files, source_count, translated):
+        for file in files:
+            file.reload()
+            self.assertEqual(source_count, file.source_count)
+            self.assertEqual(translated, file.translated_source_count)
+            self.assertEqual(
+                translated,
+                FileTargetCache.objects(file=file, target=target)
+                .first()
+                .translated_source_count,
+            )
+        project.reload()
+        self.assertEqual(source_count, project.source_count)
+        self.assertEqual(translated, project.translated_source_count)
+        self.assertEqual(translated, Target.by_id(target.id).translated_source_count)
+
+    def test_counter_buffer(self):
+        user, project, target, files = self.create_data()
+        file = files[-1]
+        with WriteCounter() as counter:
+            with counter_buffer():
+                for i in range(5):
+                    source = file.create_source(str(i))
+                    source.create_translation(str(i), target=target, user=user)
+                # 缓冲期间不写入计数
+                file.reload()
+                self.assertEqual(0, file.source_count)
+        self.assert_counts(project, target, files, 5, 5)
+        # 与不使用缓冲时相同
+        with WriteCounter() as unbuffered_counter:
+            for i in range(5):
+                source = file.create_source(str(i))
+                source.create_translation(str(i), target=target, user=user)
+        self.assert_counts(project, target, files, 10, 10)
+        self.assertLess(counter.count, unbuffered_counter.count)
+
+    def test_counter_buffer_flush_on_error(self):
+        user, project, target, files = self.create_data()
+        with self.assertRaises(RuntimeError):
+            with counter_buffer():
+                files[-1].create_source("1")
+                raise RuntimeError
+        self.assert_counts(project, target, files, 1, 0)
+
+    def test_edit_time_never_goes_back(self):
+        user, project, target, files = self.create_data()
+        file = files[-1]
+        later = datetime.datetime.utcnow().replace(microsecond=0)
+        later += datetime.timedelta(days=1)
+        earlier = later - datetime.timedelta(days=2)
+        with counter_buffer():
+            file.update_cache("edit_time", later)
+            file.update_cache("edit_time", earlier)
+        file.update_cache("edit_time", earlier)
+        for item in files:
+            self.assertEqual(later, File.objects(id=item.id).first().edit_time)
+        self.assertEqual(later, Project.objects(id=project.id).first().edit_time)
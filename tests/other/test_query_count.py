@@ -0,0 +1,201 @@
+from unittest import mock
+
+from app.models.file import Source, Tip, Translation
+from app.models.language import Language
+from app.models.project import Project
+from app.models.team import Team
+from tests import MoeAPITestCase, QueryCounter, mock_lookup_pipeline
+
+
+class TranslatorDataMixin:
+    def create_translator_data(self, source_count):
+        user = self.create_user("u1")
+        others = [self.create_user(f"u{i}") for i in range(2, 5)]
+        team = Team.create("t1", creator=user)
+        project = Project.create(
+            "p1",
+            team=team,
+            creator=user,
+            target_languages=[Language.by_code("zh-CN"), Language.by_code("en")],
+        )
+        target, other_target = project.targets()
+        file = project.create_file("1.jpg")
+        for i in range(source_count):
+            source = file.create_source(str(i))
+            source.create_translation(f"mine-{i}", target, user=user)
+            for other in others:
+                translation = source.create_translation(
+                    f"{other.name}-{i}", target, user=other
+                )
+            translation.select(user)
+            translation.update(proofread_content="p", proofreader=user)
+            source.create_translation(f"en-{i}", other_target, user=user)
+            source.create_tip(f"tip-{i}", target, user=others[0])
+        file.reload()
+        return file, target, user
+
+
+class QueryCountTestCase(TranslatorDataMixin, MoeAPITestCase):
+    """测试查询次数不随数据量增长"""
+
+    def test_batch_to_api_same_as_to_api(self):
+        """批量序列化与逐个序列化结果相同"""
+        file, target, user = self.create_translator_data(3)
+        translations = Translation.objects(target=target).order_by("id")
+        self.assertEqual(
+            [t.to_api() for t in translations],
+            Translation.batch_to_api(translations),
+        )
+        tips = Tip.objects(target=target).order_by("id")
+        self.assertEqual([t.to_api() for t in tips], Tip.batch_to_api(tips))
+
+    def test_to_translator_query_count(self):
+        """to_translator 的查询次数与每页原文数量无关"""
+        file, target, user = self.create_translator_data(12)
+        counts = []
+        for limit in (2, 12):
+            with self.app.test_request_context(f"/?page=1&limit={limit}"):
+                with QueryCounter() as counter:
+                    data = file.to_translator(target=target, user=user).data
+            self.assertEqual(limit, len(data))
+            counts.append(counter.count)
+        self.assertEqual(counts[0], counts[1])
+        # 原文、自己的翻译、他人翻译、其他语言、备注、计数，以及用户/目标/语言
+        self.assertLessEqual(counts[1], 15)
+        # 数据正确
+        source_data = data[0]
+        self.assertEqual("mine-0", source_data["my_translation"]["content"])
+        self.assertEqual(3, len(source_data["translations"]))
+        self.assertTrue(source_data["translations"][0]["selected"])
+        self.assertTrue(source_data["has_other_language_translation"])
+        self.assertEqual("tip-0", source_data["tips"][0]["content"])
+
+    def test_sources_with_translations(self):
+        """只返回有其他语言翻译的原文 id"""
+        file, target, user = self.create_translator_data(3)
+        other_target = file.project.targets().filter(id__ne=target.id).first()
+        sources = list(file.sources())
+        # 删除第一个原文的其他语言翻译
+        Translation.objects(source=sources[0], target=other_target).first().clear()
+        with QueryCounter() as counter:
+            source_ids = Translation.sources_with_translations(
+                sources, exclude_target=target
+            )
+        self.assertEqual(1, counter.count)
+        self.assertEqual({sources[1].id, sources[2].id}, source_ids)
+        # 不排除目标语言时，所有原文都有翻译
+        self.assertEqual(
+            {source.id for source in sources},
+            Translation.sources_with_translations(sources),
+        )
+        self.assertEqual(set(), Translation.sources_with_translations([]))
+
+
+class PipelineModeTestCase(TranslatorDataMixin, MoeAPITestCase):
+    """测试聚合管道模式（mongomock 需要补充带 let/pipeline 的 $lookup）"""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock_lookup_pipeline()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(
+            self.app.config.update,
+            TRANSLATOR_QUERY_MODE=self.app.config.get("TRANSLATOR_QUERY_MODE"),
+        )
+
+    def to_translator_both(self, file, **kwargs):
+        """分别使用多次查询模式和聚合管道模式获取数据"""
+        self.app.config["TRANSLATOR_QUERY_MODE"] = "query"
+        query_result = file.to_translator(**kwargs)
+        self.app.config["TRANSLATOR_QUERY_MODE"] = "pipeline"
+        pipeline_result = file.to_translator(**kwargs)
+        return query_result, pipeline_result
+
+    def test_pipeline_same_as_query(self):
+        """相同数据下两种模式的结果相同，包括没有翻译、只有其他语言翻译、只有备注的原文"""
+        file, target, user = self.create_translator_data(2)
+        other_target = file.project.targets().filter(id__ne=target.id).first()
+        file.create_source("empty")
+        file.create_source("other").create_translation("en", other_target, user=user)
+        file.create_source("tip").create_tip("tip", target, user=user)
+        file.create_source("rank", rank=0)
+        new_user = self.create_user("u5")
+        for t in (target, other_target):
+            for u in (user, new_user):
+                with self.subTest(target=t.language.code, user=u.name):
+                    query_data, pipeline_data = self.to_translator_both(
+                        file, target=t, paging=False, user=u
+                    )
+                    self.assertEqual(6, len(pipeline_data))
+                    self.assertEqual(query_data, pipeline_data)
+                    with self.app.test_request_context("/?page=1&limit=4"):
+                        query_p, pipeline_p = self.to_translator_both(
+                            file, target=t, user=u
+                        )
+                    self.assertEqual(query_p.data, pipeline_p.data)
+                    self.assertEqual(query_p.headers, pipeline_p.headers)
+
+    def test_to_translator_pipeline_mode(self):
+        """聚合管道模式与多次查询模式返回相同数据"""
+        file, target, user = self.create_translator_data(5)
+        file.create_source("")
+        for url in ("/?page=1&limit=3", "/?page=2&limit=3"):
+            with self.app.test_request_context(url):
+                self.app.config["TRANSLATOR_QUERY_MODE"] = "query"
+                query_p = file.to_translator(target=target, user=user)
+                self.app.config["TRANSLATOR_QUERY_MODE"] = "pipeline"
+                with QueryCounter() as counter:
+                    pipeline_p = file.to_translator(target=target, user=user)
+            self.assertEqual(query_p.data, pipeline_p.data)
+            self.assertEqual(query_p.headers, pipeline_p.headers)
+        # 游标分页
+        cursor = ""
+        for _ in range(2):
+            with self.app.test_request_context(f"/?cursor={cursor}&limit=3"):
+                self.app.config["TRANSLATOR_QUERY_MODE"] = "query"
+                query_p = file.to_translator(target=target, user=user)
+                self.app.config["TRANSLATOR_QUERY_MODE"] = "pipeline"
+                pipeline_p = file.to_translator(target=target, user=user)
+            self.assertEqual(query_p.data, pipeline_p.data)
+            self.assertEqual(query_p.headers, pipeline_p.headers)
+            cursor = pipeline_p.next_cursor
+        self.assertIsNone(cursor)
+        # 不分页
+        self.app.config["TRANSLATOR_QUERY_MODE"] = "query"
+        query_data = file.to_translator(target=target, paging=False, user=user)
+        self.app.config["TRANSLATOR_QUERY_MODE"] = "pipeline"
+        pipeline_data = file.to_translator(target=target, paging=False, user=user)
+        self.assertEqual(query_data, pipeline_data)
+        self.assertEqual(6, len(pipeline_data))
+        # 只连接当前目标语言的翻译，且只取出需要的字段
+        with mock.patch.object(
+            Source._get_collection(),
+            "aggregate",
+            wraps=Source._get_collection().aggregate,
+        ) as aggregate:
+            file.to_translator(target=target, paging=False, user=user)
+        (lookup,) = [
+            stage["$lookup"]
+            for stage in aggregate.call_args.args[0]
+            if stage.get("$lookup", {}).get("as") == "translations"
+        ]
+        self.assertIn(
+            {"$eq": ["$" + Translation.target.db_field, target.id]},
+            lookup["pipeline"][0]["$match"]["$expr"]["$and"],
+        )
+        self.assertEqual(
+            {
+                field.db_field
+                for name, field in Translation._fields.items()
+                if name != "id"
+            },
+            set(lookup["pipeline"][1]["$project"]),
+        )
+        # 不使用 $facet 将整页合并为一个文档（不分页时可能超过 16MB）
+        self.assertNotIn(
+            "$facet", [key for stage in aggregate.call_args.args[0] for key in stage]
+        )
+        # 聚合管道、其他语言翻译的分组、原文总数，
+        # 加上目标语言与语言的查询（mongomock 无法连接用户时补查一次）
+        self.assertLessEqual(counter.count, 6)
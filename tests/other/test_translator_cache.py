@@ -0,0 +1,129 @@
+from app import cache
+from app.models.file import Source, Translation
+from app.models.project import Project
+from app.models.team import Team
+from app.services.cache import LRUCacheBackend
+from tests import MoeAPITestCase, QueryCounter
+
+
+class TranslatorCacheTestCase(MoeAPITestCase):
+    """测试翻译器缓存在修改后失效"""
+
+    def setUp(self):
+        super().setUp()
+        self.old_backend = cache.backend
+        cache.backend = LRUCacheBackend()
+
+    def tearDown(self):
+        cache.backend = self.old_backend
+        super().tearDown()
+
+    def get_sources(self, file, target, token):
+        data = self.get(
+            f"/v1/files/{file.id}/sources",
+            query_string={"target_id": str(target.id), "page": 1, "limit": 10},
+            token=token,
+        )
+        self.assertErrorEqual(data)
+        return data
+
+    def test_translator_cache(self):
+        user = self.create_user("u1")
+        token = user.generate_token()
+        team = Team.create("t1", creator=user)
+        project = Project.create("p1", team=team, creator=user)
+        target = project.targets().first()
+        file = project.create_file("1.jpg")
+        source1 = file.create_source("1")
+        source2 = file.create_source("2")
+        self.assertEqual(2, len(self.get_sources(file, target, token).json))
+        # 命中缓存时不再查询翻译
+        with QueryCounter() as counter:
+            data = self.get_sources(file, target, token)
+        self.assertEqual(2, len(data.json))
+        self.assertEqual(2, int(data.headers["X-Pagination-Count"]))
+        with QueryCounter() as uncached_counter:
+            cache.backend = LRUCacheBackend()
+            self.get_sources(file, target, token)
+        self.assertLess(counter.count, uncached_counter.count)
+        # 新增原文
+        data = self.post(f"/v1/files/{file.id}/sources", json={}, token=token)
+        self.assertErrorEqual(data)
+        data = self.get_sources(file, target, token)
+        self.assertEqual(3, len(data.json))
+        self.assertEqual(3, int(data.headers["X-Pagination-Count"]))
+        # 新增翻译
+        translation = source1.create_translation("t", target, user=user)
+        data = self.get_sources(file, target, token)
+        self.assertEqual("t", data.json[0]["my_translation"]["content"])
+        # 修改翻译
+        data = self.put(
+            f"/v1/translations/{translation.id}", json={"content": "t2"}, token=token
+        )
+        self.assertErrorEqual(data)
+        data = self.get_sources(file, target, token)
+        self.assertEqual("t2", data.json[0]["my_translation"]["content"])
+        # 选定/取消选定
+        translation.select(user)
+        data = self.get_sources(file, target, token)
+        self.assertTrue(data.json[0]["my_translation"]["selected"])
+        translation.unselect()
+        data = self.get_sources(file, target, token)
+        self.assertFalse(data.json[0]["my_translation"]["selected"])
+        # 备注
+        source1.create_tip("tip", target, user=user)
+        data = self.get_sources(file, target, token)
+        self.assertEqual("tip", data.json[0]["tips"][0]["content"])
+        # 删除翻译
+        Translation.objects(id=translation.id).first().clear()
+        data = self.get_sources(file, target, token)
+        self.assertNotIn("my_translation", data.json[0])
+        # 移动原文
+        source1.move_ahead(None)
+        data = self.get_sources(file, target, token)
+        self.assertEqual(str(source2.id), data.json[0]["id"])
+        # 删除原文
+        Source.objects(id=source1.id).first().clear()
+        data = self.get_sources(file, target, token)
+        self.assertEqual(2, len(data.json))
+        self.assertNotIn(str(source1.id), [s["id"] for s in data.json])
+
+    def test_translator_cache_machine_source(self):
+        """OCR 直接调用 create_source 新增原文后缓存失效"""
+        user = self.create_user("u1")
+        token = user.generate_token()
+        team = Team.create("t1", creator=user)
+        project = Project.create("p1", team=team, creator=user)
+        target = project.targets().first()
+        file = project.create_file("1.jpg")
+        file.create_source("1")
+        self.assertEqual(1, len(self.get_sources(file, target, token).json))
+        # 与 OCR 任务相同的调用方式
+        file.create_source("2", x=0.5, y=0.5, machine=True, rank=1)
+        data = self.get_sources(file, target, token)
+        self.assertEqual(2, len(data.json))
+        self.assertEqual(2, int(data.headers["X-Pagination-Count"]))
+
+    def test_translator_cache_user_edit(self):
+        """缓存中只保存用户 id，用户修改资料后返回新的资料"""
+        user = self.create_user("u1")
+        token = user.generate_token()
+        user2 = self.create_user("u2")
+        team = Team.create("t1", creator=user)
+        project = Project.create("p1", team=team, creator=user)
+        target = project.targets().first()
+        file = project.create_file("1.jpg")
+        source = file.create_source("1")
+        source.create_translation("t", target, user=user)
+        source.create_translation("t2", target, user=user2)
+        source.create_tip("tip", target, user=user2)
+        data = self.get_sources(file, target, token)
+        self.assertEqual("u1", data.json[0]["my_translation"]["user"]["name"])
+        self.assertEqual("u2", data.json[0]["translations"][0]["user"]["name"])
+        # 修改资料不改变翻译器版本，读取缓存时重新取出用户
+        user.update(name="u1-new")
+        user2.update(name="u2-new")
+        data = self.get_sources(file, target, token)
+        self.assertEqual("u1-new", data.json[0]["my_translation"]["user"]["name"])
+        self.assertEqual("u2-new", data.json[0]["translations"][0]["user"]["name"])
+        self.assertEqual("u2-new", data.json[0]["tips"][0]["user"]["name"])